@@ -5,10 +5,11 @@ from typing import Any
 import numpy as np
 import requests
 
-from agent_studio.agent.runtime import PythonRuntime, RemotePythonRuntime
+from agent_studio.agent.runtime import PythonRuntime, RemotePythonRuntime, get_runtime
 from agent_studio.config import Config
 from agent_studio.llm.base_model import BaseModel
 from agent_studio.llm.utils import extract_from_response
+from agent_studio.utils.communication import session_headers
 
 config = Config()
 logger = logging.getLogger(__name__)
@@ -24,6 +25,12 @@ class BaseAgent:
         self.instruction: str = ""
         self.trajectory: list[dict[str, Any]] = []
         self.runtime: PythonRuntime | RemotePythonRuntime | None = None
+        # env server the actions are executed on in remote mode
+        self.remote_server_addr: str = (
+            f"http://{config.env_server_addr}:{config.env_server_port}"
+        )
+        # session on the env server, None for the default session
+        self.remote_session_id: str | None = None
 
         self.cur_prompt: list[dict[str, Any]] | None = None
         self.cur_response: str | None = None
@@ -45,10 +52,18 @@ class BaseAgent:
 
         if self.runtime is not None:
             self.runtime.close()
+        init_code = self.get_init_code()
         if config.remote:
-            self.runtime = RemotePythonRuntime()
+            self.runtime = RemotePythonRuntime(
+                self.remote_server_addr, self.remote_session_id
+            )
+            self.runtime.reset(init_code)
         else:
-            self.runtime = PythonRuntime()
+            self.runtime = get_runtime(init_code)
+
+    def get_init_code(self) -> str | None:
+        """Returns the code that the runtime executes before the first action."""
+        return None
 
     def get_token_count(self) -> int:
         return self.total_tokens
@@ -82,8 +97,9 @@ class BaseAgent:
             logger.debug(f"Code to execute:\n{code}\n")
             if config.remote:
                 response = requests.post(
-                    f"http://{config.env_server_addr}:{config.env_server_port}/execute",
+                    f"{self.remote_server_addr}/execute",
                     json={"message": code},
+                    headers=session_headers(self.remote_session_id),
                 )
                 result = response.json()
             else:
@@ -19,10 +19,10 @@ class DirectAgent(BaseAgent):
         super().reset(instruction=instruction)
         with open(config.system_prompt_path, "r") as f:
             self.system_prompt = f.read()
+
+    def get_init_code(self) -> str | None:
         with open(config.init_code_path, "r") as f:
-            init_code = f.read()
-            assert self.runtime is not None
-            self.runtime(init_code)
+            return f.read()
 
     def trajectory2intermediate_msg(self) -> list[dict[str, Any]]:
         """Converts the trajectory to intermediate messages.
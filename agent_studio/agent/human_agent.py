@@ -9,6 +9,7 @@ from agent_studio.agent.base_agent import BaseAgent
 from agent_studio.agent.runtime import PythonRuntime, RemotePythonRuntime
 from agent_studio.config import Config
 from agent_studio.llm.base_model import BaseModel
+from agent_studio.utils.communication import session_headers
 
 config = Config()
 logger = logging.getLogger(__name__)
@@ -23,6 +24,10 @@ class HumanAgent(BaseAgent):
         self.instruction: str = ""
         self.trajectory: list[dict[str, Any]] = []
         self.runtime: PythonRuntime | RemotePythonRuntime | None = None
+        self.remote_server_addr: str = (
+            f"http://{config.env_server_addr}:{config.env_server_port}"
+        )
+        self.remote_session_id: str | None = None
 
         self.cur_prompt: list[dict[str, Any]] | None = None
         self.cur_response: str | None = None
@@ -30,12 +35,9 @@ class HumanAgent(BaseAgent):
         self.cur_raw_code: str = ""
         self.model = BaseModel()  # Dummy model
 
-    def reset(self, instruction: str) -> None:
-        super().reset(instruction=instruction)
+    def get_init_code(self) -> str | None:
         with open(config.init_code_path, "r") as f:
-            init_code = f.read()
-            assert self.runtime is not None
-            self.runtime(init_code)
+            return f.read()
 
     def step_action(self, confirmed: bool, **kwargs) -> tuple[dict, bool]:
         """Executes the code and record the result.
@@ -61,8 +63,9 @@ class HumanAgent(BaseAgent):
         logger.debug(f"Code to execute:\n{code}\n")
         if config.remote:
             response = requests.post(
-                f"http://{config.env_server_addr}:{config.env_server_port}/execute",
+                f"{self.remote_server_addr}/execute",
                 json={"message": code},
+                headers=session_headers(self.remote_session_id),
             )
             result = response.json()
         else:
@@ -1,12 +1,27 @@
+import atexit
+import logging
 import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from queue import Empty
 
 import requests
 from jupyter_client.manager import KernelManager
 
 from agent_studio.config.config import Config
+from agent_studio.utils.communication import (
+    AgentStudioRuntimeResetRequest,
+    AgentStudioStatusResponse,
+    session_headers,
+)
 
 config = Config()
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for interrupted code to stop before restarting the kernel
+INTERRUPT_TIMEOUT = 5.0
 
 # Supresses a weird debugging error
 os.environ["PYDEVD_DISABLE_FILE_VALIDATION"] = "1"
@@ -15,20 +30,37 @@ os.environ["ANSI_COLORS_DISABLED"] = "1"
 
 
 class PythonRuntime:
-    def __init__(self):
+    def __init__(self, init_code: str | None = None):
         self.km = KernelManager(kernel_name="python3")
         self.km.start_kernel()
         self.kc = self.km.client()
         self.kc.start_channels()
         self.kc.wait_for_ready()
+        # code executed when the kernel started
+        self.init_code = init_code
+        if init_code is not None:
+            result = self(init_code)
+            if "error" in result:
+                logger.warning(f"Failed to execute init code: {result['error']}")
 
-    def __call__(self, code: str) -> dict:
-        self.kc.execute(code)
+    def __call__(self, code: str, timeout: float | None = None) -> dict:
+        """
+        Executes *code* and returns its output and error. The code is
+        interrupted if it runs for more than *timeout* seconds,
+        config.python_timeout by default.
+        """
+        if timeout is None:
+            timeout = config.python_timeout
+        msg_id = self.kc.execute(code)
+        deadline = time.monotonic() + timeout
         result: dict = {}
         # Continuously read messages from the IOPub channel
         try:
             while True:
-                msg = self.kc.get_iopub_msg(timeout=config.python_timeout)
+                msg = self.kc.get_iopub_msg(timeout=max(deadline - time.monotonic(), 0))
+                if msg["parent_header"].get("msg_id") != msg_id:
+                    # left over from code that was interrupted before
+                    continue
                 content = msg["content"]
                 if (
                     msg["header"]["msg_type"] == "status"
@@ -46,11 +78,34 @@ class PythonRuntime:
                     result["error"] = errmsg
                 elif msg["msg_type"] in ["display_data", "execute_result"]:
                     result["output"] = content["data"]
-        except Empty as e:
-            result["error"] = f"Jupyter timeout: {e}"
+        except Empty:
+            result["error"] = f"Jupyter timeout: no result after {timeout} seconds"
+            self.interrupt()
+            if not self._wait_idle(msg_id, INTERRUPT_TIMEOUT):
+                logger.warning("Interrupted code did not stop, restarting the kernel")
+                self.km.restart_kernel(now=True)
+                self.kc.wait_for_ready()
 
         return result
 
+    def interrupt(self) -> None:
+        """Interrupts the code running on the kernel, if any."""
+        self.km.interrupt_kernel()
+
+    def _wait_idle(self, msg_id: str, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                msg = self.kc.get_iopub_msg(timeout=max(deadline - time.monotonic(), 0))
+                if (
+                    msg["parent_header"].get("msg_id") == msg_id
+                    and msg["header"]["msg_type"] == "status"
+                    and msg["content"]["execution_state"] == "idle"
+                ):
+                    return True
+        except Empty:
+            return False
+
     def close(self) -> None:
         self.kc.stop_channels()
         self.km.shutdown_kernel()
@@ -58,13 +113,96 @@ class PythonRuntime:
         del self.kc
 
 
+class KernelPool:
+    """
+    Keeps *size* Python runtimes starting or started in the background, each
+    with *init_code* executed, so that get() does not wait for a kernel to boot.
+    """
+
+    def __init__(self, size: int, init_code: str | None = None) -> None:
+        self.init_code = init_code
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(size, 1), thread_name_prefix="Kernel Pool"
+        )
+        self.runtimes: queue.Queue[Future[PythonRuntime]] = queue.Queue()
+        for _ in range(size):
+            self._refill()
+
+    def _refill(self) -> None:
+        self.runtimes.put(self.executor.submit(PythonRuntime, self.init_code))
+
+    def get(self) -> PythonRuntime:
+        """Returns the oldest runtime, and starts another one to replace it."""
+        try:
+            runtime = self.runtimes.get_nowait()
+        except Empty:
+            return PythonRuntime(self.init_code)
+        self._refill()
+        return runtime.result()
+
+    def close(self) -> None:
+        self.executor.shutdown(cancel_futures=True)
+        while not self.runtimes.empty():
+            runtime = self.runtimes.get_nowait()
+            if not runtime.cancelled() and runtime.exception() is None:
+                runtime.result().close()
+
+
+kernel_pools: dict[str | None, KernelPool] = {}
+kernel_pools_lock = threading.Lock()
+
+
+def get_runtime(init_code: str | None = None) -> PythonRuntime:
+    """
+    Returns a new Python runtime with *init_code* executed. It is taken from a
+    pool of config.kernel_pool_size runtimes with the same init code, which is
+    created on the first call, unless the size is 0.
+    """
+    if config.kernel_pool_size == 0:
+        return PythonRuntime(init_code)
+    with kernel_pools_lock:
+        if init_code not in kernel_pools:
+            kernel_pools[init_code] = KernelPool(config.kernel_pool_size, init_code)
+        pool = kernel_pools[init_code]
+    return pool.get()
+
+
+@atexit.register
+def close_kernel_pools() -> None:
+    """Shuts down the kernels of every pool."""
+    with kernel_pools_lock:
+        pools = list(kernel_pools.values())
+        kernel_pools.clear()
+    for pool in pools:
+        pool.close()
+
+
 class RemotePythonRuntime:
+    def __init__(self, server_addr: str | None = None, session_id: str | None = None):
+        self.server_addr = (
+            server_addr or f"http://{config.env_server_addr}:{config.env_server_port}"
+        )
+        self.session_id = session_id
+
     def __call__(self, code: str) -> dict:
         response = requests.post(
-            f"http://{config.env_server_addr}:{config.env_server_port}/execute",
+            f"{self.server_addr}/execute",
             json={"message": code},
+            headers=session_headers(self.session_id),
         )
         return response.json()
 
+    def reset(self, init_code: str | None = None) -> None:
+        """Replaces the runtime on the server with one with *init_code* executed."""
+        response_raw = requests.post(
+            f"{self.server_addr}/runtime/reset",
+            json=AgentStudioRuntimeResetRequest(init_code=init_code).model_dump(),
+            headers=session_headers(self.session_id),
+        )
+        response = AgentStudioStatusResponse(**response_raw.json())
+        assert (
+            response.status == "success"
+        ), f"Fail to reset runtime: {response_raw.text}"
+
     def close(self) -> None:
         pass
@@ -13,6 +13,8 @@ class Config(metaclass=ThreadSafeSingleton):
     seed: int = 42
     headless: bool = False  # True for CLI, False for GUI
     python_timeout: int = 20
+    # Python runtimes kept started in the background, 0 to start them on demand
+    kernel_pool_size: int = 1
     need_human_confirmation: bool = False
     minimal_action_interval: float = 3.0
 
@@ -32,12 +34,77 @@ class Config(metaclass=ThreadSafeSingleton):
     vnc_port: int = 5900
     env_server_port: int = 8000
     vnc_password: str = "123456"
+    # Env servers to evaluate on in parallel in headless mode, each a dict with
+    # addr, port, vnc_port, vnc_password and optionally the session to use on
+    # it, so that several workers share one server. Sessions have their own
+    # runtime and task, but share the desktop. Empty for the single server above.
+    env_servers: list[dict] = []
+    # Seconds a task status request waits on the server for the task to finish
+    # or need input before returning
+    task_status_wait: float = 30.0
+    # Sessions an env server serves at once, each with its own Python runtime
+    # and task, and seconds after which an idle session is closed
+    max_sessions: int = 4
+    session_idle_timeout: float = 600.0
     monitor_idx: int = 1  # 1 for the first monitor, 2 for the second monitor
     vnc_frame_size: tuple[int, int] = (1000, 1000)
+    # VNC encodings in order of preference, see encoding_codes in vnc_client.py
+    vnc_encodings: list[str] = [
+        "tight",
+        "zrle",
+        "hextile",
+        "zlib",
+        "copyrect",
+        "raw",
+        "cursor",
+        "pointer_pos",
+        "desktop_size",
+        "extended_desktop_size",
+    ]
+    vnc_compress_level: int | None = None  # 0-9, Tight zlib level
+    vnc_jpeg_quality: int | None = None  # 0-9, enables lossy JPEG in Tight
+    vnc_pool_workers: int = 4  # frame conversion threads of a VNCStreamerPool
+    # Frame pacing of the streamers, which poll at vnc_target_fps and back off
+    # towards vnc_idle_fps once vnc_idle_frames captures in a row were static.
+    # The VNC streamers only cap their update requests at vnc_target_fps, as the
+    # server holds the requests while the screen is static.
+    vnc_target_fps: float | None = 30.0  # None or 0 for no limit
+    vnc_idle_fps: float | None = 2.0  # None or 0 for no backoff
+    vnc_idle_frames: int = 10
+    # After an action, wait until the screen was unchanged for settle_quiet_time
+    # seconds, but at most settle_max_wait seconds
+    settle_quiet_time: float = 0.5
+    settle_max_wait: float = 10.0
+    obs_with_cursor: bool = True  # draw the cursor onto the agent's observations
+    # Publish streamed frames to shared memory for consumers in other processes
+    frame_bus: bool = False
+    # Suffixed with the VNC server and port, or the monitor, of each streamer.
+    # None for a random name
+    frame_bus_name: str | None = None
+    frame_bus_slots: int = 4
+    # Largest frame the bus holds at first, None for the size of the first frame.
+    # The bus is replaced by a larger one under the same name for larger frames.
+    frame_bus_max_size: tuple[int, int] | None = None
 
     # Recorder config
     record_path = "data/trajectories"
     video_fps: int = 5
+    # Encode videos while recording instead of buffering frames until saving
+    video_streaming: bool = True
+    video_queue_size: int = 32  # frames waiting for the encoder
+    # Save only changed frames, with their timestamps in a sidecar file
+    video_vfr: bool = False
+    # Split encoded videos into segments of this many frames with a step index
+    video_segment_frames: int | None = None  # None for a single file
+    # Draw the cursor onto videos of VNC recordings, as the server leaves it out
+    # of the frames once the cursor encodings are negotiated
+    video_with_cursor: bool = True
+    # Frames kept in memory by the frame buffer, older ones spill to disk
+    frame_buffer_size: int = 100
+    frame_buffer_spill_dir: str | None = None  # None for the system temp dir
+    # Keep buffered frames compressed in memory with "zlib", "png", "lz4" or "zstd"
+    frame_buffer_codec: str | None = None
+    frame_buffer_keyframe_interval: int = 30  # other frames are deltas
     mouse_fps: int = 5
 
     # Human annotator hotkeys
@@ -1,7 +1,6 @@
 import logging
 import queue
 import threading
-import time
 from pathlib import Path
 
 import numpy as np
@@ -40,7 +39,11 @@ from agent_studio.envs.desktop_env.recorder.screen_recorder import (
     ScreenRecorder,
     VNCRecorder,
 )
-from agent_studio.envs.desktop_env.vnc_client import VNCFrame, VNCStreamer
+from agent_studio.envs.desktop_env.vnc_client import (
+    ScreenSettleDetector,
+    VNCFrame,
+    VNCStreamer,
+)
 from agent_studio.utils.communication import (
     AgentStudioEvalRequest,
     AgentStudioResetRequest,
@@ -55,30 +58,6 @@ logger = logging.getLogger(__name__)
 REMOTE_SERVER_ADDR = f"{config.env_server_addr}:{config.env_server_port}"
 
 
-class FrameBuffer:
-    def __init__(self):
-        self.queue = []
-        self.lock = threading.Lock()
-
-    def add_frame(self, frame_id, frame):
-        with self.lock:
-            self.queue.append((frame_id, frame))
-
-    def clear(self):
-        with self.lock:
-            self.queue.clear()
-
-    def get_frames(self, start_frame_id, end_frame_id=None):
-        frames = []
-        with self.lock:
-            for frame in self.queue:
-                if frame[0] >= start_frame_id:
-                    if end_frame_id is not None and frame[0] > end_frame_id:
-                        break
-                    frames.append(frame)
-        return frames
-
-
 class WorkerSignals(QObject):
     confirm_signal = pyqtSignal(bool)
     decline_signal = pyqtSignal(bool)
@@ -128,13 +107,8 @@ class ResetRuntimeThread(QThread):
         self.signals = signals
 
     def run(self):
-        # reset remote runtime
-        response_raw = requests.post(f"http://{REMOTE_SERVER_ADDR}/runtime/reset")
-        assert response_raw.status_code == 200, f"{response_raw.status_code}"
-        response = AgentStudioStatusResponse(**response_raw.json())
-        assert (
-            response.status == "success"
-        ), f"Fail to reset runtime: {response_raw.text}"
+        # the remote runtime is reset with the init code of the agent by
+        # agent.reset() in ResetTaskThread, on the session of the agent
         self.signals.status_bar_signal.emit("color: green;", "Task: Ready")
         self.signals.start_signal.emit(True)
 
@@ -158,7 +132,10 @@ class ResetTaskThread(QThread):
 
     def _wait_finish(self):
         while True:
-            response_raw = requests.get(f"http://{REMOTE_SERVER_ADDR}/task/status")
+            response_raw = requests.get(
+                f"http://{REMOTE_SERVER_ADDR}/task/status",
+                params={"wait": config.task_status_wait},
+            )
             assert response_raw.status_code == 200, f"{response_raw.status_code}"
             response = AgentStudioStatusResponse(**response_raw.json())
             if response.status == "finished":
@@ -183,7 +160,6 @@ class ResetTaskThread(QThread):
                 self.signals.status_bar_signal.emit("color: green;", "In Progress")
             else:
                 raise ValueError(f"Unknown status: {response.status}")
-            time.sleep(1)
 
     def run(self):
         assert self.selected_task is not None
@@ -272,7 +248,10 @@ class EvalTaskThread(QThread):
 
     def _wait_finish(self):
         while True:
-            response_raw = requests.get(f"http://{REMOTE_SERVER_ADDR}/task/status")
+            response_raw = requests.get(
+                f"http://{REMOTE_SERVER_ADDR}/task/status",
+                params={"wait": config.task_status_wait},
+            )
             assert response_raw.status_code == 200, f"{response_raw.status_code}"
             response = AgentStudioStatusResponse(**response_raw.json())
             if response.status == "finished":
@@ -297,7 +276,6 @@ class EvalTaskThread(QThread):
                 self.signals.status_bar_signal.emit("color: green;", "In Progress")
             else:
                 raise ValueError(f"Unknown status: {response.status}")
-            time.sleep(1)
 
     def run(self):
         self.signals.status_bar_signal.emit("color: green;", "Task: Auto-Evaluating...")
@@ -356,10 +334,12 @@ class StepActionThread(QThread):
         current_step_num: int,
         max_steps: int,
         agent: BaseAgent,
+        settle_detector: ScreenSettleDetector,
     ):
         super().__init__()
         self.signals = signals
         self.agent = agent
+        self.settle_detector = settle_detector
         self.trajectory_display = trajectory_display
         self.parsed_action_display = parsed_action_display
         self.screen_recorder = screen_recorder
@@ -370,8 +350,10 @@ class StepActionThread(QThread):
         """Steps the next action and adds it to the trajectory."""
         next_action_text = self.parsed_action_display.toPlainText()
         result, done = self.agent.step_action(confirmed=True)
+        if self.screen_recorder is not None:
+            self.screen_recorder.add_step(self.agent.trajectory[-1]["timestamp"])
         self.signals.output_display_signal.emit(str(result))
-        time.sleep(config.minimal_action_interval)
+        self.agent.trajectory[-1]["settle_time"] = self.settle_detector.wait()
 
         if next_action_text.strip():
             current_trajectory_text = self.trajectory_display.toPlainText()
@@ -386,7 +368,9 @@ class StepActionThread(QThread):
             self.signals.finish_run_task_signal.emit()
         else:
             if self.screen_recorder is not None:
-                obs = self.screen_recorder.get_current_frame()
+                obs = self.screen_recorder.get_current_frame(
+                    with_cursor=config.obs_with_cursor
+                )
                 assert obs is not None
             else:
                 obs = None
@@ -424,6 +408,7 @@ class AgentInterface(QMainWindow):
         self.on_close = False
 
         self.vnc_thread: VNCStreamer | None = None
+        self.screen_seq = 0  # sequence number of the frame on screen
         self.current_thread: (
             ResetTaskThread
             | EvalTaskThread
@@ -701,6 +686,7 @@ class AgentInterface(QMainWindow):
     def reconnect(self):
         self.status_bar.showMessage("Reconnecting")
         if self.vnc_thread is not None:
+            self.screen_seq = 0
             self.vnc_thread = VNCStreamer(
                 env_server_addr=config.env_server_addr,
                 vnc_port=config.vnc_port,
@@ -767,19 +753,33 @@ class AgentInterface(QMainWindow):
         logger.info(f"Generate action for task: {self.selected_task['task_id']}")
 
         if self.selected_task["visual"]:
+            # the recorder encodes the video right away when streaming
+            video_path = (
+                (
+                    self.record_path / self.selected_task["task_id"] / "video.mp4"
+                ).as_posix()
+                if config.video_streaming
+                else None
+            )
             if config.remote:
                 assert self.vnc_thread is not None
                 self.screen_recorder = VNCRecorder(
-                    fps=config.video_fps, vnc_streamer=self.vnc_thread
+                    fps=config.video_fps,
+                    vnc_streamer=self.vnc_thread,
+                    video_path=video_path,
                 )
             else:
                 # assert False, "Local recording is not supported"
-                self.screen_recorder = ScreenRecorder(fps=config.video_fps)
+                self.screen_recorder = ScreenRecorder(
+                    fps=config.video_fps, video_path=video_path
+                )
             self.screen_recorder.start()
 
         if self.selected_task["visual"]:
             assert self.screen_recorder is not None
-            obs = self.screen_recorder.get_current_frame()
+            obs = self.screen_recorder.get_current_frame(
+                with_cursor=config.obs_with_cursor
+            )
         else:
             obs = None
         signals = WorkerSignals()
@@ -823,7 +823,9 @@ class AgentInterface(QMainWindow):
             agent=self.agent,
             trajectory_display=self.trajectory_display,
             result_queue=self.current_thread_result,
-            final_obs=self.screen_recorder.get_current_frame()
+            final_obs=self.screen_recorder.get_current_frame(
+                with_cursor=config.obs_with_cursor
+            )
             if self.screen_recorder
             else None,
         )
@@ -883,6 +885,9 @@ class AgentInterface(QMainWindow):
             current_step_num=self.current_step_num,
             max_steps=self.selected_task["max_steps"],
             agent=self.agent,
+            settle_detector=ScreenSettleDetector(
+                self.vnc_thread if config.remote else None
+            ),
         )
         self.current_thread.start()
         self.current_step_num += 1
@@ -896,15 +901,25 @@ class AgentInterface(QMainWindow):
             if config.remote:
                 with self.recording_lock:
                     assert self.vnc_thread is not None
+                    seq = self.vnc_thread.frame_seq
+                    if seq == self.screen_seq:
+                        return
                     frame = self.vnc_thread.get_current_frame()
+                    damage = self.vnc_thread.get_damage(self.screen_seq)
+                    cursor, pointer = self.vnc_thread.get_cursor()
+                    self.screen_seq = seq
                 if frame is not None:
+                    # The remote desktop may have been resized since connecting
+                    height, width = frame.shape[:2]
                     qimage = QImage(
-                        frame.tobytes(),
-                        self.video_width,
-                        self.video_height,
+                        frame.data,  # no copy, frame is kept alive until scaled
+                        width,
+                        height,
+                        3 * width,
                         QImage.Format.Format_RGB888,
                     )
-                    self.vnc_frame.update(qimage)
+                    self.vnc_frame.set_cursor(cursor, pointer)
+                    self.vnc_frame.update(qimage, damage)
         except Exception as e:
             logger.error("Fail to get screenshot.", e)
 
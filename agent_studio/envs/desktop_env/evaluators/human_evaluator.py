@@ -6,10 +6,9 @@ from agent_studio.envs.desktop_env.evaluators.evaluator import (
     FeedbackException,
     evaluation_handler,
 )
-from agent_studio.utils.task_status import StateEnum, StateInfo, TaskStatus
+from agent_studio.utils.task_status import StateEnum, StateInfo, current_task_status
 
 logger = logging.getLogger(__name__)
-task_status = TaskStatus()
 config = Config()
 
 
@@ -27,6 +26,7 @@ class HumanEvaluator(Evaluator):
                 )
                 raise FeedbackException(feedback)
         else:
+            task_status = current_task_status()
             task_status.set_task_state(
                 StateInfo(
                     state=StateEnum.WAIT_FOR_INPUT,
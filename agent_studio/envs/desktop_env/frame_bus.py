@@ -0,0 +1,201 @@
+import logging
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# magic, slots, max width, max height, channels, resize width, resize height,
+# latest sequence number
+HEADER = struct.Struct("<4sIIIIIIq")
+# resize width, resize height, set once a frame did not fit into the bus
+RESIZE = struct.Struct("<II")
+# sequence number, width, height, timestamp
+SLOT_HEADER = struct.Struct("<qIId")
+MAGIC = b"ASFB"
+# Keeps the frame data of every slot 64-byte aligned
+ALIGNMENT = 64
+# Buses created by this process, which its resource tracker is in charge of
+_created_names: set[str] = set()
+
+
+def _align(size: int) -> int:
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class SharedFrameBus:
+    """
+    Ring buffer of frames in shared memory.
+
+    A single writer publishes RGB frames under increasing sequence numbers,
+    and any number of readers in other processes attach to the bus by name
+    and read frames without pickling them. Each slot stores its sequence
+    number before and after the frame data is written, so readers can detect
+    and retry frames that were overwritten while being copied.
+
+    A frame larger than the bus is not published. Instead, the bus is marked
+    with the size it would need, so that the writer can replace it with a
+    larger bus and readers know to re-attach.
+
+    Example for a reader::
+
+        bus = SharedFrameBus.attach(name)
+        seq = 0
+        while bus.wait_for_frame(seq, timeout=1.0):
+            if bus.resize_to is not None:
+                bus.close()
+                bus = SharedFrameBus.attach(name)  # once the writer replaced it
+                continue
+            seq, frame = bus.read()
+    """
+
+    def __init__(self, memory: shared_memory.SharedMemory, owner: bool):
+        self.memory = memory
+        self.owner = owner
+        magic, slots, max_width, max_height, channels = HEADER.unpack_from(memory.buf)[
+            :5
+        ]
+        if magic != MAGIC:
+            raise ValueError(f"{memory.name} is not a frame bus")
+        self.slots = slots
+        self.max_width = max_width
+        self.max_height = max_height
+        self.channels = channels
+        self.slot_size = _align(SLOT_HEADER.size + max_width * max_height * channels)
+        # Size of the last frame that did not fit, to only warn about it once
+        self._rejected_size: tuple[int, int] | None = None
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    @classmethod
+    def create(
+        cls,
+        max_width: int,
+        max_height: int,
+        slots: int = 4,
+        channels: int = 3,
+        name: str | None = None,
+    ) -> "SharedFrameBus":
+        """Allocates a new bus for frames of up to *max_width*x*max_height*."""
+        slot_size = _align(SLOT_HEADER.size + max_width * max_height * channels)
+        memory = shared_memory.SharedMemory(
+            name=name, create=True, size=_align(HEADER.size) + slots * slot_size
+        )
+        HEADER.pack_into(
+            memory.buf, 0, MAGIC, slots, max_width, max_height, channels, 0, 0, 0
+        )
+        for slot in range(slots):
+            SLOT_HEADER.pack_into(
+                memory.buf, _align(HEADER.size) + slot * slot_size, 0, 0, 0, 0.0
+            )
+        logger.info(f"Frame bus {memory.name} created with {slots} slots")
+        _created_names.add(memory.name)
+        return cls(memory, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedFrameBus":
+        """Attaches to an existing bus created by another process."""
+        memory = shared_memory.SharedMemory(name=name)
+        if memory.name not in _created_names:
+            # Only the creator may unlink the memory, but the resource tracker
+            # would do so when this process exits.
+            resource_tracker.unregister(memory._name, "shared_memory")  # type: ignore
+        return cls(memory, owner=False)
+
+    @property
+    def latest_seq(self) -> int:
+        """Sequence number of the newest frame, 0 before the first one."""
+        return HEADER.unpack_from(self.memory.buf)[7]
+
+    @property
+    def resize_to(self) -> tuple[int, int] | None:
+        """
+        Width and height of a frame that did not fit into the bus, or None.
+        Once set, the writer publishes to a larger bus instead.
+        """
+        width, height = RESIZE.unpack_from(self.memory.buf, HEADER.size - 16)
+        return (width, height) if width and height else None
+
+    def _slot_offset(self, seq: int) -> int:
+        return _align(HEADER.size) + (seq % self.slots) * self.slot_size
+
+    def _slot_array(self, offset: int, width: int, height: int) -> np.ndarray:
+        return np.ndarray(
+            (height, width, self.channels),
+            "B",
+            self.memory.buf,
+            offset + SLOT_HEADER.size,
+        )
+
+    def publish(self, seq: int, frame: np.ndarray, timestamp: float) -> bool:
+        """
+        Writes *frame* under the increasing sequence number *seq*. Returns False
+        if the frame does not fit into the bus, which then marks the bus with
+        the size it would need, see *resize_to*.
+        """
+        height, width = frame.shape[:2]
+        if width > self.max_width or height > self.max_height:
+            if self._rejected_size != (width, height):
+                self._rejected_size = width, height
+                logger.warning(
+                    f"Frame of {width}x{height} does not fit into the frame bus "
+                    f"of {self.max_width}x{self.max_height}"
+                )
+                RESIZE.pack_into(self.memory.buf, HEADER.size - 16, width, height)
+            return False
+        offset = self._slot_offset(seq)
+        # Marks the slot as being written
+        SLOT_HEADER.pack_into(self.memory.buf, offset, -1, width, height, timestamp)
+        self._slot_array(offset, width, height)[...] = frame
+        SLOT_HEADER.pack_into(self.memory.buf, offset, seq, width, height, timestamp)
+        struct.pack_into("<q", self.memory.buf, HEADER.size - 8, seq)
+        return True
+
+    def read(
+        self, seq: int | None = None, retries: int = 3
+    ) -> tuple[int, np.ndarray] | None:
+        """
+        Returns a copy of the frame *seq*, by default the newest one, together
+        with its sequence number. Returns None if the frame is no longer, or not
+        yet, in the ring buffer.
+        """
+        for _ in range(retries):
+            target = self.latest_seq if seq is None else seq
+            if target <= 0:
+                return None
+            offset = self._slot_offset(target)
+            before, width, height, _ = SLOT_HEADER.unpack_from(self.memory.buf, offset)
+            if before != target:
+                if seq is not None and before > target:
+                    return None  # overwritten by a newer frame
+                continue
+            frame = self._slot_array(offset, width, height).copy()
+            after = SLOT_HEADER.unpack_from(self.memory.buf, offset)[0]
+            if after == target:
+                return target, frame
+        return None
+
+    def wait_for_frame(
+        self, seq: int, timeout: float | None = None, interval: float = 0.002
+    ) -> bool:
+        """
+        Polls until a frame newer than *seq* is published, or the bus is marked
+        for a resize. Returns False if *timeout* expired first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.latest_seq <= seq and self.resize_to is None:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(interval)
+        return True
+
+    def close(self) -> None:
+        """Detaches from the bus, and frees it if this process created it."""
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+            _created_names.discard(self.memory.name)
@@ -4,7 +4,6 @@ import logging
 import os
 import queue
 import threading
-import time
 import uuid
 from pathlib import Path
 
@@ -120,7 +119,10 @@ class ResetThread(QThread):
 
     def _wait_finish(self):
         while True:
-            response_raw = requests.get(f"http://{REMOTE_SERVER_ADDR}/task/status")
+            response_raw = requests.get(
+                f"http://{REMOTE_SERVER_ADDR}/task/status",
+                params={"wait": config.task_status_wait},
+            )
             assert response_raw.status_code == 200, f"{response_raw.status_code}"
             response = AgentStudioStatusResponse(**response_raw.json())
             if response.status == "finished":
@@ -145,19 +147,12 @@ class ResetThread(QThread):
                 pass
             else:
                 raise ValueError(f"Unknown status: {response.status}")
-            time.sleep(1)
 
     def run(self):
-        # reset remote runtime
+        # resets the remote runtime too, with the init code of the agent
         self.signals.status_bar_signal.emit(
             "color: green;", "Task: Resetting runtime..."
         )
-        response_raw = requests.post(f"http://{REMOTE_SERVER_ADDR}/runtime/reset")
-        assert response_raw.status_code == 200, f"{response_raw.status_code}"
-        response = AgentStudioStatusResponse(**response_raw.json())
-        assert (
-            response.status == "success"
-        ), f"Fail to reset runtime: {response_raw.text}"
         self.agent.reset(instruction=self.task_config["instruction"])
         self.signals.status_bar_signal.emit(
             "color: green;", "Task: Preparing the environment..."
@@ -214,7 +209,10 @@ class EvalTaskThread(QThread):
 
     def _wait_finish(self):
         while True:
-            response_raw = requests.get(f"http://{REMOTE_SERVER_ADDR}/task/status")
+            response_raw = requests.get(
+                f"http://{REMOTE_SERVER_ADDR}/task/status",
+                params={"wait": config.task_status_wait},
+            )
             response = AgentStudioStatusResponse(**response_raw.json())
             if response.status == "finished":
                 break
@@ -237,7 +235,6 @@ class EvalTaskThread(QThread):
                 self.signals.status_bar_signal.emit("color: green;", "In Progress")
             else:
                 raise ValueError(f"Unknown status: {response.status}")
-            time.sleep(1)
 
     def run(self):
         self.signals.status_bar_signal.emit("color: green;", "Task: Auto-Evaluating...")
@@ -420,6 +417,7 @@ class HumanInterface(QMainWindow):
 
         self.record_path = record_path
         self.capture_thread: VNCStreamer | LocalStreamer | None
+        self.screen_seq = 0  # sequence number of the frame on screen
         if config.remote:
             # VNC remote desktop
             self.capture_thread = VNCStreamer(
@@ -995,6 +993,7 @@ class HumanInterface(QMainWindow):
             )
             if self.capture_thread is not None:
                 with self.recording_lock:
+                    self.screen_seq = 0
                     self.capture_thread = VNCStreamer(
                         env_server_addr=config.env_server_addr,
                         vnc_port=config.vnc_port,
@@ -1007,16 +1006,26 @@ class HumanInterface(QMainWindow):
         try:
             with self.recording_lock:
                 assert self.capture_thread is not None
+                seq = self.capture_thread.frame_seq
+                if seq == self.screen_seq:
+                    return
                 frame = self.capture_thread.get_current_frame()
+                damage = self.capture_thread.get_damage(self.screen_seq)
+                cursor, pointer = self.capture_thread.get_cursor()
+                self.screen_seq = seq
             if frame is not None:
                 self.now_screenshot = frame
+                # The remote desktop may have been resized since connecting
+                height, width = frame.shape[:2]
                 qimage = QImage(
-                    frame.tobytes(),
-                    self.video_width,
-                    self.video_height,
+                    frame.data,  # no copy, frame is kept alive until scaled
+                    width,
+                    height,
+                    3 * width,
                     QImage.Format.Format_RGB888,
                 )
-                self.vnc_frame.update(qimage)
+                self.vnc_frame.set_cursor(cursor, pointer)
+                self.vnc_frame.update(qimage, damage)
         except Exception as e:
             logger.error("Fail to get screenshot.", e)
 
@@ -0,0 +1,153 @@
+import zlib
+from typing import Callable
+
+import cv2
+import numpy as np
+
+Compress = Callable[[np.ndarray], bytes]
+Decompress = Callable[[bytes, tuple[int, ...]], np.ndarray]
+
+
+def _zlib() -> tuple[Compress, Decompress]:
+    def compress(frame: np.ndarray) -> bytes:
+        return zlib.compress(frame, 1)
+
+    def decompress(data: bytes, shape: tuple[int, ...]) -> np.ndarray:
+        return np.frombuffer(zlib.decompress(data), np.uint8).reshape(shape)
+
+    return compress, decompress
+
+
+def _png() -> tuple[Compress, Decompress]:
+    def compress(frame: np.ndarray) -> bytes:
+        success, data = cv2.imencode(".png", frame, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+        assert success, "Failed to encode the frame as PNG"
+        return data.tobytes()
+
+    def decompress(data: bytes, shape: tuple[int, ...]) -> np.ndarray:
+        frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+        return frame.reshape(shape)
+
+    return compress, decompress
+
+
+def _lz4() -> tuple[Compress, Decompress]:
+    try:
+        import lz4.frame
+    except ImportError:
+        raise RuntimeError("lz4 is required. Install it with `pip install lz4`.")
+
+    def compress(frame: np.ndarray) -> bytes:
+        return lz4.frame.compress(frame)
+
+    def decompress(data: bytes, shape: tuple[int, ...]) -> np.ndarray:
+        return np.frombuffer(lz4.frame.decompress(data), np.uint8).reshape(shape)
+
+    return compress, decompress
+
+
+def _zstd() -> tuple[Compress, Decompress]:
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError(
+            "zstandard is required. Install it with `pip install zstandard`."
+        )
+    compressor = zstandard.ZstdCompressor(level=1)
+    decompressor = zstandard.ZstdDecompressor()
+
+    def compress(frame: np.ndarray) -> bytes:
+        return compressor.compress(frame)
+
+    def decompress(data: bytes, shape: tuple[int, ...]) -> np.ndarray:
+        return np.frombuffer(decompressor.decompress(data), np.uint8).reshape(shape)
+
+    return compress, decompress
+
+
+CODECS: dict[str, Callable[[], tuple[Compress, Decompress]]] = {
+    "zlib": _zlib,
+    "png": _png,
+    "lz4": _lz4,
+    "zstd": _zstd,
+}
+
+
+class CompressedFrame:
+    """
+    A frame compressed losslessly by a FrameCodec. Frames other than keyframes
+    hold the XOR delta against their keyframe, which is all zeros wherever the
+    screen did not change.
+    """
+
+    def __init__(
+        self,
+        codec: "FrameCodec",
+        data: bytes,
+        shape: tuple[int, ...],
+        keyframe: "CompressedFrame | None" = None,
+    ) -> None:
+        self.codec = codec
+        self.data = data
+        self.shape = shape
+        self.keyframe = keyframe
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.data)
+
+    def decode(self) -> np.ndarray:
+        """Decompresses the frame into a new array."""
+        if self.keyframe is None:
+            return self.codec.decode_keyframe(self)
+        delta = self.codec.decompress(self.data, self.shape)
+        return np.bitwise_xor(delta, self.codec.decode_keyframe(self.keyframe))
+
+
+class FrameCodec:
+    """
+    Compresses a sequence of frames with *codec*, one of "zlib", "png", "lz4"
+    and "zstd". Every *keyframe_interval*-th frame, and every frame whose size
+    differs from the last keyframe, is compressed on its own, and the others as
+    a delta against the last keyframe.
+    """
+
+    def __init__(self, codec: str = "zlib", keyframe_interval: int = 30) -> None:
+        if codec not in CODECS:
+            raise ValueError(f"Unknown frame codec {codec}")
+        self.name = codec
+        self.compress, self.decompress = CODECS[codec]()
+        self.keyframe_interval = keyframe_interval
+        self.count = 0  # frames encoded with the last keyframe, including it
+        self.keyframe: CompressedFrame | None = None
+        self.keyframe_array: np.ndarray | None = None
+        # the last decoded keyframe, which consecutive frames usually share
+        self.decoded: tuple[CompressedFrame, np.ndarray] | None = None
+
+    def encode(self, frame: np.ndarray) -> CompressedFrame:
+        frame = np.ascontiguousarray(frame)
+        if (
+            self.keyframe_array is None
+            or self.count >= self.keyframe_interval
+            or self.keyframe_array.shape != frame.shape
+        ):
+            self.keyframe = CompressedFrame(self, self.compress(frame), frame.shape)
+            self.keyframe_array = frame
+            self.count = 1
+            return self.keyframe
+        self.count += 1
+        delta = np.bitwise_xor(frame, self.keyframe_array)
+        return CompressedFrame(self, self.compress(delta), frame.shape, self.keyframe)
+
+    def decode_keyframe(self, keyframe: CompressedFrame) -> np.ndarray:
+        if self.decoded is None or self.decoded[0] is not keyframe:
+            frame = self.decompress(keyframe.data, keyframe.shape)
+            # shared by every frame decoded against this keyframe
+            frame.flags.writeable = False
+            self.decoded = (keyframe, frame)
+        return self.decoded[1]
+
+    def reset(self) -> None:
+        self.count = 0
+        self.keyframe = self.keyframe_array = None
+        self.decoded = None
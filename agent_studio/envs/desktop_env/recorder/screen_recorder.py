@@ -1,8 +1,12 @@
 import logging
 import os
 import platform
+import shutil
+import tempfile
 import threading
 import time
+import zlib
+from typing import IO, Iterator
 
 import cv2
 import mss
@@ -11,7 +15,17 @@ import pyautogui
 
 from agent_studio.config import Config
 from agent_studio.envs.desktop_env.recorder.base_recorder import Recorder
-from agent_studio.envs.desktop_env.vnc_client import VNCStreamer
+from agent_studio.envs.desktop_env.recorder.frame_codec import (
+    CompressedFrame,
+    FrameCodec,
+)
+from agent_studio.envs.desktop_env.recorder.video_encoder import (
+    VideoEncoder,
+    segments_path,
+    timestamps_path,
+    write_timestamps,
+)
+from agent_studio.envs.desktop_env.vnc_client import VNCStreamer, composite_cursor
 
 if platform.system() == "Windows":
     from ctypes import windll  # type: ignore
@@ -29,27 +43,158 @@ config = Config()
 
 
 class FrameBuffer:
-    def __init__(self):
-        self.queue = []
-        self.lock = threading.Lock()
+    """
+    Frames of a recording, indexed by consecutive frame ids.
 
-    def add_frame(self, frame_id, frame):
-        with self.lock:
-            self.queue.append((frame_id, frame))
+    The newest *capacity* frame ids are kept in memory in a ring buffer, and
+    older frames spill to a compressed segment file on disk, so memory use is
+    bounded however long the recording runs. Consecutive frame ids showing
+    the same frame share one array in memory and one record on disk.
+
+    With *codec* (see FrameCodec), frames in memory are kept compressed as
+    well, and decompressed only when they are accessed.
+    """
 
-    def clear(self):
+    def __init__(
+        self,
+        capacity: int | None = None,
+        spill_dir: str | None = None,
+        codec: str | None = None,
+    ):
+        self.capacity = capacity or config.frame_buffer_size
+        self.spill_dir = spill_dir or config.frame_buffer_spill_dir
+        codec = codec or config.frame_buffer_codec
+        self.codec = (
+            None
+            if codec is None
+            else FrameCodec(codec, config.frame_buffer_keyframe_interval)
+        )
+        self.lock = threading.Lock()
+        self.ring: list[np.ndarray | CompressedFrame | None] = [None] * self.capacity
+        self.start_frame_id = 0  # first frame id in the buffer
+        self.end_frame_id = 0  # one past the last frame id
+        # offset, size and shape of the spilled frames, from start_frame_id on
+        self.spilled: list[tuple[int, int, tuple[int, ...]]] = []
+        self.spill_file: IO[bytes] | None = None
+        self.last_spilled: np.ndarray | CompressedFrame | None = None
+        self.last_loaded: tuple[int, np.ndarray] | None = None
+        self.last_decoded: tuple[CompressedFrame, np.ndarray] | None = None
+
+    def __len__(self) -> int:
+        return self.end_frame_id - self.start_frame_id
+
+    def add_frame(self, frame_id: int, frame: np.ndarray) -> None:
         with self.lock:
-            self.queue.clear()
+            if len(self) == 0:
+                self.start_frame_id = self.end_frame_id = frame_id
+            elif frame_id != self.end_frame_id:
+                raise ValueError(
+                    f"Expected frame id {self.end_frame_id}, got {frame_id}"
+                )
+            self._append(frame if self.codec is None else self.codec.encode(frame))
+
+    def add_duplicate(self) -> None:
+        """Repeats the last frame for the next frame id without storing it."""
+        with self.lock:
+            assert len(self) > 0, "No frame to repeat"
+            self._append(self.ring[(self.end_frame_id - 1) % self.capacity])
 
-    def get_frames(self, start_frame_id, end_frame_id=None):
-        frames = []
+    def clear(self) -> None:
         with self.lock:
-            for frame in self.queue:
-                if frame[0] >= start_frame_id:
-                    if end_frame_id is not None and frame[0] > end_frame_id:
-                        break
-                    frames.append(frame)
-        return frames
+            self.ring = [None] * self.capacity
+            self.start_frame_id = self.end_frame_id = 0
+            self.spilled.clear()
+            self.last_spilled = self.last_loaded = self.last_decoded = None
+            if self.codec is not None:
+                self.codec.reset()
+            if self.spill_file is not None:
+                # the file is deleted as soon as it is closed
+                self.spill_file.close()
+                self.spill_file = None
+
+    def get_frame(self, frame_id: int) -> np.ndarray | None:
+        """Returns the frame of *frame_id*, or None if it is not in the buffer."""
+        with self.lock:
+            return self._get(frame_id)
+
+    def get_frames(
+        self, start_frame_id: int, end_frame_id: int | None = None
+    ) -> list[tuple[int, np.ndarray]]:
+        return list(self.iter_frames(start_frame_id, end_frame_id))
+
+    def iter_frames(
+        self, start_frame_id: int, end_frame_id: int | None = None
+    ) -> Iterator[tuple[int, np.ndarray]]:
+        """
+        Yields the frame ids from *start_frame_id* to *end_frame_id*, inclusive,
+        with their frames. Spilled frames are read back one at a time.
+        """
+        stop = self.end_frame_id
+        if end_frame_id is not None:
+            stop = min(stop, end_frame_id + 1)
+        for frame_id in range(max(start_frame_id, self.start_frame_id), stop):
+            frame = self.get_frame(frame_id)
+            if frame is None:  # cleared meanwhile
+                return
+            yield frame_id, frame
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the frames in the ring buffer, without duplicates."""
+        entries = {id(entry): entry for entry in self.ring if entry is not None}
+        return sum(entry.nbytes for entry in entries.values())
+
+    def _append(self, frame: np.ndarray | CompressedFrame | None) -> None:
+        assert frame is not None
+        slot = self.end_frame_id % self.capacity
+        if len(self) >= self.capacity:
+            self._spill(self.ring[slot])
+        self.ring[slot] = frame
+        self.end_frame_id += 1
+
+    def _spill(self, entry: np.ndarray | CompressedFrame | None) -> None:
+        assert entry is not None
+        if entry is self.last_spilled:
+            self.spilled.append(self.spilled[-1])
+            return
+        frame = self._decode(entry)
+        if self.spill_file is None:
+            self.spill_file = tempfile.TemporaryFile(
+                prefix="agent_studio_frames_", dir=self.spill_dir
+            )
+        data = zlib.compress(np.ascontiguousarray(frame), 1)
+        offset = self.spill_file.seek(0, os.SEEK_END)
+        self.spill_file.write(data)
+        self.spilled.append((offset, len(data), frame.shape))
+        self.last_spilled = entry
+
+    def _decode(self, entry: np.ndarray | CompressedFrame) -> np.ndarray:
+        if isinstance(entry, np.ndarray):
+            return entry
+        # consecutive duplicates are decompressed once
+        if self.last_decoded is None or self.last_decoded[0] is not entry:
+            frame = entry.decode()
+            frame.flags.writeable = False
+            self.last_decoded = (entry, frame)
+        return self.last_decoded[1]
+
+    def _get(self, frame_id: int) -> np.ndarray | None:
+        if not self.start_frame_id <= frame_id < self.end_frame_id:
+            return None
+        if frame_id >= self.end_frame_id - self.capacity:
+            entry = self.ring[frame_id % self.capacity]
+            assert entry is not None
+            return self._decode(entry)
+        offset, size, shape = self.spilled[frame_id - self.start_frame_id]
+        # consecutive duplicates are decompressed once
+        if self.last_loaded is not None and self.last_loaded[0] == offset:
+            return self.last_loaded[1]
+        assert self.spill_file is not None
+        self.spill_file.seek(offset)
+        data = zlib.decompress(self.spill_file.read(size))
+        frame = np.frombuffer(data, np.uint8).reshape(shape)
+        self.last_loaded = (offset, frame)
+        return frame
 
 
 class WindowManagerDummy:
@@ -175,9 +320,24 @@ class ScreenRecorder(Recorder):
     def __init__(
         self,
         fps: int,
+        video_path: str | None = None,
     ) -> None:
+        """
+        Frames are kept in memory until they are saved, unless *video_path* is
+        given, in which case they are encoded into that file while recording.
+        Unchanged frames are recorded as duplicates of the previous one, which
+        variable frame rate videos (config.video_vfr) leave out. Encoded videos
+        are split into segments of config.video_segment_frames frames if set.
+
+        Frames are captured against absolute deadlines on the monotonic clock,
+        and every frame id keeps its capture time in frame_times. Slots missed
+        while capturing fell behind are filled with the previous frame, so the
+        video stays in step with the wall clock.
+        """
         super().__init__()
         self.fps = fps
+        self.video_path = video_path
+        self.encoder: VideoEncoder | None = None
         self.screen_region = {
             "left": 0,
             "top": 0,
@@ -186,6 +346,12 @@ class ScreenRecorder(Recorder):
         }
         self.current_frame_id = -1
         self.current_frame = None
+        self.last_frame: np.ndarray | None = None  # the last recorded frame
+        # monotonic capture time of every frame id
+        self.frame_times: list[float] = []
+        self.start_monotonic = 0.0
+        self.stop_monotonic = 0.0
+        self.dropped_frames = 0  # slots filled because capturing fell behind
         self.frame_buffer = FrameBuffer()
         self.is_recording = False
         self.window_manager = WindowManagerDummy()
@@ -210,18 +376,31 @@ class ScreenRecorder(Recorder):
     def reset(self, **kwargs) -> None:
         self.frame_buffer.clear()
         self.current_frame_id = -1
-        self.current_frame = None
+        self.current_frame = self.last_frame = None
+        self.frame_times = []
+        self.dropped_frames = 0
 
     def start(self) -> None:
         self.recording_lock.acquire()
         self.frame_buffer.clear()
+        if self.video_path is not None:
+            self.encoder = VideoEncoder(
+                self.video_path,
+                self.fps,
+                self.screen_region["width"],
+                self.screen_region["height"],
+                vfr=config.video_vfr,
+                segment_frames=config.video_segment_frames,
+            )
+            self.encoder.start()
         self.is_recording = True
         self.thread.start()
         # wait until the recording starts
         with self.recording_lock:
             pass
         while True:
-            if self.current_frame is not None:
+            # the capture thread stops early if capturing or encoding fails
+            if self.current_frame is not None or not self.thread.is_alive():
                 break
             time.sleep(0.2)
 
@@ -243,11 +422,24 @@ class ScreenRecorder(Recorder):
         self.thread.join()  # Now we wait for the thread to finish
 
     def save(
-        self, video_path: str, start_frame_id: int, end_frame_id: int | None = None
+        self,
+        video_path: str,
+        start_frame_id: int,
+        end_frame_id: int | None = None,
+        vfr: bool | None = None,
     ) -> dict:
+        """
+        Saves the frames from *start_frame_id* to *end_frame_id* as a video.
+        With *vfr*, which defaults to config.video_vfr, only changed frames are
+        saved and their timestamps go to a sidecar next to the video.
+        """
         output_dir = os.path.dirname(video_path)
         if output_dir != "" and not os.path.exists(output_dir):
             os.makedirs(output_dir, exist_ok=True)
+        if self.encoder is not None:
+            return self._save_streamed(video_path, start_frame_id, end_frame_id)
+        if vfr is None:
+            vfr = config.video_vfr
         writer = cv2.VideoWriter(
             video_path,
             cv2.VideoWriter.fourcc(*"mp4v"),
@@ -258,54 +450,211 @@ class ScreenRecorder(Recorder):
             ),
         )
 
-        frames = self.frame_buffer.get_frames(start_frame_id, end_frame_id)
-        logger.info(f"Captured {len(frames)} frames with FPS={self.fps}")
-        for frame in frames:
-            writer.write(cv2.cvtColor(frame[1], cv2.COLOR_RGB2BGR))
+        size = (self.screen_region["width"], self.screen_region["height"])
+        frame_count = 0
+        timestamps = []
+        previous = None
+        for frame_id, image in self.frame_buffer.iter_frames(
+            start_frame_id, end_frame_id
+        ):
+            # duplicates share the array of the frame they repeat
+            if vfr and image is previous:
+                continue
+            previous = image
+            timestamps.append((frame_id - start_frame_id) * 1000 / self.fps)
+            # Frames captured before a desktop resize
+            if (image.shape[1], image.shape[0]) != size:
+                image = cv2.resize(image, size)
+            writer.write(cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
+            frame_count += 1
         writer.release()
+        logger.info(f"Captured {frame_count} frames with FPS={self.fps}")
 
         return {
             "start_time": self.start_time,
             "stop_time": self.stop_time,
             "fps": self.fps,
-            "frame_count": len(frames),
+            "frame_count": frame_count,
             "video_path": video_path,
+            "timestamps_path": (
+                write_timestamps(video_path, timestamps) if vfr else None
+            ),
             "width": self.screen_region["width"],
             "height": self.screen_region["height"],
+            **self._timing_meta(start_frame_id, end_frame_id),
         }
 
-    def get_current_frame(self) -> np.ndarray:
+    def _save_streamed(
+        self, video_path: str, start_frame_id: int, end_frame_id: int | None
+    ) -> dict:
+        assert self.encoder is not None and self.video_path is not None
+        if start_frame_id != 0 or end_frame_id is not None:
+            logger.warning(
+                "Frames are encoded while recording, saving all of them instead "
+                f"of frames {start_frame_id} to {end_frame_id}"
+            )
+        # the encoder is usually finalized when the recording stops
+        frame_count = self.encoder.close()
+        segmented = self.encoder.segment_frames is not None
+        if os.path.abspath(video_path) != os.path.abspath(self.video_path):
+            if segmented:
+                shutil.move(segments_path(self.video_path), segments_path(video_path))
+            else:
+                shutil.move(self.video_path, video_path)
+            if self.encoder.vfr:
+                shutil.move(
+                    timestamps_path(self.video_path), timestamps_path(video_path)
+                )
+            self.video_path = video_path
+        logger.info(f"Encoded {frame_count} frames with FPS={self.fps}")
+        width, height = self.encoder.size
+        return {
+            "start_time": self.start_time,
+            "stop_time": self.stop_time,
+            "fps": self.fps,
+            "frame_count": frame_count,
+            "video_path": None if segmented else video_path,
+            "timestamps_path": (
+                timestamps_path(video_path) if self.encoder.vfr else None
+            ),
+            "segments_path": segments_path(video_path) if segmented else None,
+            "width": width,
+            "height": height,
+            **self._timing_meta(0, None),
+        }
+
+    def _timing_meta(self, start_frame_id: int, end_frame_id: int | None) -> dict:
+        """
+        Achieved against target frame rate of the recording, and the capture
+        time of the saved frame ids in seconds since start_time.
+        """
+        duration = self.stop_monotonic - self.start_monotonic
+        captured = len(self.frame_times) - self.dropped_frames
+        stop = None if end_frame_id is None else end_frame_id + 1
+        return {
+            "target_fps": self.fps,
+            "achieved_fps": captured / duration if duration > 0 else 0.0,
+            "dropped_frames": self.dropped_frames,
+            "frame_times": [
+                round(frame_time - self.start_monotonic, 4)
+                for frame_time in self.frame_times[start_frame_id:stop]
+            ],
+        }
+
+    def add_step(self, timestamp: float) -> None:
+        """
+        Indexes the agent step taken at *timestamp* in segmented videos, so that
+        it can be found without decoding the whole episode.
+        """
+        if self.encoder is not None:
+            self.encoder.add_step(timestamp)
+
+    def _record_frame(
+        self,
+        frame: np.ndarray,
+        duplicate: bool = False,
+        capture_time: float | None = None,
+    ) -> None:
+        """
+        Records *frame* under the next frame id, captured at the monotonic
+        *capture_time*, by default now.
+        """
+        if capture_time is None:
+            capture_time = time.monotonic()
+        self.current_frame_id += 1
+        self.frame_times.append(capture_time)
+        self.last_frame = frame
+        if self.encoder is not None:
+            if not (duplicate and self.encoder.vfr):
+                # wall clock time, for agent steps timestamped with time.time()
+                timestamp = self.start_time + capture_time - self.start_monotonic
+                self.encoder.write(frame, self.current_frame_id, timestamp)
+        elif duplicate:
+            self.frame_buffer.add_duplicate()
+        else:
+            self.frame_buffer.add_frame(self.current_frame_id, frame)
+
+    def _start_recording(self) -> float:
+        """Returns the deadline of the first frame."""
+        self.start_time = time.time()
+        self.start_monotonic = time.monotonic()
+        logger.info("Screen recorder started")
+        return self.start_monotonic
+
+    def _next_deadline(self, deadline: float) -> float:
+        """
+        Returns the deadline of the frame after the one due at *deadline*.
+        Deadlines that already passed are filled with the last frame.
+        """
+        deadline += 1 / self.fps
+        missed = int((time.monotonic() - deadline) * self.fps)
+        if missed > 0:
+            assert self.last_frame is not None
+            logger.warning(
+                f"Recording falls behind the frame rate of {self.fps} FPS, "
+                f"repeating the last frame {missed} times"
+            )
+            for _ in range(missed):
+                self._record_frame(
+                    self.last_frame, duplicate=True, capture_time=deadline
+                )
+                deadline += 1 / self.fps
+            self.dropped_frames += missed
+        return deadline
+
+    def _finish_recording(self) -> None:
+        self.stop_time = time.time()
+        self.stop_monotonic = time.monotonic()
+        if self.encoder is not None:
+            self.encoder.close()
+        duration = self.stop_monotonic - self.start_monotonic
+        logger.info(
+            f"Screen recorder stopped, captured {self.current_frame_id + 1} frames "
+            f"in {duration:.2f} seconds, {self.dropped_frames} of them repeated "
+            "because capturing fell behind"
+        )
+
+    def get_current_frame(self, with_cursor: bool = False) -> np.ndarray:
         assert self.current_frame is not None, "No frame is captured"
+        if with_cursor:
+            # Recorded frames leave the cursor out, so grab a new one
+            with mss.mss(with_cursor=True) as sct:
+                frame = np.array(sct.grab(self.screen_region))
+            return cv2.cvtColor(frame, cv2.COLOR_BGRA2RGB)
         with self.recording_lock:
             return self.current_frame
 
     def _capture_screen(self) -> None:
         # if not config.remote:
         #     self.window_manager.send_to_background()
-        self.start_time = time.time()
-        logger.info("Screen recorder started")
-        with mss.mss(with_cursor=False) as sct:
-            self.recording_lock.release()
-            while self.is_recording:
-                last_capture_time = time.time()
-                frame = sct.grab(self.screen_region)
-                frame = np.array(frame)
-                frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2RGB)
-                # add frame to buffer
-                self.current_frame_id += 1
-                with self.recording_lock:
-                    self.current_frame = frame.copy()
-                self.frame_buffer.add_frame(self.current_frame_id, frame)
-                # preserve the frame rate
-                wait_time = 1 / self.fps - (time.time() - last_capture_time)
-                if wait_time > 0:
-                    time.sleep(wait_time)
-                elif wait_time < 0:
-                    logger.warning("Frame rate is too high")
-        self.stop_time = time.time()
+        deadline = self._start_recording()
+        try:
+            with mss.mss(with_cursor=False) as sct:
+                self.recording_lock.release()
+                last_raw = None  # raw pixels of the last recorded frame
+                while self.is_recording:
+                    capture_time = time.monotonic()
+                    screenshot = sct.grab(self.screen_region)
+                    if screenshot.raw == last_raw:
+                        assert self.current_frame is not None
+                        self._record_frame(
+                            self.current_frame,
+                            duplicate=True,
+                            capture_time=capture_time,
+                        )
+                    else:
+                        last_raw = screenshot.raw
+                        frame = cv2.cvtColor(np.array(screenshot), cv2.COLOR_BGRA2RGB)
+                        with self.recording_lock:
+                            self.current_frame = frame
+                        self._record_frame(frame, capture_time=capture_time)
+                    deadline = self._next_deadline(deadline)
+                    time.sleep(max(deadline - time.monotonic(), 0))
+        finally:
+            # also when capturing or encoding failed
+            self._finish_recording()
         # if not config.remote:
         #     self.window_manager.bring_to_front()
-        logger.info("Screen recorder stopped")
 
 
 class VNCRecorder(ScreenRecorder):
@@ -318,35 +667,66 @@ class VNCRecorder(ScreenRecorder):
             "width": self.vnc_streamer.video_width,
             "height": self.vnc_streamer.video_height,
         }
+        self.vnc_streamer.add_resize_callback(self._on_resize)
+
+    def _on_resize(self, width: int, height: int) -> None:
+        logger.info(f"Recording resized to {width}x{height}")
+        self.screen_region["width"] = width
+        self.screen_region["height"] = height
+
+    def _finish_recording(self) -> None:
+        # The streamer outlives the recorder, e.g. across the tasks of the GUI
+        self.vnc_streamer.remove_resize_callback(self._on_resize)
+        super()._finish_recording()
+
+    def get_current_frame(self, with_cursor: bool = False) -> np.ndarray:
+        if with_cursor:
+            frame = self.vnc_streamer.get_current_frame(with_cursor=True)
+            assert frame is not None, "VNC client is not connected"
+            return frame
+        return super().get_current_frame()
+
+    def _with_cursor(self, frame: np.ndarray) -> np.ndarray:
+        """Draws the cursor of the VNC server onto a copy of *frame*."""
+        cursor, pointer = self.vnc_streamer.get_cursor()
+        if cursor is None or pointer is None:
+            return frame
+        return composite_cursor(frame, cursor, *pointer)
 
     def _capture_screen(self):
         # if not config.remote:
         #     self.window_manager.send_to_background()
-        self.start_time = time.time()
-        logger.info("Screen recorder started")
+        next_slot = self._start_recording()  # when the next frame is recorded
         self.recording_lock.release()
-        last_capture_time = 0.0  # last saved frame capture time
-        last_frame_time = time.time()  # last frame capture time
-        while self.is_recording:
-            frame = self.vnc_streamer.get_current_frame()
-            assert frame is not None, "VNC client is not connected"
-            # add frame to buffer
-            with self.recording_lock:
-                self.current_frame = frame.copy()
-            current_frame_time = time.time()  # current frame capture time
-            # preserve the frame rate
-            if current_frame_time - last_capture_time > 1 / self.fps:
-                self.current_frame_id += 1
-                self.frame_buffer.add_frame(self.current_frame_id, frame)
-                last_capture_time = current_frame_time
-            if current_frame_time - last_frame_time > 1 / self.fps:
-                logger.warning("Frame rate is too high")
-            last_frame_time = current_frame_time
-        self.stop_time = time.time()
+        try:
+            last_seq = -1  # sequence number of the last recorded frame
+            while self.is_recording:
+                seq, frame = self.vnc_streamer.get_frame()
+                assert frame is not None, "VNC client is not connected"
+                # frames from the streamer are read-only, so none is copied
+                with self.recording_lock:
+                    self.current_frame = frame
+                if seq != last_seq:
+                    recorded = (
+                        self._with_cursor(frame) if config.video_with_cursor else frame
+                    )
+                self._record_frame(recorded, duplicate=seq == last_seq)
+                last_seq = seq
+
+                next_slot = self._next_deadline(next_slot)
+                # sleep until the next slot, keeping the current frame up to date
+                while self.is_recording:
+                    timeout = next_slot - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    if not self.vnc_streamer.wait_for_change(timeout, seq=seq):
+                        # timed out, or the streamer stopped
+                        time.sleep(max(next_slot - time.monotonic(), 0))
+                        break
+                    seq, frame = self.vnc_streamer.get_frame()
+                    with self.recording_lock:
+                        self.current_frame = frame
+        finally:
+            self._finish_recording()
         # if not config.remote:
         #     self.window_manager.bring_to_front()
-        logger.info(
-            f"Screen recorder stopped, "
-            f"captured {len(self.frame_buffer.get_frames(0))} frames "
-            f"in {self.stop_time - self.start_time} seconds"
-        )
@@ -0,0 +1,246 @@
+import bisect
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from agent_studio.config import Config
+
+logger = logging.getLogger(__name__)
+config = Config()
+
+
+def timestamps_path(video_path: str) -> str:
+    """Path of the timestamp sidecar of a variable frame rate video."""
+    return os.path.splitext(video_path)[0] + ".timestamps.txt"
+
+
+def write_timestamps(video_path: str, timestamps: list[float]) -> str:
+    """
+    Writes the presentation time in milliseconds of every frame in the video
+    to its sidecar, in the timecode v2 format understood by mkvmerge and
+    ffmpeg. Returns the path of the sidecar.
+    """
+    path = timestamps_path(video_path)
+    with open(path, "w") as f:
+        f.write("# timecode format v2\n")
+        f.writelines(f"{timestamp:.3f}\n" for timestamp in timestamps)
+    return path
+
+
+def segments_path(video_path: str) -> str:
+    """Directory holding the segments and the index of a segmented video."""
+    return os.path.splitext(video_path)[0]
+
+
+class VideoEncoder:
+    """
+    Encodes RGB frames into a video file on a background thread.
+
+    Frames are handed over through a bounded queue, so recording only blocks
+    when the encoder falls more than *queue_size* frames behind, and memory
+    use does not grow with the length of the recording. Frames whose size
+    differs from the video, e.g. after a desktop resize, are scaled to fit.
+
+    With *vfr*, only frames that changed are written, each with the frame id it
+    was recorded under, and their timestamps are saved to a sidecar when the
+    encoder is closed.
+
+    With *segment_frames*, the video is split into files of that many frames,
+    which are finalized as soon as they are full, so all but the last segment
+    survive a crash. The segments go to a directory named after the video,
+    together with an index.jsonl file. Each line of the index describes either
+    a finished segment, with its first frame id, frame count, time range and
+    size in bytes, or an agent step added with add_step(), with the frame id
+    recorded at the step and where that frame is in the segments.
+    """
+
+    def __init__(
+        self,
+        video_path: str,
+        fps: float,
+        width: int,
+        height: int,
+        queue_size: int | None = None,
+        vfr: bool = False,
+        segment_frames: int | None = None,
+    ) -> None:
+        self.video_path = video_path
+        self.fps = fps
+        self.vfr = vfr
+        self.segment_frames = segment_frames
+        self.timestamps: list[float] = []
+        self.size = (width, height)
+        self.frames: queue.Queue[np.ndarray | None] = queue.Queue(
+            maxsize=queue_size or config.video_queue_size
+        )
+        self.frame_count = 0
+        # frame id and capture time of every queued frame
+        self.frame_ids: list[int] = []
+        self.frame_times: list[float] = []
+        self.index_lock = threading.Lock()
+        self.step_count = 0
+        self.writer: cv2.VideoWriter | None = None
+        # why the encoder thread stopped early, if it did
+        self.error: Exception | None = None
+        self.thread = threading.Thread(
+            target=self._encode, name="Video Encoder", daemon=True
+        )
+
+    @property
+    def index_path(self) -> str | None:
+        if self.segment_frames is None:
+            return None
+        return os.path.join(segments_path(self.video_path), "index.jsonl")
+
+    def segment_path(self, segment: int) -> str:
+        if self.segment_frames is None:
+            return self.video_path
+        return os.path.join(
+            segments_path(self.video_path), f"segment_{segment:05d}.mp4"
+        )
+
+    def start(self) -> None:
+        output_dir = os.path.dirname(self.segment_path(0))
+        if output_dir != "":
+            os.makedirs(output_dir, exist_ok=True)
+        self._open_segment(0)
+        self.thread.start()
+
+    def write(
+        self,
+        frame: np.ndarray,
+        frame_id: int | None = None,
+        timestamp: float | None = None,
+    ) -> None:
+        """
+        Queues *frame*, blocking while the queue is full. *frame_id* defaults
+        to the number of frames written before, and *timestamp*, the capture
+        time, to now. Raises RuntimeError if the encoder is not running.
+        """
+        if not self.thread.is_alive():
+            raise RuntimeError(f"Video encoder is not running: {self.error}")
+        if frame_id is None:
+            frame_id = len(self.frame_ids)
+        with self.index_lock:
+            self.frame_ids.append(frame_id)
+            self.frame_times.append(time.time() if timestamp is None else timestamp)
+        self._put(frame)
+        if self.vfr:
+            self.timestamps.append(frame_id * 1000 / self.fps)
+
+    def add_step(self, timestamp: float) -> dict | None:
+        """
+        Indexes the agent step taken at *timestamp*, e.g. the timestamp that
+        BaseAgent.step_action records, under the last frame captured before it.
+        Returns the index entry, or None if the video is not segmented.
+        """
+        if self.segment_frames is None:
+            return None
+        with self.index_lock:
+            if len(self.frame_ids) == 0:
+                return None
+            position = max(bisect.bisect_right(self.frame_times, timestamp) - 1, 0)
+            entry = {
+                "type": "step",
+                "step": self.step_count,
+                "timestamp": timestamp,
+                "frame_id": self.frame_ids[position],
+                "segment": position // self.segment_frames,
+                "frame_index": position % self.segment_frames,
+            }
+            self.step_count += 1
+            self._append_index(entry)
+        return entry
+
+    def close(self) -> int:
+        """
+        Encodes the remaining frames and finalizes the file. Returns the number
+        of frames in the video.
+        """
+        if self.thread.is_alive():
+            try:
+                self._put(None)
+            except RuntimeError:
+                pass
+            self.thread.join()
+            if self.vfr:
+                write_timestamps(self.video_path, self.timestamps)
+        return self.frame_count
+
+    def _put(self, item: np.ndarray | None) -> None:
+        # waits for room in the queue only while the encoder thread runs
+        while True:
+            try:
+                self.frames.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                if not self.thread.is_alive():
+                    raise RuntimeError(f"Video encoder failed: {self.error}")
+
+    def _open_segment(self, segment: int) -> None:
+        path = self.segment_path(segment)
+        self.writer = cv2.VideoWriter(
+            path, cv2.VideoWriter.fourcc(*"mp4v"), self.fps, self.size
+        )
+        if not self.writer.isOpened():
+            raise RuntimeError(f"Failed to open {path} for writing")
+
+    def _finish_segment(self) -> None:
+        assert self.writer is not None and self.segment_frames is not None
+        self.writer.release()
+        self.writer = None
+        segment = (self.frame_count - 1) // self.segment_frames
+        first = segment * self.segment_frames
+        with self.index_lock:
+            self._append_index(
+                {
+                    "type": "segment",
+                    "segment": segment,
+                    "path": os.path.basename(self.segment_path(segment)),
+                    "first_frame_id": self.frame_ids[first],
+                    "last_frame_id": self.frame_ids[self.frame_count - 1],
+                    "frame_count": self.frame_count - first,
+                    "start_time": self.frame_times[first],
+                    "end_time": self.frame_times[self.frame_count - 1],
+                    "bytes": os.path.getsize(self.segment_path(segment)),
+                }
+            )
+
+    def _append_index(self, entry: dict) -> None:
+        assert self.index_path is not None
+        with open(self.index_path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def _encode(self) -> None:
+        assert self.writer is not None
+        try:
+            while (frame := self.frames.get()) is not None:
+                assert self.writer is not None
+                if (
+                    self.segment_frames is not None
+                    and self.frame_count > 0
+                    and self.frame_count % self.segment_frames == 0
+                ):
+                    self._finish_segment()
+                    self._open_segment(self.frame_count // self.segment_frames)
+                if (frame.shape[1], frame.shape[0]) != self.size:
+                    frame = cv2.resize(frame, self.size)
+                self.writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+                self.frame_count += 1
+        except Exception as e:
+            self.error = e
+            logger.error(f"Video encoder failed: {e}")
+        finally:
+            # no writer is left if the next segment failed to open
+            if self.writer is not None:
+                if self.segment_frames is not None and self.frame_count > 0:
+                    self._finish_segment()
+                else:
+                    self.writer.release()
+            logger.info(f"Encoded {self.frame_count} frames to {self.video_path}")
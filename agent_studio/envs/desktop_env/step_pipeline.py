@@ -0,0 +1,118 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Callable
+
+import numpy as np
+
+from agent_studio.agent.base_agent import BaseAgent
+from agent_studio.config import Config
+from agent_studio.envs.desktop_env.recorder.screen_recorder import (
+    ScreenRecorder,
+    VNCRecorder,
+)
+
+config = Config()
+logger = logging.getLogger(__name__)
+
+
+def sleep_interval() -> float:
+    """Waits the fixed config.minimal_action_interval after an action."""
+    time.sleep(config.minimal_action_interval)
+    return config.minimal_action_interval
+
+
+class StepPipeline:
+    """
+    Runs the steps of an episode, overlapping each action with preparing the
+    observation that follows it.
+
+    step() executes the pending action of the agent, and then waits for the
+    screen with *settle*, e.g. ScreenSettleDetector.wait, on a worker thread.
+    The seconds it waited are recorded as the settle_time of the step.
+    Meanwhile the calling thread turns every new frame of *screen_recorder*
+    into an observation, so the next generate_action() can start as soon as
+    the wait ends. No wait follows the last action of an episode.
+
+    Example::
+
+        pipeline = StepPipeline(agent, screen_recorder)
+        obs = pipeline.observe()
+        for _ in range(max_steps):
+            agent.generate_action(obs)
+            _, done, obs = pipeline.step(confirmed=True)
+            if done:
+                break
+        pipeline.close()
+    """
+
+    def __init__(
+        self,
+        agent: BaseAgent,
+        screen_recorder: ScreenRecorder | None,
+        settle: Callable[[], float] = sleep_interval,
+    ) -> None:
+        self.agent = agent
+        self.screen_recorder = screen_recorder
+        self.settle = settle
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="Agent Step"
+        )
+        self.observation: np.ndarray | None = None
+        # version of the screen the observation shows, None if unknown
+        self.observed_version: int | None = None
+
+    def observe(self) -> np.ndarray | None:
+        """Returns an observation of the current screen."""
+        self.observed_version = None
+        self._prepare()
+        return self.observation
+
+    def step(self, confirmed: bool) -> tuple[dict, bool, np.ndarray | None]:
+        """
+        Executes the pending action, and returns its result, whether the
+        episode is done, and the observation to generate the next action from.
+        """
+        future = self.executor.submit(self._execute, confirmed)
+        while True:
+            try:
+                result, done = future.result(timeout=1 / config.video_fps)
+                break
+            except FutureTimeoutError:
+                self._prepare(final=False)
+        if not done:
+            self._prepare()
+        return result, done, self.observation
+
+    def close(self) -> None:
+        self.executor.shutdown()
+
+    def _execute(self, confirmed: bool) -> tuple[dict, bool]:
+        result, done = self.agent.step_action(confirmed)
+        if self.screen_recorder is not None:
+            self.screen_recorder.add_step(self.agent.trajectory[-1]["timestamp"])
+        if not done:
+            self.agent.trajectory[-1]["settle_time"] = self.settle()
+        return result, done
+
+    def _screen_version(self) -> int | None:
+        # streamed frames count every change, including cursor moves
+        if isinstance(self.screen_recorder, VNCRecorder):
+            return self.screen_recorder.vnc_streamer.get_frame()[0]
+        return None
+
+    def _prepare(self, final: bool = True) -> None:
+        if self.screen_recorder is None:
+            return
+        version = self._screen_version()
+        if version is None:
+            # without versions, the observation is only prepared at the end
+            if not final:
+                return
+        elif version == self.observed_version:
+            return
+        self.observation = self.screen_recorder.get_current_frame(
+            with_cursor=config.obs_with_cursor
+        )
+        self.observed_version = version
@@ -1,15 +1,19 @@
 import asyncio
+import contextlib
 import logging
 import platform
 import threading
 import time
+import weakref
 from asyncio import StreamReader, StreamWriter, open_connection
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass, field
 from enum import Enum
 from fractions import Fraction
 from os import urandom
 from struct import unpack
-from typing import Callable
+from typing import Callable, Coroutine
 from zlib import decompressobj
 
 import cv2
@@ -18,10 +22,14 @@ import numpy as np
 from cryptography.hazmat.primitives.asymmetric import padding, rsa
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.primitives.serialization import load_der_public_key
-from PyQt6.QtCore import QPoint, QRect, QSize, Qt
-from PyQt6.QtGui import QColor, QCursor, QFont, QPainter, QPen, QPixmap
+from PyQt6.QtCore import QPoint, QRect, QRectF, QSize, Qt
+from PyQt6.QtGui import QColor, QCursor, QFont, QImage, QPainter, QPen, QPixmap
 from PyQt6.QtWidgets import QLabel
 
+from agent_studio.config import Config
+from agent_studio.envs.desktop_env.frame_bus import SharedFrameBus
+
+config = Config()
 logger = logging.getLogger(__name__)
 
 # Common screen aspect ratios
@@ -34,6 +42,44 @@ screen_ratios: set[Fraction] = {
     Fraction(64, 27),
 }
 
+# Encodings that can be negotiated with the server
+encoding_codes: dict[str, int] = {
+    "raw": 0,
+    "copyrect": 1,
+    "hextile": 5,
+    "zlib": 6,
+    "tight": 7,
+    "zrle": 16,
+    # Pseudo-encodings
+    "cursor": -239,
+    "pointer_pos": -232,
+    "desktop_size": -223,
+    "extended_desktop_size": -308,
+}
+
+#: A rectangle as (x, y, width, height)
+Rect = tuple[int, int, int, int]
+
+# Tight pseudo-encodings, offset by the requested level (0-9)
+TIGHT_COMPRESS_LEVEL_0 = -256
+TIGHT_JPEG_QUALITY_0 = -32
+
+# Tight compression control and filters
+TIGHT_FILL = 0x08
+TIGHT_JPEG = 0x09
+TIGHT_EXPLICIT_FILTER = 0x04
+TIGHT_FILTER_COPY = 0
+TIGHT_FILTER_PALETTE = 1
+TIGHT_FILTER_GRADIENT = 2
+TIGHT_MIN_TO_COMPRESS = 12
+
+# Hextile subencoding flags
+HEXTILE_RAW = 1
+HEXTILE_BACKGROUND_SPECIFIED = 2
+HEXTILE_FOREGROUND_SPECIFIED = 4
+HEXTILE_ANY_SUBRECTS = 8
+HEXTILE_SUBRECTS_COLOURED = 16
+
 # Colour channel orders
 video_modes: dict[bytes, str] = {
     b"\x20\x18\x00\x01\x00\xff\x00\xff\x00\xff\x10\x08\x00": "bgra",
@@ -43,7 +89,209 @@ video_modes: dict[bytes, str] = {
 }
 
 
-async def read_int(reader: StreamReader, length: int) -> int:
+def tight_gradient(data: np.ndarray) -> np.ndarray:
+    """
+    Reverses the Tight gradient filter on an (height, width, 3) array.
+
+    Each pixel only depends on its left, upper and upper-left neighbours, so
+    the pixels of an anti-diagonal are reconstructed together.
+    """
+
+    height, width = data.shape[:2]
+    # Padded with a zero row and column for the missing neighbours
+    pixels = np.zeros((height + 1, width + 1, 3), np.int16)
+    for diagonal in range(height + width - 1):
+        ys = np.arange(max(0, diagonal - width + 1), min(height, diagonal + 1))
+        xs = diagonal - ys
+        prediction = pixels[ys + 1, xs] + pixels[ys, xs + 1] - pixels[ys, xs]
+        pixels[ys + 1, xs + 1] = (np.clip(prediction, 0, 255) + data[ys, xs]) & 0xFF
+    return pixels[1:, 1:].astype(np.uint8)
+
+
+def unpack_indices(packed: np.ndarray, bits: int, width: int) -> np.ndarray:
+    """
+    Unpacks palette indices of *bits* bits each from rows of packed bytes.
+    """
+
+    if bits == 8:
+        return packed[:, :width]
+    unpacked = np.unpackbits(packed, axis=1)
+    if bits == 1:
+        return unpacked[:, :width]
+    weights = 1 << np.arange(bits - 1, -1, -1, dtype=np.uint8)
+    indices = unpacked.reshape(len(packed), -1, bits) @ weights
+    return indices[:, :width]
+
+
+def read_run_length(data: bytes, pos: int) -> tuple[int, int]:
+    """
+    Reads a ZRLE run length and returns it with the position after it.
+    """
+
+    length = 1
+    while True:
+        value = data[pos]
+        pos += 1
+        length += value
+        if value != 255:
+            return length, pos
+
+
+def paint_rects(
+    data: np.ndarray,
+    left: np.ndarray,
+    top: np.ndarray,
+    widths: np.ndarray,
+    heights: np.ndarray,
+    colours: np.ndarray,
+) -> None:
+    """
+    Fills many solid rectangles of *data* with one fancy-indexed assignment.
+
+    Every rectangle is expanded to its pixel coordinates, so the rectangles
+    are expected not to overlap (as is the case for Hextile subrectangles).
+    """
+
+    areas = widths * heights
+    index = np.repeat(np.arange(len(areas)), areas)
+    offsets = np.arange(len(index)) - np.repeat(np.cumsum(areas) - areas, areas)
+    rect_widths = widths[index]
+    data[
+        top[index] + offsets // rect_widths, left[index] + offsets % rect_widths
+    ] = colours[index]
+
+
+def merge_damage(rects: list[Rect], limit: int = 64) -> list[Rect]:
+    """
+    Drops duplicate rectangles and collapses them into their bounding box once
+    there are more than *limit* of them.
+    """
+    rects = list(dict.fromkeys(rects))
+    if len(rects) <= limit:
+        return rects
+    left = min(x for x, _, _, _ in rects)
+    top = min(y for _, y, _, _ in rects)
+    right = max(x + width for x, _, width, _ in rects)
+    bottom = max(y + height for _, y, _, height in rects)
+    return [(left, top, right - left, bottom - top)]
+
+
+def frame_difference(previous: np.ndarray | None, frame: np.ndarray) -> list[Rect]:
+    """
+    Returns the bounding box of the pixels that differ between two frames.
+    """
+    if previous is None or previous.shape != frame.shape:
+        return [(0, 0, frame.shape[1], frame.shape[0])]
+    changed = (previous != frame).any(axis=2)
+    rows = np.flatnonzero(changed.any(axis=1))
+    if len(rows) == 0:
+        return []
+    columns = np.flatnonzero(changed.any(axis=0))
+    left, top = int(columns[0]), int(rows[0])
+    return [(left, top, int(columns[-1]) + 1 - left, int(rows[-1]) + 1 - top)]
+
+
+def clip_region(
+    x: int, y: int, width: int, height: int, screen_width: int, screen_height: int
+) -> Rect:
+    """
+    Clips an area to the screen. Raises a ValueError if it lies outside of it.
+    """
+    left, top = max(x, 0), max(y, 0)
+    right, bottom = min(x + width, screen_width), min(y + height, screen_height)
+    if left >= right or top >= bottom:
+        raise ValueError(
+            f"Region {(x, y, width, height)} is outside of the "
+            f"{screen_width}x{screen_height} screen"
+        )
+    return left, top, right - left, bottom - top
+
+
+def composite_cursor(frame: np.ndarray, cursor: "Cursor", x: int, y: int) -> np.ndarray:
+    """
+    Returns a copy of an RGB or RGBA *frame* with the *cursor* drawn so that
+    its hotspot lies on (*x*, *y*).
+    """
+    frame = frame.copy()
+    height, width = cursor.image.shape[:2]
+    left, top = x - cursor.hotspot_x, y - cursor.hotspot_y
+    # Clip the cursor to the frame
+    x0, y0 = max(left, 0), max(top, 0)
+    x1 = min(left + width, frame.shape[1])
+    y1 = min(top + height, frame.shape[0])
+    if x0 >= x1 or y0 >= y1:
+        return frame
+    image = cursor.image[y0 - top : y1 - top, x0 - left : x1 - left]
+    mask = image[..., 3] != 0
+    frame[y0:y1, x0:x1][mask] = image[mask][:, : frame.shape[2]]
+    return frame
+
+
+class BufferedReader:
+    """
+    Read-ahead wrapper around a StreamReader.
+
+    Bytes are pulled from the socket in large chunks and kept in a local
+    buffer, so decoders of variable-length encodings can parse many small
+    fields synchronously and only await the socket when the buffer runs dry.
+    """
+
+    def __init__(self, reader: StreamReader, chunk_size: int = 1 << 16):
+        self.reader = reader
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+        self.pos = 0
+
+    def available(self) -> int:
+        """
+        Returns the number of buffered bytes that have not been consumed yet.
+        """
+
+        return len(self.buffer) - self.pos
+
+    async def fill(self, length: int) -> None:
+        """
+        Reads from the socket until at least *length* bytes are buffered.
+        """
+
+        if self.available() >= length:
+            return
+        if self.pos:
+            del self.buffer[: self.pos]
+            self.pos = 0
+        while len(self.buffer) < length:
+            data = await self.reader.read(
+                max(self.chunk_size, length - len(self.buffer))
+            )
+            if not data:
+                raise asyncio.IncompleteReadError(bytes(self.buffer), length)
+            self.buffer += data
+
+    def take(self, length: int) -> bytes:
+        """
+        Consumes *length* bytes that are already buffered.
+        """
+
+        data = bytes(self.buffer[self.pos : self.pos + length])
+        self.pos += length
+        return data
+
+    async def readexactly(self, length: int) -> bytes:
+        await self.fill(length)
+        return self.take(length)
+
+    async def read(self, length: int = -1) -> bytes:
+        if self.available():
+            if length < 0:
+                return self.take(self.available()) + await self.reader.read(-1)
+            return self.take(min(length, self.available()))
+        return await self.reader.read(length)
+
+    def feed_eof(self) -> None:
+        self.reader.feed_eof()
+
+
+async def read_int(reader: StreamReader | BufferedReader, length: int) -> int:
     """
     Reads, unpacks, and returns an integer of *length* bytes.
     """
@@ -51,7 +299,7 @@ async def read_int(reader: StreamReader, length: int) -> int:
     return int.from_bytes(await reader.readexactly(length), "big")
 
 
-async def read_text(reader: StreamReader, encoding: str) -> str:
+async def read_text(reader: StreamReader | BufferedReader, encoding: str) -> str:
     """
     Reads, unpacks, and returns length-prefixed text.
     """
@@ -61,7 +309,7 @@ async def read_text(reader: StreamReader, encoding: str) -> str:
     return data.decode(encoding)
 
 
-async def skip_to_eof(reader: StreamReader):
+async def skip_to_eof(reader: StreamReader | BufferedReader):
     logger.warn("[asyncvnc] skip to eof")
     await reader.read(-1)
 
@@ -143,9 +391,23 @@ class Screen:
         return value
 
 
+@dataclass
+class Cursor:
+    """
+    Cursor shape set by the server.
+    """
+
+    #: 3D numpy array of RGBA colour data, transparent outside the cursor mask.
+    image: np.ndarray = field(repr=False)
+
+    #: Position of the hotspot within the image.
+    hotspot_x: int
+    hotspot_y: int
+
+
 @dataclass
 class Video:
-    reader: StreamReader = field(repr=False)
+    reader: BufferedReader = field(repr=False)
     writer: StreamWriter = field(repr=False)
     decompress: Callable[[bytes], bytes] = field(repr=False)
 
@@ -164,15 +426,48 @@ class Video:
     #: 3D numpy array of colour data.
     data: np.ndarray | None = None
 
+    #: The four zlib streams of the Tight encoding.
+    tight_streams: list = field(
+        default_factory=lambda: [decompressobj() for _ in range(4)], repr=False
+    )
+
+    #: The zlib stream of the ZRLE encoding.
+    zrle_decompress: Callable[[bytes], bytes] = field(
+        default_factory=lambda: decompressobj().decompress, repr=False
+    )
+
+    #: Called with the new width and height when the desktop is resized.
+    resize_callbacks: list[Callable[[int, int], None]] = field(
+        default_factory=list, repr=False
+    )
+
+    #: Set when the desktop was resized and the buffer needs a full update.
+    resized: bool = False
+
+    #: The cursor shape, kept apart from the video buffer.
+    cursor: Cursor | None = None
+
+    #: Pointer position reported by the server.
+    pointer: tuple[int, int] | None = None
+
+    #: Rectangles of the video buffer updated since the list was last cleared.
+    damage: list[Rect] = field(default_factory=list, repr=False)
+
+    #: Areas covered by the cursor before and after it changed shape or moved.
+    cursor_damage: list[Rect] = field(default_factory=list, repr=False)
+
     # bytes per pixel
     bypp = 4
 
-    _switch_to_rre = False
-
     now_encoding: str | None = None
 
     @classmethod
-    async def create(cls, reader: StreamReader, writer: StreamWriter) -> "Video":
+    async def create(
+        cls,
+        reader: BufferedReader,
+        writer: StreamWriter,
+        encodings: list[str] | None = None,
+    ) -> "Video":
         writer.write(b"\x01")
         width = await read_int(reader, 2)
         height = await read_int(reader, 2)
@@ -191,17 +486,20 @@ class Video:
                 b"\x00\xff\x00\xff\x00\x08\x10\x00\x00\x00"
             )
 
-        compress_code = [
-            b"\x00\x00\x00\x05",  # Hextile
-            b"\x00\x00\x00\x06",  # ZLib
-            b"\x00\x00\x00\x00",  # raw
-        ]
-        compress_code_num = len(compress_code)
-        compress_code_num_bytes = compress_code_num.to_bytes(2, "big")
-        compress_code_send_message = (
-            b"\x02\x00" + compress_code_num_bytes + b"".join(compress_code)
+        if encodings is None:
+            encodings = config.vnc_encodings
+        codes = [encoding_codes[encoding] for encoding in encodings]
+        if "tight" in encodings:
+            if config.vnc_compress_level is not None:
+                codes.append(TIGHT_COMPRESS_LEVEL_0 + config.vnc_compress_level)
+            # JPEG sub-rectangles are only sent once a quality level is set
+            if config.vnc_jpeg_quality is not None:
+                codes.append(TIGHT_JPEG_QUALITY_0 + config.vnc_jpeg_quality)
+        writer.write(
+            b"\x02\x00"
+            + len(codes).to_bytes(2, "big")
+            + b"".join(code.to_bytes(4, "big", signed=True) for code in codes)
         )
-        writer.write(compress_code_send_message)
 
         decompress = decompressobj().decompress
         return cls(reader, writer, decompress, name, width, height, mode)
@@ -212,15 +510,21 @@ class Video:
         y: int = 0,
         width: int | None = None,
         height: int | None = None,
+        incremental: bool | None = None,
     ):
         """
         Sends a video buffer update request to the server.
+
+        An incremental request is only answered once something has changed in
+        the requested area, and only the changed rectangles are sent. By default
+        the request is incremental whenever a video buffer already exists.
         """
-        incremental = self.data is not None
+        if incremental is None:
+            incremental = self.data is not None
         if width is None:
-            width = self.width
+            width = self.width - x
         if height is None:
-            height = self.height
+            height = self.height - y
         self.writer.write(
             b"\x03"
             + incremental.to_bytes(1, "big")
@@ -249,84 +553,47 @@ class Video:
             ] = np.frombuffer(color, dtype="B").reshape(1, 1, 4)
             pos += sz
 
-    def _handle_decode_hextile(self, block, bg, color, x, y, width, height, tx, ty):
-        """
-        # Hextile Decoding
-        :param block:
-        :param bg:
-        :param color:
-        :param x:
-        :param y:
-        :param width:
-        :param height:
-        :param tx:
-        :param ty:
-        :return:
-        """
-        (sub_encoding,) = unpack("!B", block)
-        # calc tile size
-        tw = th = 16
-        if x + width - tx < 16:
-            tw = x + width - tx
-
-        if y + height - ty < 16:
-            th = y + height - ty
-
-        # decode tile
-        if sub_encoding & 1:  # RAW
-            self.expect(
-                self._handle_decode_hextile_raw,
-                tw * th * self.bypp,
-                bg,
-                color,
-                x,
-                y,
-                width,
-                height,
-                tx,
-                ty,
-                tw,
-                th,
-            )
-        else:
-            num_bytes = 0
-            if sub_encoding & 2:  # BackgroundSpecified
-                num_bytes += self.bypp
-            if sub_encoding & 4:  # ForegroundSpecified
-                num_bytes += self.bypp
-            if sub_encoding & 8:  # AnySubrects
-                num_bytes += 1
-            if num_bytes:
-                self.expect(
-                    self._handle_decode_hextile_subrect,
-                    num_bytes,
-                    sub_encoding,
-                    bg,
-                    color,
-                    x,
-                    y,
-                    width,
-                    height,
-                    tx,
-                    ty,
-                    tw,
-                    th,
-                )
-            else:
-                self.fill_rectangle(tx, ty, tw, th, bg)
-                self._do_next_hextile_subrect(bg, color, x, y, width, height, tx, ty)
-
     # @profile
     async def read(self):
         if self.data is None:
             self.data = np.zeros((self.height, self.width, 4), "B")
 
-        info = await self.reader.read(12)
-        x, y, width, height, encoding = unpack("!HHHHI", info)
+        info = await self.reader.readexactly(12)
+        x, y, width, height, encoding = unpack("!HHHHi", info)
         # print(f"x: {x}, y: {y}, width: {width}, height: {height}")
         # print("encoding: ", encoding)
 
-        if encoding == 0:  # Raw
+        if encoding == 1:  # CopyRect
+            self.now_encoding = "CopyRect"
+            src_x, src_y = unpack("!HH", await self.reader.readexactly(4))
+            # NumPy copies through a temporary buffer when the areas overlap
+            self.data[y : y + height, x : x + width] = self.data[
+                src_y : src_y + height, src_x : src_x + width
+            ]
+
+        elif encoding == -239:  # Cursor
+            self._add_cursor_damage()
+            await self._read_cursor(x, y, width, height)
+            self._add_cursor_damage()
+
+        elif encoding == -232:  # PointerPos
+            self._add_cursor_damage()
+            self.pointer = (x, y)
+            self._add_cursor_damage()
+
+        elif encoding == -223:  # DesktopSize
+            self.resize(width, height)
+
+        elif encoding == -308:  # ExtendedDesktopSize
+            screens = await read_int(self.reader, 1)
+            await self.reader.readexactly(3 + 16 * screens)  # padding and screens
+            # x is the reason of the change and y its status
+            if y != 0:
+                logger.warning(f"Desktop resize request failed with status {y}")
+            if (width, height) != (self.width, self.height):
+                self.resize(width, height)
+
+        elif encoding == 0:  # Raw
             self.now_encoding = "Raw"
             data = await self.reader.readexactly(height * width * 4)
             self.data[y : y + height, x : x + width] = np.frombuffer(
@@ -338,85 +605,7 @@ class Video:
 
         elif encoding == 5:  # Hextile
             self.now_encoding = "Hextile"
-            raw = 1
-            backgroundSpecified = 2
-            foregroundSpecified = 4
-            anySubrects = 8
-            subrectsColoured = 16
-            background: np.ndarray | None = None
-
-            for ty in range(y, y + height, 16):
-                for tx in range(x, x + width, 16):
-                    tw = th = 16
-                    if tw + tx > self.width:
-                        tw = self.width - tx
-                    if th + ty > self.height:
-                        th = self.height - ty
-
-                    subencoding = await self.reader.read(1)
-                    subencoding = unpack("!B", subencoding)[0]
-
-                    if subencoding & raw:
-                        data = await self.reader.readexactly(th * tw * 4)
-                        self.data[ty : ty + th, tx : tx + tw] = np.frombuffer(
-                            data, dtype="B"
-                        ).reshape(th, tw, 4)
-                    else:
-                        if subencoding == 0:
-                            self.data[ty : ty + th, tx : tx + tw] = background
-                            continue
-
-                        if subencoding & backgroundSpecified:
-                            background = await self.reader.readexactly(4)
-                            background = np.frombuffer(background, dtype="B").reshape(
-                                1, 1, 4
-                            )
-
-                        if subencoding & foregroundSpecified:
-                            foreground = await self.reader.readexactly(4)
-                            foreground = np.frombuffer(foreground, dtype="B").reshape(
-                                1, 1, 4
-                            )
-
-                        self.data[ty : ty + th, tx : tx + tw] = background
-
-                        if subencoding & anySubrects:
-                            num_subrects = await self.reader.read(1)
-                            num_subrects = unpack("!B", num_subrects)[0]
-                            # Define the size of each subrect, colored subrects have additional 4 bytes for the color  # noqa: E501
-                            subrect_size = (
-                                4 + 2 if subencoding & subrectsColoured else 2
-                            )
-                            subrects_data = await self.reader.readexactly(
-                                num_subrects * subrect_size
-                            )
-                            subrects_data = np.frombuffer(subrects_data, dtype="B")
-
-                            for i in range(num_subrects):
-                                xywh_offset = 0
-                                if subencoding & subrectsColoured:
-                                    foreground = subrects_data[
-                                        i * subrect_size : i * subrect_size + 4
-                                    ].reshape(1, 1, 4)
-                                    xywh_offset = 4
-
-                                xywh = subrects_data[
-                                    i * subrect_size
-                                    + xywh_offset : i * subrect_size
-                                    + xywh_offset
-                                    + 2
-                                ]
-                                xywh = unpack("!H", xywh.tobytes())[0]
-                                sx = xywh >> 12
-                                sy = (xywh >> 8) & 0x0F
-                                sw = (xywh >> 4) & 0x0F
-                                sh = xywh & 0x0F
-                                self.data[
-                                    ty + sy : ty + sy + sh + 1,
-                                    tx + sx : tx + sx + sw + 1,
-                                ] = foreground
-
-            self.data[:, :, self.mode.index("a")] = 255
+            await self._read_hextile(x, y, width, height)
 
         elif encoding == 6:  # ZLib
             self.now_encoding = "ZLib"
@@ -428,65 +617,438 @@ class Video:
             ).reshape(height, width, 4)
             self.data[y : y + height, x : x + width, self.mode.index("a")] = 255
 
-    async def _read_set_cursor(self, x, y, width, height):
-        # Calculate the length of data and mask
-        data_len = width * height * 4  # assuming bpp/8 = 4
-        mask_len = ((width + 7) // 8) * height
+        elif encoding == 7:  # Tight
+            self.now_encoding = "Tight"
+            await self._read_tight(x, y, width, height)
+
+        elif encoding == 16:  # ZRLE
+            self.now_encoding = "ZRLE"
+            await self._read_zrle(x, y, width, height)
+
+        if encoding >= 0:  # pseudo-encodings are negative
+            self.damage.append((x, y, width, height))
+
+    def resize(self, width: int, height: int):
+        """
+        Reallocates the video buffer after the server changed the desktop size.
+        """
+        logger.info(f"Desktop resized to {width}x{height}")
+        self.width = width
+        self.height = height
+        self.data = np.zeros((height, width, 4), "B")
+        self.damage = [(0, 0, width, height)]
+        self.resized = True
+        for callback in self.resize_callbacks:
+            callback(width, height)
+
+    @property
+    def rgb_index(self) -> list[int]:
+        """
+        Positions of the red, green and blue bytes within a pixel.
+        """
+
+        return [self.mode.index("r"), self.mode.index("g"), self.mode.index("b")]
+
+    @property
+    def cpixel_index(self) -> list[int]:
+        """
+        Positions of the three significant bytes of a pixel, which make up the
+        compressed pixels (CPIXEL) of ZRLE.
+        """
+
+        return [i for i in range(self.bypp) if i != self.mode.index("a")]
+
+    async def _read_compact_length(self) -> int:
+        length = 0
+        for shift in (0, 7, 14):
+            (value,) = await self.reader.readexactly(1)
+            length |= (value & 0x7F) << shift
+            if not value & 0x80:
+                break
+        return length
+
+    async def _read_tight(self, x: int, y: int, width: int, height: int):
+        """
+        Decodes a Tight rectangle straight into the video buffer.
+        """
+        (control,) = await self.reader.readexactly(1)
+        for stream in range(4):
+            if control & (1 << stream):
+                self.tight_streams[stream] = decompressobj()
+        control >>= 4
+        region = self.data[y : y + height, x : x + width]
+
+        if control == TIGHT_FILL:
+            colour = await self.reader.readexactly(3)
+            region[..., self.rgb_index] = np.frombuffer(colour, "B")
+
+        elif control == TIGHT_JPEG:
+            jpeg = await self.reader.readexactly(await self._read_compact_length())
+            image = cv2.imdecode(np.frombuffer(jpeg, "B"), cv2.IMREAD_COLOR)
+            region[..., self.rgb_index] = image[..., ::-1]
+
+        elif control < TIGHT_FILL:  # Basic compression
+            filter_id = TIGHT_FILTER_COPY
+            if control & TIGHT_EXPLICIT_FILTER:
+                (filter_id,) = await self.reader.readexactly(1)
+            if filter_id == TIGHT_FILTER_PALETTE:
+                colours = await read_int(self.reader, 1) + 1
+                palette = np.frombuffer(
+                    await self.reader.readexactly(colours * 3), "B"
+                ).reshape(colours, 3)
+                row_bytes = (width + 7) // 8 if colours == 2 else width
+                length = row_bytes * height
+            elif filter_id in (TIGHT_FILTER_COPY, TIGHT_FILTER_GRADIENT):
+                length = width * height * 3
+            else:
+                raise ValueError(f"Invalid Tight filter: {filter_id}")
+
+            if length < TIGHT_MIN_TO_COMPRESS:
+                data = await self.reader.readexactly(length)
+            else:
+                compressed = await self.reader.readexactly(
+                    await self._read_compact_length()
+                )
+                data = self.tight_streams[control & 0x03].decompress(compressed)
+
+            if filter_id == TIGHT_FILTER_PALETTE:
+                packed = np.frombuffer(data, "B").reshape(height, row_bytes)
+                indices = unpack_indices(packed, 1 if colours == 2 else 8, width)
+                region[..., self.rgb_index] = palette[indices]
+            elif filter_id == TIGHT_FILTER_GRADIENT:
+                region[..., self.rgb_index] = tight_gradient(
+                    np.frombuffer(data, "B").reshape(height, width, 3)
+                )
+            else:
+                region[..., self.rgb_index] = np.frombuffer(data, "B").reshape(
+                    height, width, 3
+                )
+
+        else:
+            raise ValueError(f"Invalid Tight compression control: {control}")
+
+        region[..., self.mode.index("a")] = 255
 
-        # Read data and mask from the reader
-        data = await self.reader.readexactly(data_len)
-        mask = await self.reader.readexactly(mask_len)
+    async def _read_zrle(self, x: int, y: int, width: int, height: int):
+        """
+        Decodes a ZRLE rectangle straight into the video buffer.
+        """
+        length = await read_int(self.reader, 4)
+        data = self.zrle_decompress(await self.reader.readexactly(length))
+        region = self.data[y : y + height, x : x + width]
+        cpixel = self.cpixel_index
+        pos = 0
+        for ty in range(0, height, 64):
+            th = min(64, height - ty)
+            for tx in range(0, width, 64):
+                tw = min(64, width - tx)
+                tile = region[ty : ty + th, tx : tx + tw]
+                subencoding = data[pos]
+                pos += 1
+
+                if subencoding == 0:  # Raw
+                    pixels = np.frombuffer(data, "B", tw * th * 3, pos)
+                    tile[..., cpixel] = pixels.reshape(th, tw, 3)
+                    pos += tw * th * 3
+
+                elif subencoding == 1:  # Solid
+                    tile[..., cpixel] = np.frombuffer(data, "B", 3, pos)
+                    pos += 3
+
+                elif subencoding <= 16:  # Packed palette
+                    palette = np.frombuffer(data, "B", subencoding * 3, pos)
+                    pos += subencoding * 3
+                    bits = 1 if subencoding == 2 else 2 if subencoding <= 4 else 4
+                    row_bytes = (tw * bits + 7) // 8
+                    packed = np.frombuffer(data, "B", row_bytes * th, pos)
+                    pos += row_bytes * th
+                    indices = unpack_indices(packed.reshape(th, row_bytes), bits, tw)
+                    tile[..., cpixel] = palette.reshape(-1, 3)[indices]
+
+                elif subencoding == 128:  # Plain RLE
+                    colours, runs = [], []
+                    count = 0
+                    while count < tw * th:
+                        colours.append(data[pos : pos + 3])
+                        run, pos = read_run_length(data, pos + 3)
+                        runs.append(run)
+                        count += run
+                    pixels = np.frombuffer(b"".join(colours), "B").reshape(-1, 3)
+                    tile[..., cpixel] = np.repeat(pixels, runs, axis=0).reshape(
+                        th, tw, 3
+                    )
+
+                elif subencoding >= 130:  # Palette RLE
+                    palette = np.frombuffer(data, "B", (subencoding - 128) * 3, pos)
+                    pos += (subencoding - 128) * 3
+                    indices, runs = [], []
+                    count = 0
+                    while count < tw * th:
+                        index = data[pos]
+                        pos += 1
+                        run = 1
+                        if index & 0x80:
+                            run, pos = read_run_length(data, pos)
+                        indices.append(index & 0x7F)
+                        runs.append(run)
+                        count += run
+                    tile[..., cpixel] = palette.reshape(-1, 3)[
+                        np.repeat(indices, runs)
+                    ].reshape(th, tw, 3)
 
-        # Convert data and mask to numpy arrays
-        data = np.frombuffer(data, dtype=np.uint8).reshape((height, width, 4))
-        mask = np.frombuffer(mask, dtype=np.uint8).reshape((height, (width + 7) // 8))
+                else:
+                    raise ValueError(f"Invalid ZRLE subencoding: {subencoding}")
 
-        # Prepare the output buffer
-        buf = np.zeros((height, width, 4), dtype=np.uint8)
+        region[..., self.mode.index("a")] = 255
 
-        # Process the data and mask
-        for y in range(height):
-            for x in range(width):
-                byte_ = y * ((width + 7) // 8) + x // 8
-                bit = 7 - x % 8
+    async def _read_hextile(self, x: int, y: int, width: int, height: int):
+        """
+        Decodes a Hextile rectangle.
 
-                # Set alpha channel
-                if mask[byte_] & (1 << bit):
-                    buf[y, x, 3] = 255
+        Tiles are parsed straight from the read-ahead buffer, and the socket is
+        only awaited when the next tile is not fully buffered. Backgrounds are
+        filled once per run of neighbouring tiles that share a colour, and all
+        subrectangles of the rectangle are painted in one vectorized assignment.
+        """
+        reader = self.reader
+        background = foreground = bytes(self.bypp)
+        fills: list[tuple[int, int, int, int, bytes]] = []
+        raw_tiles: list[tuple[int, int, int, int, bytes]] = []
+        # (tile x, tile y, subrect count, foreground or None, subrect data)
+        subrect_tiles: list[tuple[int, int, int, bytes | None, bytes]] = []
+
+        for ty in range(y, y + height, 16):
+            th = min(16, y + height - ty)
+            run_x = run_end = x
+            run_colour: bytes | None = None
+            for tx in range(x, x + width, 16):
+                tw = min(16, x + width - tx)
+                if not reader.available():
+                    await reader.fill(1)
+                (subencoding,) = reader.take(1)
+
+                if subencoding & HEXTILE_RAW:
+                    length = tw * th * self.bypp
+                    if reader.available() < length:
+                        await reader.fill(length)
+                    raw_tiles.append((tx, ty, tw, th, reader.take(length)))
+                    if run_colour is not None:
+                        fills.append((run_x, ty, run_end - run_x, th, run_colour))
+                        run_colour = None
+                    continue
+
+                length = 0
+                if subencoding & HEXTILE_BACKGROUND_SPECIFIED:
+                    length += self.bypp
+                if subencoding & HEXTILE_FOREGROUND_SPECIFIED:
+                    length += self.bypp
+                if subencoding & HEXTILE_ANY_SUBRECTS:
+                    length += 1
+                if reader.available() < length:
+                    await reader.fill(length)
+                if subencoding & HEXTILE_BACKGROUND_SPECIFIED:
+                    background = reader.take(self.bypp)
+                if subencoding & HEXTILE_FOREGROUND_SPECIFIED:
+                    foreground = reader.take(self.bypp)
+
+                # Extend the current background run or start a new one
+                if run_colour == background and run_end == tx:
+                    run_end = tx + tw
                 else:
-                    buf[y, x, 3] = 0
+                    if run_colour is not None:
+                        fills.append((run_x, ty, run_end - run_x, th, run_colour))
+                    run_x, run_end, run_colour = tx, tx + tw, background
+
+                if subencoding & HEXTILE_ANY_SUBRECTS:
+                    (count,) = reader.take(1)
+                    coloured = subencoding & HEXTILE_SUBRECTS_COLOURED
+                    length = count * (self.bypp + 2 if coloured else 2)
+                    if reader.available() < length:
+                        await reader.fill(length)
+                    subrect_tiles.append(
+                        (
+                            tx,
+                            ty,
+                            count,
+                            None if coloured else foreground,
+                            reader.take(length),
+                        )
+                    )
+            if run_colour is not None:
+                fills.append((run_x, ty, run_end - run_x, th, run_colour))
+
+        for fx, fy, fw, fh, colour in fills:
+            self.data[fy : fy + fh, fx : fx + fw] = np.frombuffer(colour, "B")
+        for rx, ry, rw, rh, data in raw_tiles:
+            self.data[ry : ry + rh, rx : rx + rw] = np.frombuffer(data, "B").reshape(
+                rh, rw, self.bypp
+            )
+        if subrect_tiles:
+            self._paint_hextile_subrects(subrect_tiles)
+        self.data[y : y + height, x : x + width, self.mode.index("a")] = 255
+
+    def _paint_hextile_subrects(
+        self, subrect_tiles: list[tuple[int, int, int, bytes | None, bytes]]
+    ):
+        """
+        Paints the subrectangles of all Hextile tiles of a rectangle at once.
+        """
+        mono = [tile for tile in subrect_tiles if tile[3] is not None]
+        coloured = [tile for tile in subrect_tiles if tile[3] is None]
+        origins_x, origins_y, geometries, colours = [], [], [], []
+        if mono:
+            counts = np.array([tile[2] for tile in mono])
+            origins_x.append(np.repeat([tile[0] for tile in mono], counts))
+            origins_y.append(np.repeat([tile[1] for tile in mono], counts))
+            geometries.append(
+                np.frombuffer(b"".join(tile[4] for tile in mono), "B").reshape(-1, 2)
+            )
+            foregrounds = np.frombuffer(b"".join(tile[3] for tile in mono), "B")
+            colours.append(
+                np.repeat(foregrounds.reshape(-1, self.bypp), counts, axis=0)
+            )
+        if coloured:
+            counts = np.array([tile[2] for tile in coloured])
+            origins_x.append(np.repeat([tile[0] for tile in coloured], counts))
+            origins_y.append(np.repeat([tile[1] for tile in coloured], counts))
+            subrects = np.frombuffer(
+                b"".join(tile[4] for tile in coloured), "B"
+            ).reshape(-1, self.bypp + 2)
+            geometries.append(subrects[:, self.bypp :])
+            colours.append(subrects[:, : self.bypp])
+
+        geometry = np.concatenate(geometries).astype(np.intp)
+        left = np.concatenate(origins_x).astype(np.intp) + (geometry[:, 0] >> 4)
+        top = np.concatenate(origins_y).astype(np.intp) + (geometry[:, 0] & 0x0F)
+        widths = (geometry[:, 1] >> 4) + 1
+        heights = (geometry[:, 1] & 0x0F) + 1
+        paint_rects(self.data, left, top, widths, heights, np.concatenate(colours))
+
+    async def _read_cursor(self, x: int, y: int, width: int, height: int):
+        """
+        Reads a cursor shape, with *x* and *y* being its hotspot.
+        """
+        if width == 0 or height == 0:  # hidden cursor
+            self.cursor = None
+            return
+        row_bytes = (width + 7) // 8
+        pixels = np.frombuffer(
+            await self.reader.readexactly(width * height * self.bypp), "B"
+        ).reshape(height, width, self.bypp)
+        mask = np.frombuffer(
+            await self.reader.readexactly(row_bytes * height), "B"
+        ).reshape(height, row_bytes)
+
+        image = np.empty((height, width, 4), "B")
+        image[..., :3] = pixels[..., self.rgb_index]
+        image[..., 3] = np.unpackbits(mask, axis=1)[:, :width] * 255
+        self.cursor = Cursor(image, x, y)
+
+    def _add_cursor_damage(self):
+        if self.cursor is None or self.pointer is None:
+            return
+        height, width = self.cursor.image.shape[:2]
+        left = max(self.pointer[0] - self.cursor.hotspot_x, 0)
+        top = max(self.pointer[1] - self.cursor.hotspot_y, 0)
+        self.cursor_damage.append((left, top, width, height))
+
+    def as_rgba(self, with_cursor: bool = False) -> np.ndarray:
+        """
+        Returns the video buffer as a 3D RGBA array, optionally with the cursor
+        drawn onto a copy of it.
+        """
 
-                # Set color channels
-                self.data[y, x, :3] = data[y, x, :3]
+        rgba = self._as_rgba()
+        if with_cursor and self.cursor is not None and self.pointer is not None:
+            return composite_cursor(rgba, self.cursor, *self.pointer)
+        return rgba
 
-    def as_rgba(self) -> np.ndarray:
+    def as_rgb(self, out: np.ndarray | None = None) -> np.ndarray:
         """
-        Returns the video buffer as a 3D RGBA array.
+        Converts the video buffer to a 3D RGB array, written to *out* if given.
         """
+        if out is None:
+            out = np.empty((self.height, self.width, 3), "B")
+        if self.data is None:
+            out[...] = 0
+        elif self.mode == "rgba":
+            cv2.cvtColor(self.data, cv2.COLOR_RGBA2RGB, dst=out)
+        elif self.mode == "bgra":
+            cv2.cvtColor(self.data, cv2.COLOR_BGRA2RGB, dst=out)
+        else:
+            r, g, b = self.rgb_index
+            cv2.mixChannels([self.data], [out], [r, 0, g, 1, b, 2])
+        return out
 
+    def region_as_rgba(
+        self, x: int, y: int, width: int, height: int, with_cursor: bool = False
+    ) -> np.ndarray:
+        """
+        Returns a copy of an area of the video buffer as a 3D RGBA array,
+        optionally with the cursor drawn onto it. Only the area is converted.
+        """
+        region = self._as_rgba(x, y, width, height)
+        if with_cursor and self.cursor is not None and self.pointer is not None:
+            return composite_cursor(
+                region, self.cursor, self.pointer[0] - x, self.pointer[1] - y
+            )
+        if self.data is not None and np.may_share_memory(region, self.data):
+            return region.copy()
+        return region
+
+    def _as_rgba(
+        self,
+        x: int = 0,
+        y: int = 0,
+        width: int | None = None,
+        height: int | None = None,
+    ) -> np.ndarray:
+        width = self.width - x if width is None else width
+        height = self.height - y if height is None else height
         if self.data is None:
-            return np.zeros((self.height, self.width, 4), "B")
+            return np.zeros((height, width, 4), "B")
+        data = self.data[y : y + height, x : x + width]
         if self.mode == "rgba":
-            return self.data
+            return data
         if self.mode == "abgr":
-            return self.data[:, :, ::-1]
+            return data[:, :, ::-1]
         return np.dstack(
             (
-                self.data[:, :, self.mode.index("r")],
-                self.data[:, :, self.mode.index("g")],
-                self.data[:, :, self.mode.index("b")],
-                self.data[:, :, self.mode.index("a")],
+                data[:, :, self.mode.index("r")],
+                data[:, :, self.mode.index("g")],
+                data[:, :, self.mode.index("b")],
+                data[:, :, self.mode.index("a")],
             )
         )
 
-    def is_complete(self):
+    def is_complete(
+        self,
+        x: int = 0,
+        y: int = 0,
+        width: int | None = None,
+        height: int | None = None,
+    ):
         """
-        Returns true if the video buffer is entirely opaque.
+        Returns true if the given area of the video buffer, by default all of
+        it, is entirely opaque.
         """
 
         if self.data is None:
             return False
-        return self.data[:, :, self.mode.index("a")].all()
+        if width is None:
+            width = self.width
+        if height is None:
+            height = self.height
+        return self.data[y : y + height, x : x + width, self.mode.index("a")].all()
+
+    def invalidate(self, x: int, y: int, width: int, height: int):
+        """
+        Makes an area of the video buffer transparent, so that it is only
+        complete again once the server sent it anew.
+        """
+        if self.data is None:
+            self.data = np.zeros((self.height, self.width, 4), "B")
+        self.data[y : y + height, x : x + width, self.mode.index("a")] = 0
 
 
 class UpdateType(Enum):
@@ -503,7 +1065,7 @@ class UpdateType(Enum):
 
 @dataclass
 class VNCClient:
-    reader: StreamReader = field(repr=False)
+    reader: BufferedReader = field(repr=False)
     writer: StreamWriter = field(repr=False)
 
     #: The shared clipboard.
@@ -576,6 +1138,7 @@ class VNCClient:
 
         auth_result = await read_int(reader, 4)
         if auth_result == 0:
+            reader = BufferedReader(reader)
             return cls(
                 reader=reader,
                 writer=writer,
@@ -622,14 +1185,72 @@ class VNCClient:
         y: int = 0,
         width: int | None = None,
         height: int | None = None,
+        incremental: bool = False,
+        with_cursor: bool = False,
     ) -> np.ndarray:
-        self.video.data = None
-        self.video.refresh(x, y, width, height)
+        """
+        Requests a video update and returns the video buffer once it is complete.
+
+        With *incremental* set, the existing video buffer is kept and only the
+        rectangles that changed since the last update are transferred and
+        decoded. The call then blocks until the server reports a change.
+        With *with_cursor* set, the cursor is drawn onto a copy of the buffer.
+
+        If an area is given, only that area is requested and waited for.
+        """
+        await self.update(x, y, width, height, incremental)
+        return self.video.as_rgba(with_cursor)
+
+    async def update(
+        self,
+        x: int = 0,
+        y: int = 0,
+        width: int | None = None,
+        height: int | None = None,
+        incremental: bool = False,
+    ) -> None:
+        """
+        Requests a video update like *screenshot*, but leaves the video buffer
+        in the pixel format of the server instead of converting it.
+        """
+        region = x, y, width, height
+        if not incremental:
+            if width is None and height is None and x == 0 and y == 0:
+                self.video.data = None
+            else:
+                self.video.invalidate(
+                    x,
+                    y,
+                    self.video.width - x if width is None else width,
+                    self.video.height - y if height is None else height,
+                )
+        # The first update is a full one, even if an incremental one was asked for
+        self.video.refresh(
+            *region, incremental=incremental and self.video.data is not None
+        )
         while True:
             update_type = await self.read()
             if update_type is UpdateType.VIDEO:
-                if self.video.is_complete():
-                    return self.video.as_rgba()
+                if self.video.resized:
+                    # The new buffer is empty, so ask for all of it
+                    self.video.resized = False
+                    self.video.refresh(*region, incremental=False)
+                elif self.video.is_complete(*region):
+                    return
+
+    async def capture_region(
+        self, x: int, y: int, width: int, height: int, with_cursor: bool = False
+    ) -> np.ndarray:
+        """
+        Requests a fresh copy of an area of the screen from the server and
+        returns it as a 3D RGBA array once the area is complete. The area is
+        clipped to the screen, and a ValueError is raised if it lies outside.
+        """
+        x, y, width, height = clip_region(
+            x, y, width, height, self.video.width, self.video.height
+        )
+        await self.update(x, y, width, height, incremental=False)
+        return self.video.region_as_rgba(x, y, width, height, with_cursor)
 
     async def disconnect(self) -> None:
         self.reader.feed_eof()
@@ -650,6 +1271,11 @@ class VNCFrame(QLabel):
         self.selection_rect = QRect()
         self.enable_selection = enable_selection
         self.scale_factor = 1.0
+        self.frame_pixmap: QPixmap | None = None
+        self.frame_size = QSize()
+        self.cursor: Cursor | None = None
+        self.cursor_image: QImage | None = None
+        self.pointer: tuple[int, int] | None = None
         if platform.system() == "Windows":
             import ctypes
 
@@ -726,8 +1352,48 @@ class VNCFrame(QLabel):
                 self.selection_rect.setTop(self.end_pos.y())
                 self.selection_rect.setBottom(self.start_pos.y())
 
+    def set_cursor(self, cursor: Cursor | None, pointer: tuple[int, int] | None):
+        """
+        Sets the cursor of the VNC server, which is drawn over the frame with its
+        hotspot on *pointer* instead of being composited into the frame.
+        """
+        if cursor is not self.cursor:
+            self.cursor = cursor
+            self.cursor_image = None
+            if cursor is not None:
+                height, width = cursor.image.shape[:2]
+                self.cursor_image = QImage(
+                    np.ascontiguousarray(cursor.image).data,
+                    width,
+                    height,
+                    4 * width,
+                    QImage.Format.Format_RGBA8888,
+                ).copy()
+        elif pointer == self.pointer:
+            return
+        self.pointer = pointer
+        super().update()
+
     def paintEvent(self, event):
         super().paintEvent(event)
+        if (
+            self.cursor is not None
+            and self.cursor_image is not None
+            and self.pointer is not None
+            and self.frame_pixmap is not None
+        ):
+            painter = QPainter(self)
+            painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+            painter.drawImage(
+                QRectF(
+                    (self.pointer[0] - self.cursor.hotspot_x) * self.scale_factor,
+                    (self.pointer[1] - self.cursor.hotspot_y) * self.scale_factor,
+                    self.cursor_image.width() * self.scale_factor,
+                    self.cursor_image.height() * self.scale_factor,
+                ),
+                self.cursor_image,
+            )
+            painter.end()
         if self.enable_selection and not self.selection_rect.isEmpty():
             painter = QPainter(self)
             pen = QPen(QColor("red"), 2, Qt.PenStyle.SolidLine)
@@ -760,7 +1426,30 @@ class VNCFrame(QLabel):
         else:
             return None
 
-    def update(self, qimage):
+    def update(self, qimage, damage: list[Rect] | None = None):
+        """
+        Shows a new frame. If the *damage* rectangles are given, only those are
+        rescaled and painted over the previous frame.
+        """
+        if (
+            damage is not None
+            and self.frame_pixmap is not None
+            and qimage.size() == self.frame_size
+        ):
+            scale_x = self.frame_pixmap.width() / qimage.width()
+            scale_y = self.frame_pixmap.height() / qimage.height()
+            painter = QPainter(self.frame_pixmap)
+            painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+            for x, y, width, height in damage:
+                painter.drawImage(
+                    QRectF(x * scale_x, y * scale_y, width * scale_x, height * scale_y),
+                    qimage,
+                    QRectF(x, y, width, height),
+                )
+            painter.end()
+            self.setPixmap(self.frame_pixmap)
+            return
+
         scaled_qimage = qimage.scaled(
             self.target_size,
             Qt.AspectRatioMode.KeepAspectRatio,
@@ -772,38 +1461,391 @@ class VNCFrame(QLabel):
         )
 
         self.setFixedSize(scaled_qimage.size())
-        self.setPixmap(QPixmap.fromImage(scaled_qimage))
+        self.frame_pixmap = QPixmap.fromImage(scaled_qimage)
+        self.frame_size = qimage.size()
+        self.setPixmap(self.frame_pixmap)
+
+
+class _Lease:
+    """
+    Exposes a buffer to NumPy. Every array made from it refers to the lease,
+    so it lives exactly as long as any of them.
+    """
+
+    def __init__(self, buffer: np.ndarray):
+        self.__array_interface__ = buffer.__array_interface__
+        self.buffer = buffer  # keeps the memory alive
+
+
+class FrameStore:
+    """
+    Pool of frame buffers that are handed out as read-only views.
+
+    A buffer is only written again once no view of it is referenced anymore,
+    so consumers can keep frames for as long as they like without copying
+    them, while a streamer with short-lived consumers cycles through a few
+    buffers instead of allocating one per frame.
+    """
+
+    def __init__(self, size: int = 3):
+        self.size = size
+        self.buffers: list[np.ndarray] = []
+        # Number of views of each buffer, by id, that are still referenced
+        self.leases: dict[int, int] = {}
+        # Views are released by whichever thread drops the last reference
+        self.lock = threading.RLock()
+
+    def acquire(self, shape: tuple[int, ...]) -> np.ndarray:
+        """Returns a writable buffer of *shape* that no view refers to."""
+        with self.lock:
+            for buffer in self.buffers:
+                if buffer.shape == shape and id(buffer) not in self.leases:
+                    return buffer
+            buffer = np.empty(shape, "B")
+            self.buffers.append(buffer)
+            if len(self.buffers) > self.size:
+                # Still alive as long as its views are
+                del self.buffers[0]
+            return buffer
+
+    def view(self, buffer: np.ndarray) -> np.ndarray:
+        """Returns a read-only view of a buffer, which keeps it from reuse."""
+        lease = _Lease(buffer)
+        with self.lock:
+            self.leases[id(buffer)] = self.leases.get(id(buffer), 0) + 1
+        weakref.finalize(lease, self._release, id(buffer))
+        view = np.asarray(lease)
+        view.flags.writeable = False
+        return view
+
+    def _release(self, key: int) -> None:
+        with self.lock:
+            self.leases[key] -= 1
+            if not self.leases[key]:
+                del self.leases[key]
+
+
+class FramePacer:
+    """
+    Paces frame captures to a target rate, and gradually backs off to an idle
+    rate while the screen stays static. A rate of 0 turns the target rate or
+    the idle backoff off.
+    """
+
+    def __init__(
+        self,
+        fps: float | None = None,
+        idle_fps: float | None = None,
+        idle_frames: int | None = None,
+    ):
+        if fps is None:
+            fps = config.vnc_target_fps
+        if idle_fps is None:
+            idle_fps = config.vnc_idle_fps
+        self.interval = 1 / fps if fps is not None and fps > 0 else 0.0
+        self.idle_interval: float | None = None
+        if idle_fps is not None and idle_fps > 0:
+            self.idle_interval = max(1 / idle_fps, self.interval)
+        self.idle_frames = (
+            config.vnc_idle_frames if idle_frames is None else idle_frames
+        )
+        self.current_interval = self.interval
+        self.static_frames = 0
+        self.last_time = time.monotonic()
+
+    def update(self, changed: bool) -> float:
+        """
+        Records whether the last capture changed the screen, and returns the
+        number of seconds to wait before the next one.
+        """
+        if changed:
+            self.static_frames = 0
+            self.current_interval = self.interval
+        else:
+            self.static_frames += 1
+            if self.idle_interval is not None and self.static_frames > self.idle_frames:
+                # Starts from 10 ms without a target rate
+                self.current_interval = min(
+                    2 * self.current_interval or 0.01, self.idle_interval
+                )
+        now = time.monotonic()
+        delay = max(self.last_time + self.current_interval - now, 0.0)
+        self.last_time = now + delay
+        return delay
+
+
+class ScreenSettleDetector:
+    """
+    Waits after an action until the screen has not changed for *quiet_time*
+    seconds, but at most *max_wait* seconds, watching the frames published by
+    *streamer*. Without a streamer, it waits config.minimal_action_interval.
+    The duration of every wait is kept in waits.
+    """
+
+    def __init__(
+        self,
+        streamer: "Streamer | None",
+        quiet_time: float | None = None,
+        max_wait: float | None = None,
+    ):
+        self.streamer = streamer
+        self.quiet_time = config.settle_quiet_time if quiet_time is None else quiet_time
+        self.max_wait = config.settle_max_wait if max_wait is None else max_wait
+        self.waits: list[float] = []
+
+    def wait(self) -> float:
+        """Returns the number of seconds waited."""
+        start = time.monotonic()
+        if self.streamer is None:
+            time.sleep(config.minimal_action_interval)
+            self.waits.append(time.monotonic() - start)
+            return self.waits[-1]
+
+        settled = False
+        seq = self.streamer.get_frame()[0]
+        screen_seq = self.streamer.screen_seq
+        deadline = start + self.max_wait
+        quiet_until = start + self.quiet_time
+        while self.streamer.is_streaming:
+            now = time.monotonic()
+            if now >= quiet_until:
+                settled = True
+                break
+            if now >= deadline:
+                break
+            if self.streamer.wait_for_change(min(quiet_until, deadline) - now, seq):
+                seq = self.streamer.get_frame()[0]
+                # frames in which only the cursor moved do not count
+                if self.streamer.screen_seq != screen_seq:
+                    screen_seq = self.streamer.screen_seq
+                    quiet_until = time.monotonic() + self.quiet_time
+        duration = time.monotonic() - start
+        if settled:
+            logger.info(f"Screen settled after {duration:.2f} seconds")
+        else:
+            logger.info(f"Screen did not settle within {duration:.2f} seconds")
+        self.waits.append(duration)
+        return duration
+
+
+class Streamer:
+    """
+    Base class of the screen streamers, which publish frames together with a
+    sequence number and the rectangles that changed since the previous frame.
+    """
+
+    #: Number of frames of which the changed rectangles are remembered.
+    damage_history: int = 64
+
+    def __init__(self):
+        self.is_streaming = False
+        self.streaming_lock = threading.Lock()
+        self.video_height = 0
+        self.video_width = 0
+        self.current_frame: np.ndarray | None = None
+        self.frame_store = FrameStore()
+        #: Shared memory copy of the frames, see config.frame_bus.
+        self.frame_bus: SharedFrameBus | None = None
+        #: Set once the frame bus could not be created, to not retry every frame.
+        self.frame_bus_failed = False
+        #: Sequence number of the current frame, 0 before the first one.
+        self.frame_seq = 0
+        #: Sequence number of the last frame in which more than the cursor
+        #: changed, i.e. with damage from framebuffer encodings.
+        self.screen_seq = 0
+        self.frame_condition = threading.Condition()
+        self._damage: deque[tuple[int, list[Rect]]] = deque(maxlen=self.damage_history)
+
+    def get_current_frame(self) -> np.ndarray | None:
+        with self.streaming_lock:
+            return self.current_frame
+
+    def get_region(self, x: int, y: int, width: int, height: int) -> np.ndarray | None:
+        """
+        Returns an area of the current frame, clipped to the screen. The area is
+        a read-only view, so nothing is copied. A ValueError is raised if the
+        area lies outside of the screen.
+        """
+        frame = self.get_current_frame()
+        if frame is None:
+            return None
+        x, y, width, height = clip_region(x, y, width, height, *frame.shape[1::-1])
+        return frame[y : y + height, x : x + width]
+
+    def get_cursor(self) -> tuple[Cursor | None, tuple[int, int] | None]:
+        """
+        Returns the cursor and the pointer position if they are kept apart from
+        the frames, otherwise None for both.
+        """
+        return None, None
+
+    def get_frame(self) -> tuple[int, np.ndarray | None]:
+        """Returns the sequence number and the current frame."""
+        with self.frame_condition:
+            return self.frame_seq, self.get_current_frame()
+
+    def get_damage(self, since_seq: int) -> list[Rect] | None:
+        """
+        Returns the rectangles that changed after frame *since_seq*, or None if
+        they are no longer known and the whole frame must be treated as new.
+        """
+        with self.frame_condition:
+            if since_seq >= self.frame_seq:
+                return []
+            if not self._damage or self._damage[0][0] > since_seq + 1:
+                return None
+            return merge_damage(
+                [
+                    rect
+                    for seq, rects in self._damage
+                    if seq > since_seq
+                    for rect in rects
+                ]
+            )
+
+    def wait_for_change(
+        self, timeout: float | None = None, seq: int | None = None
+    ) -> bool:
+        """
+        Blocks until a frame newer than *seq* (by default the current one) is
+        published. Returns False if *timeout* expired or streaming stopped.
+        """
+        with self.frame_condition:
+            if seq is None:
+                seq = self.frame_seq
+            self.frame_condition.wait_for(
+                lambda: self.frame_seq > seq or not self.is_streaming, timeout
+            )
+            return self.frame_seq > seq
+
+    def _publish(
+        self, frame: np.ndarray, damage: list[Rect], cursor_only: bool = False
+    ) -> None:
+        with self.frame_condition:
+            with self.streaming_lock:
+                self.current_frame = frame
+            self.frame_seq += 1
+            if not cursor_only:
+                self.screen_seq = self.frame_seq
+            self._damage.append((self.frame_seq, merge_damage(damage)))
+            self.frame_condition.notify_all()
+        if config.frame_bus and not self.frame_bus_failed:
+            if self.frame_bus is None:
+                width, height = config.frame_bus_max_size or (
+                    frame.shape[1],
+                    frame.shape[0],
+                )
+                try:
+                    self.frame_bus = SharedFrameBus.create(
+                        width,
+                        height,
+                        slots=config.frame_bus_slots,
+                        name=self.frame_bus_name(),
+                    )
+                except FileExistsError as e:
+                    logger.error(f"Frames are not published to a frame bus: {e}")
+                    self.frame_bus_failed = True
+                    return
+            if not self.frame_bus.publish(self.frame_seq, frame, time.time()):
+                # Replaces the bus under its name, readers see the resize marker
+                # on the old one and re-attach
+                width = max(self.frame_bus.max_width, frame.shape[1])
+                height = max(self.frame_bus.max_height, frame.shape[0])
+                name = self.frame_bus.name
+                self.frame_bus.close()
+                self.frame_bus = SharedFrameBus.create(
+                    width, height, slots=config.frame_bus_slots, name=name
+                )
+                self.frame_bus.publish(self.frame_seq, frame, time.time())
+
+    def frame_bus_name(self) -> str | None:
+        """
+        Name of the frame bus of this streamer, derived from config.frame_bus_name
+        so that streamers of different screens do not collide. None for a random
+        name.
+        """
+        return config.frame_bus_name
+
+    def _notify_stopped(self) -> None:
+        with self.frame_condition:
+            self.frame_condition.notify_all()
+        if self.frame_bus is not None:
+            self.frame_bus.close()
+            self.frame_bus = None
 
 
-class VNCStreamer:
-    def __init__(self, env_server_addr: str, vnc_port: int, vnc_password: str):
+class VNCStreamer(Streamer):
+    def __init__(
+        self,
+        env_server_addr: str,
+        vnc_port: int,
+        vnc_password: str,
+        pool: "VNCStreamerPool | None" = None,
+    ):
+        super().__init__()
         self.env_server_addr = env_server_addr
         self.vnc_port = vnc_port
         self.vnc_password = vnc_password
-        self.is_streaming = False
+        #: Runs the connection on the event loop of the pool instead of a thread.
+        self.pool = pool
         self.streaming_thread = threading.Thread(
             target=self.between_callback, name="Screen Stream"
         )
-        self.streaming_lock = threading.Lock()
-        self.video_height = 0
-        self.video_width = 0
-        self.current_frame = None
+        self.streaming_task: Future | None = None
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self._reader: StreamReader | None = None
+        # Interrupts the wait between two frames
+        self.wakeup = asyncio.Event()
+        self.resize_callbacks: list[Callable[[int, int], None]] = []
 
     def start(self) -> None:
         self.streaming_lock.acquire()
         self.is_streaming = True
-        self.streaming_thread.start()
+        if self.pool is None:
+            self.streaming_thread.start()
+        else:
+            self.loop = self.pool.loop
+            self.streaming_task = self.pool.submit(self._capture_screen())
         with self.streaming_lock:
             pass
         while self.video_height == 0 or self.video_width == 0:
             time.sleep(0.2)
 
+    def is_running(self) -> bool:
+        if self.pool is None:
+            return self.streaming_thread.is_alive()
+        # The task never finishes once the pool has shut its loop down
+        return (
+            self.streaming_task is not None
+            and not self.streaming_task.done()
+            and not self.pool.loop.is_closed()
+        )
+
     def stop(self):
-        if not self.streaming_thread.is_alive():
+        if not self.is_running():
             logger.warning("VNC thread is not executing")
         else:
             self.is_streaming = False
-            self.streaming_thread.join()
+            self._wake_up()
+            if self.streaming_task is not None:
+                self.streaming_task.result()
+            else:
+                self.streaming_thread.join()
+            self._notify_stopped()
+
+    def _wake_up(self) -> None:
+        """
+        Wakes up the streaming loop. Incremental updates are only sent when the
+        screen changes, so the reader may be waiting on a static screen.
+        """
+        loop, reader = self.loop, self._reader
+        if loop is None or loop.is_closed():
+            return
+        # The loop may still be closed by its thread before the calls
+        with contextlib.suppress(RuntimeError):
+            if reader is not None:
+                loop.call_soon_threadsafe(reader.feed_eof)
+            loop.call_soon_threadsafe(self.wakeup.set)
 
     async def connect_vnc(self):
         """Connects to VNC server."""
@@ -822,12 +1864,35 @@ class VNCStreamer:
         self.current_frame = np.zeros(
             (self.video_height, self.video_width, 3), dtype="uint8"
         )
+        self.vnc.video.resize_callbacks.append(self._on_resize)
+
+    def frame_bus_name(self) -> str | None:
+        if config.frame_bus_name is None:
+            return None
+        return f"{config.frame_bus_name}_{self.env_server_addr}_{self.vnc_port}"
+
+    def add_resize_callback(self, callback: Callable[[int, int], None]) -> None:
+        """Registers a callback for desktop size changes of the VNC server."""
+        self.resize_callbacks.append(callback)
+
+    def remove_resize_callback(self, callback: Callable[[int, int], None]) -> None:
+        """Unregisters a callback added by *add_resize_callback*, if present."""
+        if callback in self.resize_callbacks:
+            self.resize_callbacks.remove(callback)
+
+    def _on_resize(self, width: int, height: int) -> None:
+        self.video_width = width
+        self.video_height = height
+        for callback in self.resize_callbacks:
+            callback(width, height)
 
     def between_callback(self):
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
+        self.loop = loop
 
         loop.run_until_complete(self._capture_screen())
+        self.loop = None
         loop.close()
 
     async def reconnect(self):
@@ -835,38 +1900,152 @@ class VNCStreamer:
             await self.vnc.disconnect()
         await self.connect_vnc()
 
-    def get_current_frame(self) -> np.ndarray | None:
-        with self.streaming_lock:
-            return self.current_frame
+    def get_current_frame(self, with_cursor: bool = False) -> np.ndarray | None:
+        """
+        Returns the latest RGB frame. With *with_cursor* set, the cursor of the
+        VNC server is drawn onto a copy of it.
+        """
+        frame = super().get_current_frame()
+        if with_cursor and frame is not None:
+            cursor, pointer = self.vnc.video.cursor, self.vnc.video.pointer
+            if cursor is not None and pointer is not None:
+                return composite_cursor(frame, cursor, *pointer)
+        return frame
+
+    def get_cursor(self) -> tuple[Cursor | None, tuple[int, int] | None]:
+        """
+        Returns the cursor of the VNC server and the pointer position, so that
+        viewers can draw it over the frame instead of compositing it.
+        """
+        return self.vnc.video.cursor, self.vnc.video.pointer
+
+    def get_region(
+        self, x: int, y: int, width: int, height: int, with_cursor: bool = False
+    ) -> np.ndarray | None:
+        """
+        Returns an area of the current frame as a read-only view, or with
+        *with_cursor* set, as a copy with the cursor drawn onto it.
+        """
+        frame = self.get_current_frame()
+        if frame is None:
+            return None
+        x, y, width, height = clip_region(x, y, width, height, *frame.shape[1::-1])
+        region = frame[y : y + height, x : x + width]
+        cursor, pointer = self.get_cursor()
+        if with_cursor and cursor is not None and pointer is not None:
+            return composite_cursor(region, cursor, pointer[0] - x, pointer[1] - y)
+        return region
 
     async def _capture_screen(self):
         await self.connect_vnc()
         assert self.vnc is not None, "VNC client is not connected"
         logger.info("VNC Streamer started")
         self.streaming_lock.release()
+        # Paces how often updates are requested. The server holds incremental
+        # requests while the screen is static, so backing off while idle would
+        # only delay the first update after it.
+        pacer = FramePacer(idle_fps=0)
         while self.is_streaming:
             try:
-                frame = await self.vnc.screenshot()
-                frame = cv2.cvtColor(frame, cv2.COLOR_RGBA2RGB)
-                with self.streaming_lock:
-                    self.current_frame = frame.copy()
+                # Converted to RGB below, straight into a pooled buffer
+                await self.vnc.update(incremental=True)
+                video = self.vnc.video
+                damage, video.damage = video.damage, []
+                cursor_damage, video.cursor_damage = video.cursor_damage, []
+                if damage:
+                    buffer = self.frame_store.acquire((video.height, video.width, 3))
+                    if self.pool is not None:
+                        # The next update is only requested once converted
+                        await self.pool.run(video.as_rgb, buffer)
+                    else:
+                        video.as_rgb(buffer)
+                    frame = self.frame_store.view(buffer)
+                elif cursor_damage:
+                    # Only the cursor changed, the frame itself is the same
+                    frame = self.current_frame
+                if damage or cursor_damage:
+                    self._publish(frame, damage + cursor_damage, cursor_only=not damage)
+                delay = pacer.update(bool(damage))
+                if delay > 0:
+                    with contextlib.suppress(asyncio.TimeoutError):
+                        await asyncio.wait_for(self.wakeup.wait(), delay)
             except Exception as e:
+                if not self.is_streaming:
+                    break
                 logger.warning(f"Fail to capture frame: {e}")
         await self.vnc.disconnect()
         logger.info("VNC Streamer stopped")
 
 
-class LocalStreamer:
+class VNCStreamerPool:
+    """
+    Runs the connections of many VNC streamers on one shared event loop.
+
+    Each streamer keeps its own frame store, sequence numbers and damage, but
+    instead of a thread and an event loop per connection, all of them share a
+    single loop thread, and the colour conversion of their frames runs on a
+    bounded pool of workers. A connection requests its next update only once
+    its last frame was converted, so an overloaded host leaves the updates
+    waiting on the servers instead of queueing them in memory.
+    """
+
+    def __init__(self, workers: int | None = None):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self.loop.run_forever, name="Screen Stream Pool"
+        )
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers or config.vnc_pool_workers,
+            thread_name_prefix="Frame Conversion",
+        )
+        self.streamers: list[VNCStreamer] = []
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        for streamer in list(self.streamers):
+            self.remove(streamer)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.executor.shutdown()
+
+    def add(
+        self, env_server_addr: str, vnc_port: int, vnc_password: str
+    ) -> VNCStreamer:
+        """Connects to a VNC server and returns its started streamer."""
+        streamer = VNCStreamer(env_server_addr, vnc_port, vnc_password, pool=self)
+        streamer.start()
+        self.streamers.append(streamer)
+        return streamer
+
+    def remove(self, streamer: VNCStreamer) -> None:
+        """Stops a streamer and closes its connection."""
+        streamer.stop()
+        self.streamers.remove(streamer)
+
+    def submit(self, coroutine: Coroutine) -> Future:
+        """Schedules a coroutine on the shared event loop from any thread."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    async def run(self, function: Callable, *args):
+        """Runs a blocking function on the workers from the shared loop."""
+        return await self.loop.run_in_executor(self.executor, function, *args)
+
+
+class LocalStreamer(Streamer):
     def __init__(self, monitor_idx: int):
-        self.is_streaming = False
+        super().__init__()
         self.streaming_thread = threading.Thread(
             target=self._capture_screen, name="Screen Stream"
         )
-        self.streaming_lock = threading.Lock()
-        self.video_height = 0
-        self.video_width = 0
         self.monitor_idx = monitor_idx
-        self.current_frame = None
+
+    def frame_bus_name(self) -> str | None:
+        if config.frame_bus_name is None:
+            return None
+        return f"{config.frame_bus_name}_monitor{self.monitor_idx}"
 
     def start(self) -> None:
         self.streaming_lock.acquire()
@@ -876,9 +2055,7 @@ class LocalStreamer:
             pass
         while self.video_height == 0 or self.video_width == 0:
             time.sleep(0.2)
-        self.current_frame = np.zeros(
-            (self.video_height, self.video_width, 3), dtype="uint8"
-        )
+        self.wait_for_change(seq=0)
 
     def stop(self):
         if not self.streaming_thread.is_alive():
@@ -886,24 +2063,26 @@ class LocalStreamer:
         else:
             self.is_streaming = False
             self.streaming_thread.join()
-
-    def get_current_frame(self) -> np.ndarray | None:
-        with self.streaming_lock:
-            return self.current_frame
+            self._notify_stopped()
 
     def _capture_screen(self):
         with mss.mss() as sct:
             monitor = sct.monitors[self.monitor_idx]
             logger.info("Local Streamer started")
             self.streaming_lock.release()
+            pacer = FramePacer()
             while self.is_streaming:
                 try:
-                    frame = sct.grab(monitor)
-                    self.video_width, self.video_height = frame.width, frame.height
-                    frame = np.array(frame)
-                    frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2RGB)
-                    with self.streaming_lock:
-                        self.current_frame = frame.copy()
+                    screenshot = sct.grab(monitor)
+                    width, height = screenshot.width, screenshot.height
+                    self.video_width, self.video_height = width, height
+                    bgra = np.frombuffer(screenshot.raw, "B").reshape(height, width, 4)
+                    buffer = self.frame_store.acquire((height, width, 3))
+                    cv2.cvtColor(bgra, cv2.COLOR_BGRA2RGB, dst=buffer)
+                    damage = frame_difference(self.current_frame, buffer)
+                    if damage:
+                        self._publish(self.frame_store.view(buffer), damage)
+                    time.sleep(pacer.update(bool(damage)))
                 except Exception as e:
                     logger.warning(f"Fail to capture frame: {e}")
             logger.info("Local Streamer stopped")
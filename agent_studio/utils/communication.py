@@ -14,6 +14,16 @@ str2bytes: Callable[..., Any] = (
     else "Error encoding string to bytes"
 )
 
+# Header naming the env server session of a request, the default if missing
+SESSION_HEADER = "X-Session-Id"
+DEFAULT_SESSION = "default"
+
+
+def session_headers(session_id: str | None) -> dict[str, str]:
+    if session_id is None:
+        return {}
+    return {SESSION_HEADER: session_id}
+
 
 class AgentStudioStatusResponse(BaseModel):
     status: str
@@ -30,6 +40,24 @@ class AgentStudioTextRequest(BaseModel):
     message: str
 
 
+class AgentStudioExecuteRequest(BaseModel):
+    message: str
+    # seconds after which the code is interrupted, config.python_timeout if None
+    timeout: float | None = None
+
+
+class AgentStudioJobResponse(BaseModel):
+    job_id: str
+    # pending, running, finished or cancelled
+    status: str
+    result: dict = {}
+
+
+class AgentStudioRuntimeResetRequest(BaseModel):
+    # code to execute in the new runtime, e.g. to import the tools
+    init_code: str | None = None
+
+
 class AgentStudioResetRequest(BaseModel):
     task_config: dict
 
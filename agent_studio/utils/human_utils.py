@@ -1,10 +1,9 @@
 from typing import Callable
 
 from agent_studio.config.config import Config
-from agent_studio.utils.task_status import StateEnum, StateInfo, TaskStatus
+from agent_studio.utils.task_status import StateEnum, StateInfo, current_task_status
 
 config = Config()
-task_status = TaskStatus()
 
 
 def confirm_action(prompt: str = "") -> Callable:
@@ -20,6 +19,7 @@ def confirm_action(prompt: str = "") -> Callable:
                         input(f"{prompt}\nConfirm action (y/n): ").strip().lower()
                     )
                 else:
+                    task_status = current_task_status()
                     task_status.set_task_state(
                         StateInfo(
                             state=StateEnum.WAIT_FOR_INPUT,
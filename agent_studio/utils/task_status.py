@@ -2,8 +2,6 @@ import sys
 import threading
 from enum import Enum
 
-from agent_studio.utils.singleton import ThreadSafeSingleton
-
 
 class StateEnum(Enum):
     PENDING = "pending"
@@ -20,15 +18,23 @@ class StateInfo:
         self.result = result
 
 
-class TaskStatus(metaclass=ThreadSafeSingleton):
+class TaskStatus:
+    """
+    State of the task that an env server session runs. Evaluators reach the
+    status of their session with current_task_status().
+    """
+
     def __init__(self) -> None:
         self.state_info: StateInfo = StateInfo(StateEnum.PENDING)
         self.condition: threading.Condition = threading.Condition()
         self.active_thread: threading.Thread | None = None
+        # incremented on every state change
+        self.version: int = 0
 
     def set_task_state(self, state_info: StateInfo) -> None:
         with self.condition:
             self.state_info = state_info
+            self.version += 1
             self.condition.notify_all()
 
     def get_task_state(self) -> StateInfo:
@@ -38,6 +44,8 @@ class TaskStatus(metaclass=ThreadSafeSingleton):
     def reset_state(self) -> None:
         with self.condition:
             self.state_info = StateInfo(StateEnum.PENDING)
+            self.version += 1
+            self.condition.notify_all()
 
     def wait_for_state_change(self, cur_state: StateEnum) -> StateInfo:
         with self.condition:
@@ -46,3 +54,47 @@ class TaskStatus(metaclass=ThreadSafeSingleton):
         if self.state_info.state == StateEnum.TERMINATE:
             sys.exit(0)
         return self.state_info
+
+    def wait_while(
+        self, states: list[StateEnum], timeout: float | None = None
+    ) -> StateInfo:
+        """
+        Blocks while the task is in one of *states*, for at most *timeout*
+        seconds, and returns the state it is in.
+        """
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.state_info.state not in states, timeout
+            )
+            return self.state_info
+
+    def wait_for_update(
+        self, version: int, timeout: float | None = None
+    ) -> tuple[int, StateInfo]:
+        """
+        Blocks until the state changes after *version*, for at most *timeout*
+        seconds, and returns the current version and state.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.version != version, timeout)
+            return self.version, self.state_info
+
+
+_default_task_status = TaskStatus()
+_bound = threading.local()
+
+
+def bind_task_status(task_status: TaskStatus | None) -> None:
+    """Makes *task_status* the current task status of the calling thread."""
+    _bound.task_status = task_status
+
+
+def current_task_status() -> TaskStatus:
+    """
+    Returns the task status bound to the calling thread, or the task status
+    shared by the process if none is bound.
+    """
+    task_status = getattr(_bound, "task_status", None)
+    if task_status is None:
+        return _default_task_status
+    return task_status
@@ -1,8 +1,11 @@
 import argparse
 import asyncio
 import logging
+import queue
 import sys
+import threading
 import time
+from dataclasses import dataclass
 from pathlib import Path
 
 import psutil
@@ -19,7 +22,12 @@ from agent_studio.envs.desktop_env.recorder.screen_recorder import (
     ScreenRecorder,
     VNCRecorder,
 )
-from agent_studio.envs.desktop_env.vnc_client import VNCStreamer
+from agent_studio.envs.desktop_env.step_pipeline import StepPipeline
+from agent_studio.envs.desktop_env.vnc_client import (
+    ScreenSettleDetector,
+    VNCStreamer,
+    VNCStreamerPool,
+)
 from agent_studio.llm import setup_model
 from agent_studio.utils.communication import (
     AgentStudioEvalRequest,
@@ -27,12 +35,15 @@ from agent_studio.utils.communication import (
     AgentStudioResultResponse,
     AgentStudioStatusResponse,
     AgentStudioTextRequest,
+    session_headers,
 )
 from agent_studio.utils.human_utils import confirm_action
 from agent_studio.utils.json_utils import export_trajectories, read_jsonl
 
 config = Config()
 logger = logging.getLogger(__name__)
+# serializes writing results from parallel workers
+export_lock = threading.Lock()
 
 
 class TestReq:
@@ -53,9 +64,44 @@ def create_parser():
     return parser
 
 
-def get_agent(args):
+@dataclass
+class EnvServer:
+    """
+    The REST and VNC endpoints of an env server, and the session to use on it,
+    None for the default session. Several sessions can share a server.
+    """
+
+    addr: str
+    port: int
+    vnc_port: int
+    vnc_password: str
+    session: str | None = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.addr}:{self.port}"
+
+    @property
+    def headers(self) -> dict[str, str]:
+        return session_headers(self.session)
+
+    @classmethod
+    def from_config(cls) -> "EnvServer":
+        return cls(
+            config.env_server_addr,
+            config.env_server_port,
+            config.vnc_port,
+            config.vnc_password,
+        )
+
+
+def create_agent() -> BaseAgent:
     model = setup_model(config.provider)
-    agent = setup_agent(config.agent, model)
+    return setup_agent(config.agent, model)
+
+
+def get_agent(args):
+    agent = create_agent()
     record_path = f"data/trajectories/{config.exec_model}/{config.agent}"
     Path(record_path).mkdir(parents=True, exist_ok=True)
 
@@ -79,10 +125,16 @@ def setup_tasks(args):
     return task_configs
 
 
-def wait_finish(is_eval: bool):
-    remote_server_addr = f"http://{config.env_server_addr}:{config.env_server_port}"
+def wait_finish(is_eval: bool, env_server: EnvServer | None = None):
+    if env_server is None:
+        env_server = EnvServer.from_config()
+    remote_server_addr = env_server.url
     while True:
-        response_raw = requests.get(f"{remote_server_addr}/task/status")
+        response_raw = requests.get(
+            f"{remote_server_addr}/task/status",
+            params={"wait": config.task_status_wait},
+            headers=env_server.headers,
+        )
         response = AgentStudioStatusResponse(**response_raw.json())
         if response.status == "finished":
             break
@@ -95,6 +147,7 @@ def wait_finish(is_eval: bool):
             response_raw = requests.post(
                 url=f"{remote_server_addr}/task/confirm",  # noqa: E501
                 json=AgentStudioTextRequest(message=user_input).model_dump(),
+                headers=env_server.headers,
             )
             response = AgentStudioStatusResponse(**response_raw.json())
             assert response.status == "success"
@@ -102,7 +155,6 @@ def wait_finish(is_eval: bool):
             pass
         else:
             raise ValueError(f"Unknown status: {response.status}")
-        time.sleep(1)
 
 
 def eval_gui(
@@ -155,135 +207,157 @@ def eval_gui(
         sys.exit(0)
 
 
-def eval_headless(
+def run_task(
     agent: BaseAgent,
-    task_configs: list[dict],
+    task_config: dict,
     record_path: str,
-) -> None:
-    """Evaluate the agent on the given tasks in Terminal."""
-    scores = {}
+    env_server: EnvServer,
+    streamer_pool: VNCStreamerPool | None = None,
+) -> float | None:
+    """
+    Runs and evaluates one task on *env_server*, and exports its trajectory.
+    Returns the score, or None if the task failed to run. VNC connections are
+    made on *streamer_pool* if given.
+    """
     screen_recorder: ScreenRecorder | None = None
     vnc_streamer: VNCStreamer | None = None
-    remote_server_addr = f"http://{config.env_server_addr}:{config.env_server_port}"
-    for task_config in task_configs:
-        try:
-            task_id = task_config["task_id"]
-            if config.remote:
-                response_raw = requests.post(f"{remote_server_addr}/runtime/reset")
-                response = AgentStudioStatusResponse(**response_raw.json())
-                assert (
-                    response.status == "success"
-                ), f"Fail to reset runtime: {response_raw.text}"
-                if task_config["visual"]:
+    pipeline: StepPipeline | None = None
+    remote_server_addr = env_server.url
+    try:
+        task_trajectory_path = Path(record_path) / task_config["task_id"]
+        # the recorder encodes the video right away when streaming
+        stream_path = (
+            (task_trajectory_path / "video.mp4").as_posix()
+            if config.video_streaming
+            else None
+        )
+        if config.remote:
+            if task_config["visual"]:
+                if streamer_pool is not None:
+                    vnc_streamer = streamer_pool.add(
+                        env_server.addr, env_server.vnc_port, env_server.vnc_password
+                    )
+                else:
                     vnc_streamer = VNCStreamer(
-                        env_server_addr=config.env_server_addr,
-                        vnc_port=config.vnc_port,
-                        vnc_password=config.vnc_password,
+                        env_server_addr=env_server.addr,
+                        vnc_port=env_server.vnc_port,
+                        vnc_password=env_server.vnc_password,
                     )
                     vnc_streamer.start()
-                    screen_recorder = VNCRecorder(
-                        fps=config.video_fps,
-                        vnc_streamer=vnc_streamer,
-                    )
-                    screen_recorder.start()
-                else:
-                    screen_recorder = None
-
-                response_raw = requests.post(
-                    f"{remote_server_addr}/task/reset",
-                    json=AgentStudioResetRequest(task_config=task_config).model_dump(),
+                screen_recorder = VNCRecorder(
+                    fps=config.video_fps,
+                    vnc_streamer=vnc_streamer,
+                    video_path=stream_path,
                 )
-                response = AgentStudioStatusResponse(**response_raw.json())
-                if response.status != "submitted":
-                    raise ValueError(f"Fail to reset task: {response.content}")
-                wait_finish(is_eval=False)
-                response_raw = requests.get(
-                    f"{remote_server_addr}/task/result",
-                )
-                response = AgentStudioResultResponse(**response_raw.json())
-                if not (response.status == "finished" and response.result == "success"):
-                    raise ValueError(f"Fail to reset task: {response.message}")
-
-                instruction = task_config["instruction"]
-                logger.info(f"Task instruction: {instruction}")
+                screen_recorder.start()
             else:
-                if task_config["visual"]:
-                    screen_recorder = ScreenRecorder(
-                        fps=config.video_fps,
-                    )
-                    screen_recorder.start()
-                else:
-                    screen_recorder = None
-                comb = evaluator_router(task_config)
-                comb.reset()
-
-                instruction = task_config["instruction"]
-                logger.info(f"Task instruction: {instruction}")
-
-            agent.reset(instruction=instruction)
-            # Loop until the task is done or the max step is reached.
-            for t in range(task_config["max_steps"]):
-                logger.info(f"Step {t}")
-                if task_config["visual"]:
-                    assert screen_recorder is not None
-                    obs = screen_recorder.get_current_frame()
-                else:
-                    obs = None
-                agent.generate_action(obs)
-                if config.need_human_confirmation:
-                    confirmed, _ = confirm_action()(lambda: True)()
-                else:
-                    confirmed = True
-                _, done = agent.step_action(confirmed)
-                time.sleep(config.minimal_action_interval)
-                if done:
-                    break
+                screen_recorder = None
+
+            response_raw = requests.post(
+                f"{remote_server_addr}/task/reset",
+                json=AgentStudioResetRequest(task_config=task_config).model_dump(),
+                headers=env_server.headers,
+            )
+            response = AgentStudioStatusResponse(**response_raw.json())
+            if response.status != "submitted":
+                raise ValueError(f"Fail to reset task: {response.content}")
+            wait_finish(is_eval=False, env_server=env_server)
+            response_raw = requests.get(
+                f"{remote_server_addr}/task/result",
+                headers=env_server.headers,
+            )
+            response = AgentStudioResultResponse(**response_raw.json())
+            if not (response.status == "finished" and response.result == "success"):
+                raise ValueError(f"Fail to reset task: {response.message}")
 
-            task_trajectory_path = Path(record_path) / task_config["task_id"]
-            video_meta = None
+            instruction = task_config["instruction"]
+            logger.info(f"Task instruction: {instruction}")
+        else:
             if task_config["visual"]:
-                task_trajectory_path.mkdir(parents=True, exist_ok=True)
-                assert screen_recorder is not None
-                screen_recorder.stop()
-                screen_recorder.wait_exit()
-                video_path = (task_trajectory_path / "video.mp4").as_posix()
-                video_meta = screen_recorder.save(video_path, 0)
-                del screen_recorder
-                screen_recorder = None
-                logger.info(f"Video saved to {video_path}")
-
-            if config.remote:
-                response_raw = requests.post(
-                    f"{remote_server_addr}/task/eval",
-                    json=AgentStudioEvalRequest(
-                        task_config=task_config,
-                    ).model_dump(),
-                )
-                response = AgentStudioStatusResponse(**response_raw.json())
-                assert response.status == "submitted"
-                wait_finish(is_eval=True)
-                response_raw = requests.get(f"{remote_server_addr}/task/result")
-                response = AgentStudioResultResponse(**response_raw.json())
-                if not (
-                    response.status == "finished" and isinstance(response.message, dict)
-                ):
-                    raise ValueError(f"Fail to evaluate task: {response.message}")
-                score, feedback = (
-                    response.message["score"],
-                    response.message["feedback"],
+                screen_recorder = ScreenRecorder(
+                    fps=config.video_fps,
+                    video_path=stream_path,
                 )
+                screen_recorder.start()
             else:
-                logger.info("Start evaluation")
-                score, feedback = comb()
-
-            scores[task_id] = score
-            if score == 1.0:
-                logger.info(f"[Result] (PASS): {feedback}")
+                screen_recorder = None
+            comb = evaluator_router(task_config)
+            comb.reset()
+
+            instruction = task_config["instruction"]
+            logger.info(f"Task instruction: {instruction}")
+
+        agent.reset(instruction=instruction)
+        # Prepares each observation while the action before it takes effect,
+        # until the screen settles
+        settle_detector = ScreenSettleDetector(vnc_streamer)
+        pipeline = StepPipeline(agent, screen_recorder, settle_detector.wait)
+        obs = pipeline.observe()
+        # Loop until the task is done or the max step is reached.
+        for t in range(task_config["max_steps"]):
+            logger.info(f"Step {t}")
+            agent.generate_action(obs)
+            if config.need_human_confirmation:
+                confirmed, _ = confirm_action()(lambda: True)()
             else:
-                logger.info(f"[Result] (FAIL): {feedback}")
-            action_token_count = agent.get_token_count()
+                confirmed = True
+            _, done, obs = pipeline.step(confirmed)
+            if done:
+                break
+
+        video_meta = None
+        if task_config["visual"]:
+            task_trajectory_path.mkdir(parents=True, exist_ok=True)
+            assert screen_recorder is not None
+            screen_recorder.stop()
+            screen_recorder.wait_exit()
+            video_path = (task_trajectory_path / "video.mp4").as_posix()
+            video_meta = screen_recorder.save(video_path, 0)
+            del screen_recorder
+            screen_recorder = None
+            logger.info(f"Video saved to {video_path}")
+
+        if config.remote:
+            response_raw = requests.post(
+                f"{remote_server_addr}/task/eval",
+                json=AgentStudioEvalRequest(
+                    task_config=task_config,
+                ).model_dump(),
+                headers=env_server.headers,
+            )
+            response = AgentStudioStatusResponse(**response_raw.json())
+            assert response.status == "submitted"
+            wait_finish(is_eval=True, env_server=env_server)
+            response_raw = requests.get(
+                f"{remote_server_addr}/task/result", headers=env_server.headers
+            )
+            response = AgentStudioResultResponse(**response_raw.json())
+            if not (
+                response.status == "finished" and isinstance(response.message, dict)
+            ):
+                raise ValueError(f"Fail to evaluate task: {response.message}")
+            score, feedback = (
+                response.message["score"],
+                response.message["feedback"],
+            )
+        else:
+            logger.info("Start evaluation")
+            score, feedback = comb()
+
+        if len(settle_detector.waits) > 0:
+            logger.info(
+                f"Waited {sum(settle_detector.waits):.2f} seconds in total "
+                f"for the screen to settle after {len(settle_detector.waits)} steps"
+            )
+        if score == 1.0:
+            logger.info(f"[Result] (PASS): {feedback}")
+        else:
+            logger.info(f"[Result] (FAIL): {feedback}")
+        action_token_count = agent.get_token_count()
+        self_eval_results = agent.eval()
+        with export_lock:
             export_trajectories(
-                self_eval_results=agent.eval(),
+                self_eval_results=self_eval_results,
                 task_config=task_config,
                 trajectory=agent.trajectory,
                 record_path=record_path,
@@ -293,23 +367,103 @@ def eval_headless(
                 video_meta=video_meta,
                 jsonl_name=config.result_jsonl_file,
             )
-        except Exception as e:
-            import traceback
-
-            logger.error(f"[Unhandled Error] {repr(e)}]")
-            logger.error(traceback.format_exc())
-        finally:
-            if screen_recorder is not None:
-                screen_recorder.stop()
-                screen_recorder.wait_exit()
-                screen_recorder = None
-            if vnc_streamer is not None:
+        return score
+    except Exception as e:
+        import traceback
+
+        logger.error(f"[Unhandled Error] {repr(e)}]")
+        logger.error(traceback.format_exc())
+        return None
+    finally:
+        if pipeline is not None:
+            pipeline.close()
+        if screen_recorder is not None:
+            screen_recorder.stop()
+            screen_recorder.wait_exit()
+        if vnc_streamer is not None:
+            if streamer_pool is not None:
+                streamer_pool.remove(vnc_streamer)
+            else:
                 vnc_streamer.stop()
-                vnc_streamer = None
+
+
+def eval_headless(
+    agent: BaseAgent,
+    task_configs: list[dict],
+    record_path: str,
+) -> None:
+    """Evaluate the agent on the given tasks in Terminal."""
+    scores = {}
+    env_server = EnvServer.from_config()
+    for task_config in task_configs:
+        score = run_task(agent, task_config, record_path, env_server)
+        if score is not None:
+            scores[task_config["task_id"]] = score
     agent.close()
     logger.info(f"Average score: {sum(scores.values()) / max(len(scores), 1)}")
 
 
+def eval_parallel(
+    agent: BaseAgent,
+    task_configs: list[dict],
+    record_path: str,
+    env_servers: list[EnvServer],
+) -> None:
+    """
+    Evaluate the agent on the given tasks in Terminal, running one worker per
+    env server. Each worker has its own agent, *agent* being the first one,
+    and takes the next task as soon as it finished the last.
+    """
+    if not config.remote:
+        raise ValueError("Parallel evaluation requires remote env servers.")
+    if config.need_human_confirmation:
+        raise ValueError("Parallel evaluation can't ask for human confirmation.")
+    tasks: queue.Queue[dict] = queue.Queue()
+    for task_config in task_configs:
+        tasks.put(task_config)
+    scores: dict[str, float] = {}
+    streamer_pool = VNCStreamerPool()
+    streamer_pool.start()
+
+    def work(agent: BaseAgent, env_server: EnvServer) -> None:
+        agent.remote_server_addr = env_server.url
+        agent.remote_session_id = env_server.session
+        try:
+            while True:
+                try:
+                    task_config = tasks.get_nowait()
+                except queue.Empty:
+                    break
+                logger.info(f"Running {task_config['task_id']} on {env_server.url}")
+                score = run_task(
+                    agent, task_config, record_path, env_server, streamer_pool
+                )
+                if score is not None:
+                    scores[task_config["task_id"]] = score
+        finally:
+            agent.close()
+
+    workers = [
+        threading.Thread(
+            target=work,
+            args=(agent if i == 0 else create_agent(), env_server),
+            name=f"Env Worker {env_server.addr}:{env_server.port}",
+        )
+        for i, env_server in enumerate(env_servers)
+    ]
+    try:
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    finally:
+        streamer_pool.stop()
+    logger.info(
+        f"Average score: {sum(scores.values()) / max(len(scores), 1)} "
+        f"over {len(scores)} tasks on {len(env_servers)} env servers"
+    )
+
+
 def eval(args) -> None:
     """Evaluate the agent on the given tasks."""
 
@@ -320,6 +474,11 @@ def eval(args) -> None:
         case "desktop":
             if not config.headless:
                 eval_gui(agent, task_configs, record_path)
+            elif len(config.env_servers) > 0:
+                env_servers = [
+                    EnvServer(**env_server) for env_server in config.env_servers
+                ]
+                eval_parallel(agent, task_configs, record_path, env_servers)
             else:
                 eval_headless(agent, task_configs, record_path)
         case _:
@@ -1,40 +1,240 @@
+import asyncio
 import logging
 import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
 from contextlib import asynccontextmanager
+from typing import Annotated
 
 import uvicorn
-from fastapi import FastAPI
-from fastapi.responses import Response
+from fastapi import Depends, FastAPI, Header, HTTPException
+from fastapi.responses import Response, StreamingResponse
 
-from agent_studio.agent.runtime import PythonRuntime
+from agent_studio.agent.runtime import PythonRuntime, close_kernel_pools, get_runtime
 from agent_studio.config import Config
 from agent_studio.envs.desktop_env.evaluators.evaluator_helper import EvaluatorComb
 from agent_studio.utils.communication import (
+    DEFAULT_SESSION,
+    SESSION_HEADER,
     AgentStudioEvalRequest,
+    AgentStudioExecuteRequest,
+    AgentStudioJobResponse,
     AgentStudioResetRequest,
     AgentStudioResultResponse,
+    AgentStudioRuntimeResetRequest,
     AgentStudioStatusResponse,
     AgentStudioTextRequest,
 )
-from agent_studio.utils.task_status import StateEnum, StateInfo, TaskStatus
+from agent_studio.utils.task_status import (
+    StateEnum,
+    StateInfo,
+    TaskStatus,
+    bind_task_status,
+)
 
 config = Config()
 logger = logging.getLogger(__name__)
-task_status = TaskStatus()
 
-runtimes: dict[str, PythonRuntime] = {}
 config.remote = False
 config.headless = False
 config.need_human_confirmation = True
 
-current_thread: None | threading.Thread = None
+# Longest a status request blocks, so that proxies do not drop the connection
+MAX_STATUS_WAIT = 60.0
+# Seconds between keep-alive comments on an idle status stream
+STATUS_KEEPALIVE = 15.0
+# Seconds between checks for idle sessions
+REAP_INTERVAL = 30.0
+
+
+class ExecuteJob:
+    """Code submitted for execution on the runtime of a session."""
+
+    def __init__(self, code: str, timeout: float | None) -> None:
+        self.job_id = uuid.uuid4().hex
+        self.code = code
+        self.timeout = timeout
+        self.future: Future[dict] = Future()
+        self.cancelled = False
+
+    @property
+    def status(self) -> str:
+        if self.cancelled:
+            return "cancelled"
+        elif self.future.done():
+            return "finished"
+        elif self.future.running():
+            return "running"
+        else:
+            return "pending"
+
+    def response(self) -> AgentStudioJobResponse:
+        result: dict = {}
+        if self.future.done() and not self.future.cancelled():
+            exception = self.future.exception()
+            if exception is None:
+                result = self.future.result()
+            else:
+                result = {"error": f"Failed to execute code: {exception}"}
+        return AgentStudioJobResponse(
+            job_id=self.job_id, status=self.status, result=result
+        )
+
+
+class Session:
+    """
+    The Python runtime, task status and task thread of one client, which names
+    its session in the X-Session-Id header of every request. Code runs on a
+    worker thread of the session, one job at a time.
+    """
+
+    def __init__(self, session_id: str) -> None:
+        self.session_id = session_id
+        self.runtime: PythonRuntime | None = None
+        # serializes the code executed on the runtime
+        self.runtime_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=f"Session {session_id}"
+        )
+        # submitted jobs, until their result was returned
+        self.jobs: dict[str, ExecuteJob] = {}
+        self.running_job: ExecuteJob | None = None
+        self.job_lock = threading.Lock()
+        self.task_status = TaskStatus()
+        self.current_thread: threading.Thread | None = None
+        self.last_used = time.monotonic()
+
+    @property
+    def busy(self) -> bool:
+        return (
+            self.runtime_lock.locked()
+            or any(not job.future.done() for job in list(self.jobs.values()))
+            or (self.current_thread is not None and self.current_thread.is_alive())
+        )
+
+    def submit(self, code: str, timeout: float | None = None) -> ExecuteJob:
+        job = ExecuteJob(code, timeout)
+        job.future = self.executor.submit(self._execute, job)
+        self.jobs[job.job_id] = job
+        return job
+
+    def cancel(self, job: ExecuteJob) -> None:
+        """Cancels *job*, interrupting the kernel if the job is running."""
+        with self.job_lock:
+            job.cancelled = True
+            if not job.future.cancel() and self.running_job is job:
+                assert self.runtime is not None
+                self.runtime.interrupt()
+
+    def _execute(self, job: ExecuteJob) -> dict:
+        with self.runtime_lock:
+            if self.runtime is None:
+                self.runtime = get_runtime()
+            with self.job_lock:
+                if job.cancelled:
+                    return {}
+                self.running_job = job
+            try:
+                return self.runtime(job.code, job.timeout)
+            finally:
+                with self.job_lock:
+                    self.running_job = None
+
+    def reset_runtime(self, init_code: str | None = None) -> None:
+        with self.runtime_lock:
+            runtime, self.runtime = self.runtime, get_runtime(init_code)
+        if runtime is not None:
+            # nothing waits for the old kernel to shut down
+            threading.Thread(target=runtime.close, name="Kernel Shutdown").start()
+
+    def stop_task(self) -> None:
+        """Terminates the task thread, if one is running."""
+        if self.current_thread is None:
+            return
+        cur_status = self.task_status.get_task_state()
+        if cur_status.state not in [StateEnum.PENDING, StateEnum.FINISHED]:
+            logger.info(
+                f"Stopping current task: {cur_status.state}, "
+                f"on thread: {self.current_thread}"
+            )
+            self.task_status.set_task_state(StateInfo(StateEnum.TERMINATE))
+            self.current_thread.join()
+            self.task_status.reset_state()
+
+    def close(self) -> None:
+        for job in list(self.jobs.values()):
+            self.cancel(job)
+        self.executor.shutdown()
+        self.stop_task()
+        with self.runtime_lock:
+            if self.runtime is not None:
+                self.runtime.close()
+                self.runtime = None
+
+
+sessions: dict[str, Session] = {}
+sessions_lock = threading.Lock()
+
+
+def get_session(
+    session_id: Annotated[str, Header(alias=SESSION_HEADER)] = DEFAULT_SESSION
+) -> Session:
+    """Returns the session of the request, opening it if it is new."""
+    with sessions_lock:
+        session = sessions.get(session_id)
+        if session is None:
+            if len(sessions) >= config.max_sessions:
+                raise HTTPException(
+                    status_code=503,
+                    detail=f"Too many sessions, at most {config.max_sessions}",
+                )
+            session = sessions[session_id] = Session(session_id)
+            logger.info(f"Opened session {session_id}")
+        session.last_used = time.monotonic()
+        return session
+
+
+SessionDep = Annotated[Session, Depends(get_session)]
+
+
+def reap_sessions(idle_timeout: float) -> None:
+    """Closes the sessions that were idle for more than *idle_timeout* seconds."""
+    now = time.monotonic()
+    with sessions_lock:
+        idle = [
+            session
+            for session in sessions.values()
+            if not session.busy and now - session.last_used > idle_timeout
+        ]
+        for session in idle:
+            del sessions[session.session_id]
+    for session in idle:
+        logger.info(f"Closing idle session {session.session_id}")
+        session.close()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    runtimes["python"] = PythonRuntime()
+    # start the runtime of the default session ahead of its first request
+    get_session().reset_runtime()
+    stop_reaping = threading.Event()
+
+    def reap() -> None:
+        while not stop_reaping.wait(REAP_INTERVAL):
+            reap_sessions(config.session_idle_timeout)
+
+    reaper = threading.Thread(target=reap, name="Session Reaper", daemon=True)
+    reaper.start()
     yield
-    runtimes["python"].close()
+    stop_reaping.set()
+    reaper.join()
+    with sessions_lock:
+        closing = list(sessions.values())
+        sessions.clear()
+    for session in closing:
+        session.close()
+    close_kernel_pools()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -54,7 +254,8 @@ def setup_evaluator(
     return evaluator_router
 
 
-def reset_task(comb: EvaluatorComb):
+def reset_task(comb: EvaluatorComb, task_status: TaskStatus):
+    bind_task_status(task_status)
     try:
         task_status.set_task_state(StateInfo(StateEnum.IN_PROGRESS))
         comb.reset()
@@ -69,7 +270,8 @@ def reset_task(comb: EvaluatorComb):
         )
 
 
-def eval_task(comb: EvaluatorComb):
+def eval_task(comb: EvaluatorComb, task_status: TaskStatus):
+    bind_task_status(task_status)
     try:
         task_status.set_task_state(StateInfo(StateEnum.IN_PROGRESS))
         score, feedback = comb()
@@ -95,22 +297,112 @@ async def health() -> Response:
 
 
 @app.post("/execute")
-async def execute_code(request: AgentStudioTextRequest) -> dict:
-    logger.info(f"Execute code: {request.message}")
-    result = runtimes["python"](request.message)
-    return result
+async def execute_code(request: AgentStudioExecuteRequest, session: SessionDep) -> dict:
+    """
+    Execute code on the runtime of the session and return its result. The
+    code runs on the worker of the session, so the server stays responsive.
+    """
+    logger.info(f"Execute code in session {session.session_id}: {request.message}")
+    job = session.submit(request.message, request.timeout)
+    try:
+        return await asyncio.wrap_future(job.future)
+    finally:
+        session.jobs.pop(job.job_id, None)
+
+
+@app.post("/execute/submit")
+async def submit_code(
+    request: AgentStudioExecuteRequest, session: SessionDep
+) -> AgentStudioJobResponse:
+    """
+    Submit code for execution on the runtime of the session.
+
+    Returns:
+        The job, whose job_id gives its status and result at
+        /execute/{job_id}.
+    """
+    logger.info(f"Submit code in session {session.session_id}: {request.message}")
+    return session.submit(request.message, request.timeout).response()
+
+
+def get_job(session: Session, job_id: str) -> ExecuteJob:
+    job = session.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
+
+
+@app.get("/execute/{job_id}")
+async def get_job_result(
+    job_id: str, session: SessionDep, wait: float = 0.0
+) -> AgentStudioJobResponse:
+    """
+    Get the status of an execution job, and its result once it is done. The
+    job is forgotten after its result was returned.
+
+    Args:
+        wait: Seconds to wait for the job to finish.
+    """
+    job = get_job(session, job_id)
+    if wait > 0 and not job.future.done():
+        await asyncio.wait(
+            [asyncio.wrap_future(job.future)], timeout=min(wait, MAX_STATUS_WAIT)
+        )
+    response = job.response()
+    if job.future.done():
+        session.jobs.pop(job_id, None)
+    return response
+
+
+@app.post("/execute/{job_id}/cancel")
+async def cancel_job(job_id: str, session: SessionDep) -> AgentStudioJobResponse:
+    """
+    Cancel an execution job, interrupting its code if it is running.
+    """
+    job = get_job(session, job_id)
+    session.cancel(job)
+    logger.info(f"Cancelled job {job_id} in session {session.session_id}")
+    return job.response()
 
 
 @app.post("/runtime/reset")
-async def reset_runtime() -> AgentStudioStatusResponse:
-    runtimes["python"].close()
-    runtimes["python"] = PythonRuntime()
-    logger.info("Reset runtime")
+def reset_runtime(
+    session: SessionDep, request: AgentStudioRuntimeResetRequest | None = None
+) -> AgentStudioStatusResponse:
+    """
+    Replace the runtime of the session with a new one from the kernel pool.
+
+    Args:
+        request:
+            init_code: Code executed in the new runtime before it is returned.
+    """
+    session.reset_runtime(None if request is None else request.init_code)
+    logger.info(f"Reset runtime of session {session.session_id}")
+    return AgentStudioStatusResponse(status="success")
+
+
+@app.delete("/session")
+def close_session(
+    session_id: Annotated[str, Header(alias=SESSION_HEADER)] = DEFAULT_SESSION
+) -> AgentStudioStatusResponse:
+    """
+    Close the session, stopping its task and shutting down its runtime.
+    """
+    with sessions_lock:
+        session = sessions.pop(session_id, None)
+    if session is None:
+        return AgentStudioStatusResponse(
+            status="error", content=f"Unknown session: {session_id}"
+        )
+    session.close()
+    logger.info(f"Closed session {session_id}")
     return AgentStudioStatusResponse(status="success")
 
 
 @app.post("/task/confirm")
-async def confirm(request: AgentStudioTextRequest) -> AgentStudioStatusResponse:
+async def confirm(
+    request: AgentStudioTextRequest, session: SessionDep
+) -> AgentStudioStatusResponse:
     """
     Confirm critical action.
 
@@ -121,18 +413,19 @@ async def confirm(request: AgentStudioTextRequest) -> AgentStudioStatusResponse:
     Returns:
         Always "success".
     """
-    global current_thread
-    assert current_thread is not None, "Invalid current_thread"
-    cur_state = task_status.get_task_state().state
+    assert session.current_thread is not None, "Invalid current_thread"
+    cur_state = session.task_status.get_task_state().state
     assert cur_state == StateEnum.WAIT_FOR_INPUT, f"Invalid status: {cur_state}"
-    task_status.set_task_state(
+    session.task_status.set_task_state(
         StateInfo(state=StateEnum.IN_PROGRESS, message=request.message)
     )
     return AgentStudioStatusResponse(status="success")
 
 
 @app.post("/task/reset")
-async def new_task(request: AgentStudioResetRequest) -> AgentStudioStatusResponse:
+def new_task(
+    request: AgentStudioResetRequest, session: SessionDep
+) -> AgentStudioStatusResponse:
     """
     Reset the task.
 
@@ -140,16 +433,7 @@ async def new_task(request: AgentStudioResetRequest) -> AgentStudioStatusRespons
         request:
             task_config: The task configuration.
     """
-    global current_thread
-    cur_status = task_status.get_task_state()
-    if cur_status.state not in [StateEnum.PENDING, StateEnum.FINISHED]:
-        logger.info(
-            f"Stopping current task: {cur_status.state}, on thread: {current_thread}"
-        )
-        assert current_thread is not None, "Invalid current_thread"
-        task_status.set_task_state(StateInfo(StateEnum.TERMINATE))
-        current_thread.join()
-        task_status.reset_state()
+    session.stop_task()
 
     logger.info(f"Start resetting task: {request.task_config}")
     try:
@@ -157,15 +441,21 @@ async def new_task(request: AgentStudioResetRequest) -> AgentStudioStatusRespons
             env=config.env_type,
         )
         comb = evaluator_router(request.task_config)
-        current_thread = threading.Thread(target=reset_task, args=(comb,))
-        current_thread.start()
+        session.current_thread = threading.Thread(
+            target=reset_task, args=(comb, session.task_status)
+        )
+        # set before returning, so that status requests never see the last task
+        session.task_status.set_task_state(StateInfo(StateEnum.IN_PROGRESS))
+        session.current_thread.start()
         return AgentStudioStatusResponse(status="submitted")
     except Exception as e:
         return AgentStudioStatusResponse(status="error", content=str(e))
 
 
 @app.post("/task/eval")
-async def submit_eval(request: AgentStudioEvalRequest) -> AgentStudioStatusResponse:
+async def submit_eval(
+    request: AgentStudioEvalRequest, session: SessionDep
+) -> AgentStudioStatusResponse:
     """
     Evaluate the given task.
 
@@ -179,9 +469,8 @@ async def submit_eval(request: AgentStudioEvalRequest) -> AgentStudioStatusRespo
             If successful, the result contains the score and feedback.
             If failed, the result contains the error message.
     """
-    global current_thread
-    assert current_thread is not None, "Invalid current_thread"
-    cur_status = task_status.get_task_state()
+    assert session.current_thread is not None, "Invalid current_thread"
+    cur_status = session.task_status.get_task_state()
     assert cur_status.state in [
         StateEnum.PENDING,
         StateEnum.FINISHED,
@@ -193,23 +482,18 @@ async def submit_eval(request: AgentStudioEvalRequest) -> AgentStudioStatusRespo
         )
         logger.info(f"Start evaluating task: {request.task_config}")
         comb: EvaluatorComb = evaluator_router(request.task_config)
-        current_thread = threading.Thread(
+        session.current_thread = threading.Thread(
             target=eval_task,
-            args=(comb,),
+            args=(comb, session.task_status),
         )
-        current_thread.start()
+        session.task_status.set_task_state(StateInfo(StateEnum.IN_PROGRESS))
+        session.current_thread.start()
         return AgentStudioStatusResponse(status="submitted")
     except Exception as e:
         return AgentStudioStatusResponse(status="error", content=str(e))
 
 
-@app.get("/task/status")
-async def get_status() -> AgentStudioStatusResponse:
-    """
-    Get the status of the current task.
-    """
-    cur_status = task_status.get_task_state()
-    logger.debug(f"Get current status: {cur_status}")
+def status_response(cur_status: StateInfo) -> AgentStudioStatusResponse:
     if cur_status.state == StateEnum.PENDING:
         return AgentStudioStatusResponse(status="pending")
     elif cur_status.state == StateEnum.IN_PROGRESS:
@@ -229,12 +513,55 @@ async def get_status() -> AgentStudioStatusResponse:
         raise ValueError(f"Invalid state: {cur_status}")
 
 
+@app.get("/task/status")
+def get_status(session: SessionDep, wait: float = 0.0) -> AgentStudioStatusResponse:
+    """
+    Get the status of the current task.
+
+    Args:
+        wait: Seconds to wait while the task is pending or in progress, so that
+            the response arrives as soon as the task finishes or needs input.
+    """
+    if wait > 0:
+        cur_status = session.task_status.wait_while(
+            [StateEnum.PENDING, StateEnum.IN_PROGRESS], min(wait, MAX_STATUS_WAIT)
+        )
+    else:
+        cur_status = session.task_status.get_task_state()
+    logger.debug(f"Get current status: {cur_status}")
+    return status_response(cur_status)
+
+
+@app.get("/task/status/stream")
+def stream_status(session: SessionDep) -> StreamingResponse:
+    """
+    Stream the status of the current task as server-sent events, one when
+    connecting and one whenever the status changes.
+    """
+
+    task_status = session.task_status
+
+    def events():
+        version = -1
+        while True:
+            new_version, cur_status = task_status.wait_for_update(
+                version, STATUS_KEEPALIVE
+            )
+            if new_version == version:
+                yield ": keep-alive\n\n"
+            else:
+                version = new_version
+                yield f"data: {status_response(cur_status).model_dump_json()}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
 @app.get("/task/result")
-async def get_result() -> AgentStudioResultResponse:
+async def get_result(session: SessionDep) -> AgentStudioResultResponse:
     """
     Get the result of the current task.
     """
-    cur_status = task_status.get_task_state()
+    cur_status = session.task_status.get_task_state()
     assert cur_status.state == StateEnum.FINISHED, f"Invalid status: {cur_status}"
     return AgentStudioResultResponse(
         status=cur_status.state.value,
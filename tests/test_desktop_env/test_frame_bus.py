@@ -0,0 +1,111 @@
+import logging
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+
+from agent_studio.config import Config
+from agent_studio.envs.desktop_env.frame_bus import SharedFrameBus
+from agent_studio.envs.desktop_env.vnc_client import FrameStore, Streamer, VNCStreamer
+
+
+def read_frame(name: str, seq: int, queue: multiprocessing.Queue) -> None:
+    bus = SharedFrameBus.attach(name)
+    assert bus.wait_for_frame(seq - 1, timeout=5)
+    result = bus.read(seq)
+    queue.put(None if result is None else result[1].sum())
+    bus.close()
+
+
+def test_frame_bus() -> None:
+    bus = SharedFrameBus.create(40, 36, slots=3)
+    try:
+        assert bus.latest_seq == 0 and bus.read() is None
+        assert not bus.wait_for_frame(0, timeout=0.01)
+        frames = [np.full((36, 40, 3), seq, "B") for seq in range(1, 6)]
+        for seq, frame in enumerate(frames, 1):
+            assert bus.publish(seq, frame, timestamp=seq)
+
+        reader = SharedFrameBus.attach(bus.name)
+        assert reader.latest_seq == 5
+        seq, frame = reader.read()
+        assert seq == 5 and np.array_equal(frame, frames[4])
+        assert reader.read(3)[1][0, 0, 0] == 3
+        assert reader.read(2) is None  # overwritten
+        assert reader.read(6) is None  # not published yet
+
+        # Smaller frames after a desktop resize
+        bus.publish(6, np.ones((10, 20, 3), "B"), timestamp=6)
+        assert reader.read()[1].shape == (10, 20, 3)
+        reader.close()
+
+        queue: multiprocessing.Queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=read_frame, args=(bus.name, 7, queue))
+        process.start()
+        bus.publish(7, frames[0], timestamp=7)
+        assert queue.get(timeout=30) == frames[0].sum()
+        process.join()
+
+        # A frame too large for the bus marks it for a resize
+        assert bus.resize_to is None
+        assert not bus.publish(8, np.zeros((37, 40, 3), "B"), timestamp=8)
+        assert bus.resize_to == (40, 37)
+        assert bus.wait_for_frame(7, timeout=0)
+    finally:
+        bus.close()
+
+
+def test_frame_bus_resize(
+    monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+) -> None:
+    bus = SharedFrameBus.create(40, 36, slots=3)
+    try:
+        with caplog.at_level(logging.WARNING):
+            for seq in range(1, 4):
+                assert not bus.publish(seq, np.zeros((36, 50, 3), "B"), seq)
+        warnings = [r for r in caplog.records if r.levelno == logging.WARNING]
+        assert len(warnings) == 1
+    finally:
+        bus.close()
+
+    monkeypatch.setattr(Config(), "frame_bus", True)
+    streamer = Streamer()
+    streamer._publish(FrameStore().view(np.zeros((36, 40, 3), "B")), [(0, 0, 40, 36)])
+    assert streamer.frame_bus is not None
+    name = streamer.frame_bus.name
+    reader = SharedFrameBus.attach(name)
+    try:
+        # The desktop grows, the bus is replaced under the same name
+        frame = FrameStore().view(np.ones((48, 64, 3), "B"))
+        streamer._publish(frame, [(0, 0, 64, 48)])
+        assert reader.wait_for_frame(1, timeout=0) and reader.resize_to == (64, 48)
+        reader.close()
+        reader = SharedFrameBus.attach(name)
+        assert reader.resize_to is None
+        seq, latest = reader.read()
+        assert seq == 2 and np.array_equal(latest, frame)
+    finally:
+        reader.close()
+        streamer._notify_stopped()
+
+
+def test_frame_bus_names(monkeypatch: pytest.MonkeyPatch) -> None:
+    config = Config()
+    monkeypatch.setattr(config, "frame_bus", True)
+    monkeypatch.setattr(config, "frame_bus_name", f"test_bus_{os.getpid()}")
+    frame = FrameStore().view(np.zeros((36, 40, 3), "B"))
+    # Streamers of different servers share the configured name
+    streamers = [VNCStreamer("127.0.0.1", port, "") for port in (5900, 5901, 5900)]
+    try:
+        for streamer in streamers:
+            streamer._publish(frame, [(0, 0, 40, 36)])
+            streamer._publish(frame, [(0, 0, 40, 36)])
+        names = [streamers[0].frame_bus.name, streamers[1].frame_bus.name]
+        assert len(set(names)) == 2
+        assert all(name.startswith(config.frame_bus_name) for name in names)
+        # A second streamer of the same server gives up on the bus once
+        assert streamers[2].frame_bus is None and streamers[2].frame_bus_failed
+    finally:
+        for streamer in streamers:
+            streamer._notify_stopped()
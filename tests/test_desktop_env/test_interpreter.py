@@ -1,6 +1,8 @@
+import threading
+
 import pytest
 
-from agent_studio.agent.runtime import PythonRuntime
+from agent_studio.agent.runtime import KernelPool, PythonRuntime
 
 
 @pytest.fixture(scope="function")
@@ -40,3 +42,26 @@ def test_response_data(python_interpreter):
     """
     result = python_interpreter(code_with_plot)
     assert list(result["output"].keys()) == ["text/plain", "image/png"]
+
+
+def test_timeout(python_interpreter):
+    result = python_interpreter("import time\ntime.sleep(10)", timeout=1)
+    assert result["error"].startswith("Jupyter timeout")
+    result = python_interpreter('print("Still running")')
+    assert result == {"output": ["Still running\n"]}
+
+
+def test_interrupt(python_interpreter):
+    threading.Timer(0.5, python_interpreter.interrupt).start()
+    result = python_interpreter("import time\ntime.sleep(10)")
+    assert result["error"].startswith("KeyboardInterrupt")
+
+
+def test_kernel_pool():
+    pool = KernelPool(size=1, init_code="greeting = 'Hello'")
+    runtimes = [pool.get(), pool.get()]
+    assert runtimes[0] is not runtimes[1]
+    for runtime in runtimes:
+        assert runtime("print(greeting)") == {"output": ["Hello\n"]}
+        runtime.close()
+    pool.close()
@@ -1,15 +1,27 @@
+import json
+import os
 import platform
 import time
 
+import cv2
+import numpy as np
 import pytest
 
 from agent_studio.envs.desktop_env.recorder.screen_recorder import (
     DarwinWindowManager,
+    FrameBuffer,
     LinuxWindowManager,
     ScreenRecorder,
+    VNCRecorder,
     WindowManagerDummy,
     WindowsWindowManager,
 )
+from agent_studio.envs.desktop_env.recorder.video_encoder import (
+    VideoEncoder,
+    segments_path,
+    timestamps_path,
+)
+from agent_studio.envs.desktop_env.vnc_client import Cursor, FrameStore, Streamer
 
 
 @pytest.mark.skip(reason="Can only be tested manually.")
@@ -40,3 +52,191 @@ def test_screen_recorder(fps: int = 5, duration: int = 10) -> None:
     frames = rec.frame_buffer.get_frames(start_frame_id=0, end_frame_id=None)
     assert len(frames) == duration * fps
     rec.save("data/trajectories/test/test.mp4", start_frame_id=0)
+
+
+def test_screen_recorder_timing(tmp_path, fps: int = 10) -> None:
+    rec = ScreenRecorder(fps=fps)
+    rec.start()
+    time.sleep(1)
+    rec.stop()
+    rec.wait_exit()
+    meta = rec.save((tmp_path / "test.mp4").as_posix(), start_frame_id=0)
+    assert meta["target_fps"] == fps
+    assert abs(meta["achieved_fps"] - fps) < 2
+    frame_times = meta["frame_times"]
+    assert len(frame_times) == meta["frame_count"]
+    # Frames are captured on absolute deadlines, without accumulating drift
+    assert all(
+        abs(frame_time - frame_id / fps) < 0.5 / fps
+        for frame_id, frame_time in enumerate(frame_times)
+    )
+
+
+class FakeVNCStreamer(Streamer):
+    """Streamer with a cursor kept apart from its frames, like a VNC one."""
+
+    def __init__(self, cursor: Cursor, pointer: tuple[int, int]) -> None:
+        super().__init__()
+        self.video_width, self.video_height = 64, 48
+        self.cursor, self.pointer = cursor, pointer
+        self.resize_callbacks: list = []
+
+    def add_resize_callback(self, callback) -> None:
+        self.resize_callbacks.append(callback)
+
+    def remove_resize_callback(self, callback) -> None:
+        self.resize_callbacks.remove(callback)
+
+    def get_cursor(self):
+        return self.cursor, self.pointer
+
+
+def test_vnc_recorder_cursor() -> None:
+    image = np.zeros((4, 4, 4), "B")
+    image[..., 0] = image[..., 3] = 255
+    streamer = FakeVNCStreamer(Cursor(image, 1, 1), (10, 20))
+    frame = FrameStore().view(np.zeros((48, 64, 3), "B"))
+    streamer._publish(frame, [(0, 0, 64, 48)])
+    rec = VNCRecorder(streamer, fps=10)  # type: ignore
+    rec.start()
+    time.sleep(0.3)
+    rec.stop()
+    rec.wait_exit()
+    assert not streamer.resize_callbacks  # the streamer outlives the recorder
+    recorded = rec.frame_buffer.get_frame(0)
+    # Drawn with its hotspot on the pointer, into the recorded frames only
+    assert (recorded[19:23, 9:13] == [255, 0, 0]).all()
+    assert recorded[:19].sum() == 0 and rec.current_frame is frame
+
+
+def test_frame_buffer() -> None:
+    buffer = FrameBuffer()
+    first, second = np.zeros((2, 2, 3), "B"), np.ones((2, 2, 3), "B")
+    buffer.add_frame(0, first)
+    buffer.add_duplicate()
+    buffer.add_duplicate()
+    buffer.add_frame(3, second)
+    buffer.add_duplicate()
+    assert len(buffer) == 5 and buffer.get_frame(2) is first
+    frames = buffer.get_frames(start_frame_id=1, end_frame_id=3)
+    assert [frame_id for frame_id, _ in frames] == [1, 2, 3]
+    assert frames[1][1] is first and frames[2][1] is second
+    assert len(buffer.get_frames(start_frame_id=0)) == 5
+
+
+def test_video_encoder(tmp_path) -> None:
+    video_path = (tmp_path / "video" / "test.mp4").as_posix()
+    encoder = VideoEncoder(video_path, fps=5, width=64, height=48, queue_size=2)
+    encoder.start()
+    for value in range(10):
+        encoder.write(np.full((48, 64, 3), value * 20, "B"))
+    # Frames captured after a desktop resize
+    encoder.write(np.zeros((24, 32, 3), "B"))
+    assert encoder.close() == 11
+    assert encoder.close() == 11
+    video = cv2.VideoCapture(video_path)
+    assert video.get(cv2.CAP_PROP_FRAME_COUNT) == 11
+    assert video.get(cv2.CAP_PROP_FRAME_WIDTH) == 64
+    video.release()
+    with pytest.raises(RuntimeError):
+        encoder.write(np.zeros((48, 64, 3), "B"))
+
+
+class FailingWriter:
+    def write(self, frame: np.ndarray) -> None:
+        raise OSError("Disk full")
+
+    def release(self) -> None:
+        pass
+
+
+def test_video_encoder_failure(tmp_path) -> None:
+    video_path = (tmp_path / "test.mp4").as_posix()
+    encoder = VideoEncoder(video_path, fps=5, width=64, height=48, queue_size=1)
+    encoder.start()
+    encoder.writer.release()
+    encoder.writer = FailingWriter()
+    start = time.time()
+    # fails instead of blocking on the full queue once the encoder stopped
+    with pytest.raises(RuntimeError, match="Disk full"):
+        for _ in range(10):
+            encoder.write(np.zeros((48, 64, 3), "B"))
+    assert time.time() - start < 5
+    assert isinstance(encoder.error, OSError)
+    assert encoder.close() == 0
+
+
+def test_frame_buffer_spill(tmp_path) -> None:
+    buffer = FrameBuffer(capacity=3, spill_dir=tmp_path.as_posix())
+    frames = [np.full((4, 6, 3), value, "B") for value in range(5)]
+    for index, frame in enumerate(frames):
+        buffer.add_frame(10 + 2 * index, frame)
+        buffer.add_duplicate()
+    assert len(buffer) == 10 and buffer.spill_file is not None
+    # Only the newest frames stay in memory
+    assert buffer.get_frame(19) is frames[4]
+    assert np.array_equal(buffer.get_frame(10), frames[0])
+    assert buffer.get_frame(9) is None and buffer.get_frame(20) is None
+    frames_read = buffer.get_frames(start_frame_id=12, end_frame_id=15)
+    assert [frame_id for frame_id, _ in frames_read] == [12, 13, 14, 15]
+    assert [frame[0, 0, 0] for _, frame in frames_read] == [1, 1, 2, 2]
+    with pytest.raises(ValueError):
+        buffer.add_frame(30, frames[0])
+    buffer.clear()
+    assert len(buffer) == 0 and buffer.spill_file is None
+
+
+def test_video_encoder_vfr(tmp_path) -> None:
+    video_path = (tmp_path / "test.mp4").as_posix()
+    encoder = VideoEncoder(video_path, fps=5, width=64, height=48, vfr=True)
+    encoder.start()
+    # Frame ids 0, 3 and 4 changed, the others repeated the previous frame
+    for frame_id in [0, 3, 4]:
+        encoder.write(np.full((48, 64, 3), frame_id, "B"), frame_id)
+    assert encoder.close() == 3
+    with open(timestamps_path(video_path)) as f:
+        assert f.read().split("\n")[1:4] == ["0.000", "600.000", "800.000"]
+
+
+def test_video_encoder_segments(tmp_path) -> None:
+    video_path = (tmp_path / "video.mp4").as_posix()
+    encoder = VideoEncoder(video_path, fps=5, width=64, height=48, segment_frames=4)
+    encoder.start()
+    for frame_id in range(10):
+        encoder.write(np.full((48, 64, 3), frame_id, "B"), timestamp=frame_id)
+    # Steps map to the last frame captured before them
+    assert encoder.add_step(5.5)["frame_id"] == 5
+    assert encoder.close() == 10
+    assert encoder.add_step(-1.0)["frame_id"] == 0
+
+    with open(encoder.index_path) as f:
+        index = [json.loads(line) for line in f]
+    segments = [entry for entry in index if entry["type"] == "segment"]
+    steps = [entry for entry in index if entry["type"] == "step"]
+    assert [entry["frame_count"] for entry in segments] == [4, 4, 2]
+    assert segments[2]["first_frame_id"] == 8 and segments[2]["end_time"] == 9
+    assert (steps[0]["segment"], steps[0]["frame_index"]) == (1, 1)
+    for entry in segments:
+        path = os.path.join(segments_path(video_path), entry["path"])
+        assert os.path.getsize(path) == entry["bytes"]
+
+
+@pytest.mark.parametrize("codec", ["zlib", "png"])
+def test_frame_buffer_codec(tmp_path, codec: str) -> None:
+    buffer = FrameBuffer(capacity=6, spill_dir=tmp_path.as_posix(), codec=codec)
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (48, 64, 3), np.uint8)
+    frames = []
+    for frame_id in range(8):
+        frame = frame.copy()
+        frame[frame_id, :8] = 0  # small change to the previous frame
+        frames.append(frame)
+        buffer.add_frame(frame_id * 2, frame)
+        buffer.add_duplicate()
+    for frame_id, frame in enumerate(frames):
+        assert np.array_equal(buffer.get_frame(frame_id * 2), frame)
+        assert np.array_equal(buffer.get_frame(frame_id * 2 + 1), frame)
+    # Duplicates are decompressed once
+    assert buffer.get_frame(14) is buffer.get_frame(15)
+    # Deltas against the keyframe compress well
+    assert buffer.nbytes < 2 * frames[0].nbytes
@@ -0,0 +1,32 @@
+import time
+
+from agent_studio.envs.desktop_env.step_pipeline import StepPipeline
+
+
+class FakeAgent:
+    def __init__(self, steps: int) -> None:
+        self.steps = steps
+        self.trajectory: list[dict] = []
+
+    def step_action(self, confirmed: bool) -> tuple[dict, bool]:
+        time.sleep(0.05)
+        self.trajectory.append({"timestamp": time.time()})
+        return {"content": len(self.trajectory)}, len(self.trajectory) >= self.steps
+
+
+def test_step_pipeline() -> None:
+    settled = []
+    pipeline = StepPipeline(
+        FakeAgent(steps=3), None, settle=lambda: settled.append(time.time())
+    )
+    assert pipeline.observe() is None
+    results = []
+    done = False
+    while not done:
+        result, done, obs = pipeline.step(confirmed=True)
+        results.append(result["content"])
+        assert obs is None
+    pipeline.close()
+    assert results == [1, 2, 3]
+    # No wait follows the last action
+    assert len(settled) == 2
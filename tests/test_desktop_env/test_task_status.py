@@ -0,0 +1,61 @@
+import threading
+import time
+
+from agent_studio.utils.task_status import (
+    StateEnum,
+    StateInfo,
+    TaskStatus,
+    bind_task_status,
+    current_task_status,
+)
+
+
+def test_task_status_wait() -> None:
+    task_status = TaskStatus()
+    task_status.reset_state()
+    busy = [StateEnum.PENDING, StateEnum.IN_PROGRESS]
+
+    start = time.time()
+    state = task_status.wait_while(busy, timeout=0.1)
+    assert state.state == StateEnum.PENDING
+    assert time.time() - start >= 0.1
+
+    version, state = task_status.wait_for_update(-1, timeout=0)
+    assert state.state == StateEnum.PENDING
+
+    def finish() -> None:
+        task_status.set_task_state(StateInfo(StateEnum.IN_PROGRESS))
+        time.sleep(0.1)
+        task_status.set_task_state(StateInfo(StateEnum.FINISHED, result="success"))
+
+    thread = threading.Thread(target=finish)
+    thread.start()
+    version, state = task_status.wait_for_update(version, timeout=5)
+    assert state.state in [StateEnum.IN_PROGRESS, StateEnum.FINISHED]
+    start = time.time()
+    state = task_status.wait_while(busy, timeout=5)
+    assert state.state == StateEnum.FINISHED
+    assert time.time() - start < 1
+    thread.join()
+
+    # no update within the timeout
+    new_version, state = task_status.wait_for_update(task_status.version, 0.05)
+    assert new_version == task_status.version
+    task_status.reset_state()
+
+
+def test_current_task_status() -> None:
+    default = current_task_status()
+    session = TaskStatus()
+    assert session is not default
+    bound = []
+
+    def evaluate() -> None:
+        bind_task_status(session)
+        bound.append(current_task_status())
+
+    thread = threading.Thread(target=evaluate)
+    thread.start()
+    thread.join()
+    assert bound == [session]
+    assert current_task_status() is default
@@ -0,0 +1,586 @@
+import asyncio
+import struct
+import threading
+from zlib import Z_SYNC_FLUSH, compressobj, decompressobj
+
+import cv2
+import numpy as np
+import pytest
+
+from agent_studio.envs.desktop_env.vnc_client import (
+    BufferedReader,
+    Cursor,
+    FramePacer,
+    FrameStore,
+    LocalStreamer,
+    ScreenSettleDetector,
+    Streamer,
+    Video,
+    VNCClient,
+    VNCStreamer,
+    VNCStreamerPool,
+    composite_cursor,
+    frame_difference,
+)
+
+
+def decode_video(
+    payload: bytes,
+    width: int = 40,
+    height: int = 36,
+    data: np.ndarray | None = None,
+    resize_callbacks: list | None = None,
+    rects: int = 1,
+) -> Video:
+    """Decodes framebuffer update rectangles and returns the video."""
+
+    async def _decode() -> Video:
+        reader = asyncio.StreamReader()
+        reader.feed_data(payload)
+        reader.feed_eof()
+        video = Video(
+            BufferedReader(reader, chunk_size=7),
+            None,  # type: ignore
+            decompressobj().decompress,
+            "test",
+            width,
+            height,
+            "rgba",
+            data,
+        )
+        video.resize_callbacks.extend(resize_callbacks or [])
+        for _ in range(rects):
+            await video.read()
+        return video
+
+    return asyncio.run(_decode())
+
+
+def decode(payload: bytes, width: int = 40, height: int = 36) -> np.ndarray:
+    """Decodes a single framebuffer update rectangle into a fresh buffer."""
+    data = decode_video(payload, width, height).data
+    assert data is not None
+    return data
+
+
+def test_hextile_decoding() -> None:
+    width, height = 40, 36
+    rng = np.random.default_rng(0)
+    expected = np.zeros((height, width, 4), "B")
+    expected[..., 3] = 255
+    payload = struct.pack("!HHHHi", 0, 0, width, height, 5)
+    red, blue = bytes([255, 0, 0, 0]), bytes([0, 0, 255, 0])
+    background = (0, 0, 0)
+    for tile_index, ty in enumerate(range(0, height, 16)):
+        th = min(16, height - ty)
+        for tx in range(0, width, 16):
+            tw = min(16, width - tx)
+            tile = expected[ty : ty + th, tx : tx + tw]
+            kind = (tile_index + tx // 16) % 4
+            if kind == 0:  # raw
+                pixels = rng.integers(0, 256, (th, tw, 4), dtype="B")
+                tile[..., :3] = pixels[..., :3]
+                payload += bytes([1]) + pixels.tobytes()
+            elif kind == 1:  # background and monochrome subrects
+                tile[..., :3] = background = (255, 0, 0)
+                tile[1:3, 2:6, :3] = 0, 0, 255
+                tile[5:6, 0:1, :3] = 0, 0, 255
+                payload += bytes([2 | 4 | 8]) + red + blue + bytes([2])
+                payload += bytes([(2 << 4) | 1, (3 << 4) | 1, 5, 0])
+            elif kind == 2:  # background carried over from the previous tile
+                tile[..., :3] = background
+                payload += bytes([0])
+            else:  # coloured subrects
+                tile[..., :3] = background = (0, 0, 255)
+                tile[0:2, 0:2, :3] = 9, 8, 7
+                payload += bytes([2 | 8 | 16]) + blue + bytes([1])
+                payload += bytes([9, 8, 7, 0, 0, (1 << 4) | 1])
+
+    data = decode(payload, width, height)
+    np.testing.assert_array_equal(data, expected)
+
+
+def compact_length(length: int) -> bytes:
+    data = bytes([length & 0x7F | (0x80 if length > 0x7F else 0)])
+    if length > 0x7F:
+        data += bytes([(length >> 7) & 0x7F | (0x80 if length > 0x3FFF else 0)])
+    if length > 0x3FFF:
+        data += bytes([length >> 14])
+    return data
+
+
+def test_tight_decoding() -> None:
+    rng = np.random.default_rng(0)
+    width, height = 40, 36
+    streams = [compressobj() for _ in range(4)]
+
+    def header(x, y, w, h):
+        return struct.pack("!HHHHi", x, y, w, h, 7)
+
+    def zlib_data(stream: int, data: bytes) -> bytes:
+        compressed = streams[stream].compress(data)
+        compressed += streams[stream].flush(Z_SYNC_FLUSH)
+        return compact_length(len(compressed)) + compressed
+
+    # Fill
+    colour = bytes([1, 2, 3])
+    data = decode(header(0, 0, width, height) + bytes([0x80]) + colour)
+    assert (data[..., :3] == [1, 2, 3]).all() and (data[..., 3] == 255).all()
+
+    # Basic compression with the copy filter
+    pixels = rng.integers(0, 256, (height, width, 3), dtype="B")
+    payload = header(0, 0, width, height) + bytes([0x10])
+    data = decode(payload + zlib_data(1, pixels.tobytes()))
+    np.testing.assert_array_equal(data[..., :3], pixels)
+
+    # Two-colour palette
+    bits = rng.integers(0, 2, (height, width), dtype="B")
+    palette = np.array([[10, 20, 30], [40, 50, 60]], "B")
+    payload = header(0, 0, width, height) + bytes([0x60, 1, 1]) + palette.tobytes()
+    payload += zlib_data(2, np.packbits(bits, axis=1).tobytes())
+    data = decode(payload)
+    np.testing.assert_array_equal(data[..., :3], palette[bits])
+
+    # Gradient filter
+    pixels = rng.integers(0, 256, (height, width, 3)).astype(int)
+    padded = np.pad(pixels, ((1, 0), (1, 0), (0, 0)))
+    prediction = np.clip(padded[1:, :-1] + padded[:-1, 1:] - padded[:-1, :-1], 0, 255)
+    residuals = ((pixels - prediction) & 0xFF).astype("B")
+    payload = header(0, 0, width, height) + bytes([0x40, 2])
+    data = decode(payload + zlib_data(0, residuals.tobytes()))
+    np.testing.assert_array_equal(data[..., :3], pixels)
+
+    # JPEG
+    image = np.zeros((height, width, 3), "B")
+    image[:, : width // 2] = 200, 100, 50
+    _, jpeg = cv2.imencode(".jpg", image[..., ::-1])
+    payload = header(0, 0, width, height) + bytes([0x90])
+    data = decode(payload + compact_length(len(jpeg)) + jpeg.tobytes())
+    assert np.abs(data[..., :3].astype(int) - image).mean() < 4
+
+    # Data shorter than 12 bytes is sent uncompressed
+    pixels = rng.integers(0, 256, (1, 3, 3), dtype="B")
+    data = decode(header(5, 6, 3, 1) + bytes([0x00]) + pixels.tobytes())
+    np.testing.assert_array_equal(data[6:7, 5:8, :3], pixels)
+
+
+def test_zrle_decoding() -> None:
+    rng = np.random.default_rng(0)
+    width, height = 130, 70
+    expected = np.zeros((height, width, 4), "B")
+    expected[..., 3] = 255
+    tiles = b""
+    for index, ty in enumerate(range(0, height, 64)):
+        th = min(64, height - ty)
+        for tx in range(0, width, 64):
+            tw = min(64, width - tx)
+            tile = expected[ty : ty + th, tx : tx + tw, :3]
+            kind = (index * 3 + tx // 64) % 5
+            if kind == 0:  # raw
+                tile[:] = rng.integers(0, 256, (th, tw, 3), dtype="B")
+                tiles += bytes([0]) + tile.tobytes()
+            elif kind == 1:  # solid
+                tile[:] = 7, 8, 9
+                tiles += bytes([1, 7, 8, 9])
+            elif kind == 2:  # packed palette with 2 bits per pixel
+                palette = rng.integers(0, 256, (3, 3), dtype="B")
+                indices = rng.integers(0, 3, (th, tw), dtype="B")
+                tile[:] = palette[indices]
+                padded = np.zeros((th, (tw * 2 + 7) // 8 * 4), "B")
+                padded[:, :tw] = indices
+                packed = np.packbits(
+                    np.unpackbits(padded[..., None], axis=2)[..., 6:].reshape(th, -1),
+                    axis=1,
+                )
+                tiles += bytes([3]) + palette.tobytes() + packed.tobytes()
+            elif kind == 3:  # plain RLE
+                flat = np.zeros((th * tw, 3), "B")
+                flat[: tw * th // 2] = 1, 2, 3
+                flat[tw * th // 2 :] = 4, 5, 6
+                tile[:] = flat.reshape(th, tw, 3)
+                run = tw * th // 2 - 1
+                first = bytes([255] * (run // 255) + [run % 255])
+                run = tw * th - tw * th // 2 - 1
+                second = bytes([255] * (run // 255) + [run % 255])
+                tiles += bytes([128, 1, 2, 3]) + first + bytes([4, 5, 6]) + second
+            else:  # palette RLE
+                tile[:] = 11, 12, 13
+                tile[0, 0] = 14, 15, 16
+                run = tw * th - 2
+                tiles += bytes([130, 11, 12, 13, 14, 15, 16, 1, 0x80])
+                tiles += bytes([255] * (run // 255) + [run % 255])
+
+    compressor = compressobj()
+    compressed = compressor.compress(tiles) + compressor.flush(Z_SYNC_FLUSH)
+    payload = struct.pack("!HHHHiI", 0, 0, width, height, 16, len(compressed))
+    data = decode(payload + compressed, width, height)
+    np.testing.assert_array_equal(data, expected)
+
+
+def test_copyrect_decoding() -> None:
+    rng = np.random.default_rng(3)
+    data = rng.integers(0, 256, (36, 40, 4), dtype="B")
+    expected = data.copy()
+    # Overlapping source and destination, as produced by scrolling
+    expected[4:24, 2:32] = data[0:20, 0:30]
+    payload = struct.pack("!HHHHiHH", 2, 4, 30, 20, 1, 0, 0)
+    video = decode_video(payload, data=data)
+    assert np.array_equal(video.data, expected)
+
+
+def test_desktop_resize() -> None:
+    extended = struct.pack("!B3xIHHHHI", 1, 0, 0, 0, 64, 48, 0)
+    for payload in (
+        struct.pack("!HHHHi", 0, 0, 64, 48, -223),
+        struct.pack("!HHHHi", 0, 0, 64, 48, -308) + extended,
+    ):
+        sizes: list[tuple[int, int]] = []
+        video = decode_video(
+            payload, resize_callbacks=[lambda w, h: sizes.append((w, h))]
+        )
+        assert video.data is not None and video.data.shape == (48, 64, 4)
+        assert (video.width, video.height) == (64, 48) and video.resized
+        assert sizes == [(64, 48)]
+
+    # The initial ExtendedDesktopSize message reports the current size
+    video = decode_video(struct.pack("!HHHHi", 0, 0, 64, 48, -308) + extended, 64, 48)
+    assert not video.resized
+
+
+def test_cursor() -> None:
+    rng = np.random.default_rng(4)
+    width, height, hotspot = 10, 6, (2, 3)
+    pixels = rng.integers(0, 256, (height, width, 4), dtype="B")
+    mask = rng.integers(0, 2, (height, width), dtype="B")
+    payload = (
+        struct.pack("!HHHHi", *hotspot, width, height, -239)
+        + pixels.tobytes()
+        + np.packbits(mask, axis=1).tobytes()
+        + struct.pack("!HHHHi", 38, 1, 0, 0, -232)
+    )
+    video = decode_video(payload, rects=2)
+    assert video.cursor is not None and video.pointer == (38, 1)
+    assert (video.cursor.hotspot_x, video.cursor.hotspot_y) == hotspot
+    assert np.array_equal(video.cursor.image[..., :3], pixels[..., :3])
+    assert np.array_equal(video.cursor.image[..., 3], mask * 255)
+
+    # Only copies are drawn on, and the cursor is clipped to the frame
+    frame = np.zeros((36, 40, 3), "B")
+    composited = composite_cursor(frame, video.cursor, *video.pointer)
+    assert not frame.any()
+    expected = frame.copy()
+    region = expected[0:4, 36:40]
+    visible = mask[2:6, 0:4].astype(bool)
+    region[visible] = pixels[2:6, 0:4, :3][visible]
+    assert np.array_equal(composited, expected)
+    assert video.as_rgba(with_cursor=True)[0:4, 36:40, 3][visible].all()
+    assert not video.as_rgba().any()
+
+
+def test_streamer_damage() -> None:
+    streamer = Streamer()
+    streamer.is_streaming = True
+    frame = np.zeros((36, 40, 3), "B")
+    assert streamer.get_frame() == (0, None)
+    assert not streamer.wait_for_change(timeout=0.01)
+
+    changed = frame.copy()
+    changed[5:9, 10:12] = 255
+    damage = frame_difference(frame, changed)
+    assert damage == [(10, 5, 2, 4)]
+    assert frame_difference(frame, frame) == []
+    assert frame_difference(None, frame) == [(0, 0, 40, 36)]
+
+    publisher = threading.Timer(0.05, streamer._publish, (changed, damage))
+    publisher.start()
+    assert streamer.wait_for_change(timeout=5)
+    assert streamer.get_frame()[0] == 1 and streamer.get_frame()[1] is changed
+    streamer._publish(changed, [(0, 0, 1, 1), (10, 5, 2, 4)])
+    assert streamer.get_damage(0) == [(10, 5, 2, 4), (0, 0, 1, 1)]
+    assert streamer.get_damage(1) == [(0, 0, 1, 1), (10, 5, 2, 4)]
+    assert streamer.get_damage(2) == []
+    # A change that happened before waiting is not missed
+    assert streamer.wait_for_change(timeout=0, seq=1)
+
+    for _ in range(Streamer.damage_history):
+        streamer._publish(changed, [(0, 0, 1, 1)])
+    assert streamer.get_damage(0) is None
+    assert streamer.get_damage(streamer.frame_seq - 1) == [(0, 0, 1, 1)]
+
+    streamer.is_streaming = False
+    streamer._notify_stopped()
+    assert not streamer.wait_for_change(timeout=5)
+
+
+def test_screen_settle_detector() -> None:
+    streamer = Streamer()
+    streamer.is_streaming = True
+    frame = np.zeros((36, 40, 3), "B")
+    detector = ScreenSettleDetector(streamer, quiet_time=0.1, max_wait=1.0)
+    assert ScreenSettleDetector(streamer, quiet_time=0).quiet_time == 0
+    # Settles once the screen stopped changing for the quiet time
+    publishers = [
+        threading.Timer(delay, streamer._publish, (frame, [(0, 0, 1, 1)]))
+        for delay in [0.05, 0.1, 0.15]
+    ]
+    for publisher in publishers:
+        publisher.start()
+    assert 0.25 <= detector.wait() < 0.5
+    assert 0.1 <= detector.wait() < 0.2
+
+    # A moving pointer alone does not keep the screen from settling
+    moving = threading.Event()
+    moving.set()
+
+    def move_pointer() -> None:
+        while moving.is_set():
+            streamer._publish(frame, [(0, 0, 1, 1)], cursor_only=True)
+            threading.Event().wait(0.02)
+
+    pointer = threading.Thread(target=move_pointer)
+    pointer.start()
+    assert 0.1 <= detector.wait() < 0.2
+    moving.clear()
+    pointer.join()
+
+    # Gives up after the max wait while the screen keeps changing
+    def animate() -> None:
+        while streamer.is_streaming:
+            streamer._publish(frame, [(0, 0, 1, 1)])
+            threading.Event().wait(0.02)
+
+    animation = threading.Thread(target=animate)
+    animation.start()
+    assert 1.0 <= detector.wait() < 1.2
+    streamer.is_streaming = False
+    animation.join()
+    assert len(detector.waits) == 4
+
+
+def test_frame_store() -> None:
+    store = FrameStore(size=3)
+    shape = (36, 40, 3)
+    first = store.view(store.acquire(shape))
+    assert not first.flags.writeable
+    with pytest.raises(ValueError):
+        first[0, 0] = 1
+    # Buffers with live views are not handed out again
+    buffer = store.acquire(shape)
+    second = store.view(buffer)
+    assert not np.shares_memory(first, second)
+    # Neither while arrays made from a view are alive
+    region = np.asarray(second[5:10])[:, ::-1]
+    del second
+    assert store.acquire(shape) is not buffer
+    del region
+    assert store.acquire(shape) is buffer
+    held = [store.view(store.acquire(shape)) for _ in range(4)]
+    assert len(store.buffers) == 3
+    views = held + [first]
+    assert not any(
+        np.shares_memory(a, b) for i, a in enumerate(views) for b in views[i + 1 :]
+    )
+
+
+def test_video_as_rgb() -> None:
+    rng = np.random.default_rng(5)
+    rgba = rng.integers(0, 256, (36, 40, 4), dtype="B")
+    for mode in ("rgba", "bgra", "argb", "abgr"):
+        data = rgba[..., ["rgba".index(channel) for channel in mode]]
+        video = Video(None, None, None, "test", 40, 36, mode, data)  # type: ignore
+        out = np.empty((36, 40, 3), "B")
+        assert video.as_rgb(out) is out
+        assert np.array_equal(out, rgba[..., :3])
+        region = video.region_as_rgba(5, 6, 10, 8)
+        assert np.array_equal(region, rgba[6:14, 5:15])
+        assert not np.may_share_memory(region, data)
+
+
+class FakeVNCServer:
+    """Minimal RFB server without authentication that sends Raw updates."""
+
+    def __init__(self, width: int = 40, height: int = 36):
+        self.data = np.zeros((height, width, 4), "B")
+        self.version = 0
+        self.requests: list[tuple[int, int, int, int, int]] = []
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+        self.thread = threading.Thread(target=self.serve, args=(started,))
+        self.thread.start()
+        started.wait()
+
+    def serve(self, started: threading.Event) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.changed = asyncio.Event()
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(self.handle, "127.0.0.1", 0)
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+        started.set()
+        self.loop.run_forever()
+
+    def update(self, data: np.ndarray) -> None:
+        def _update() -> None:
+            self.data = data
+            self.version += 1
+            self.changed.set()
+
+        self.loop.call_soon_threadsafe(_update)
+
+    def close(self) -> None:
+        async def _close() -> None:
+            self.server.close()
+            handlers = asyncio.all_tasks() - {asyncio.current_task()}
+            for handler in handlers:
+                handler.cancel()
+            await asyncio.gather(*handlers, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(_close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        writer.write(b"RFB 003.008\n")
+        await reader.readexactly(12)
+        writer.write(b"\x01\x01")  # no authentication
+        await reader.readexactly(1)
+        writer.write(b"\x00\x00\x00\x00")
+        await reader.readexactly(1)  # shared flag
+        height, width = self.data.shape[:2]
+        writer.write(
+            struct.pack("!HH", width, height)
+            + b"\x20\x18\x00\x01\x00\xff\x00\xff\x00\xff\x00\x08\x10\x00\x00\x00"
+            + struct.pack("!I", 4)
+            + b"fake"
+        )
+        sent_version = -1
+        while True:
+            try:
+                (message,) = await reader.readexactly(1)
+                if message == 0:  # SetPixelFormat
+                    await reader.readexactly(19)
+                elif message == 2:  # SetEncodings
+                    (count,) = struct.unpack("!xH", await reader.readexactly(3))
+                    await reader.readexactly(4 * count)
+                elif message == 3:  # FramebufferUpdateRequest
+                    request = struct.unpack("!BHHHH", await reader.readexactly(9))
+                    self.requests.append(request)
+                    incremental, x, y, width, height = request
+                    while incremental and sent_version == self.version:
+                        self.changed.clear()
+                        await self.changed.wait()
+                    sent_version = self.version
+                    writer.write(
+                        struct.pack("!xxHHHHHi", 1, x, y, width, height, 0)
+                        + self.data[y : y + height, x : x + width].tobytes()
+                    )
+                    await writer.drain()
+            except (
+                asyncio.CancelledError,
+                asyncio.IncompleteReadError,
+                ConnectionError,
+            ):
+                return
+
+
+def test_streamer_pool(monkeypatch: pytest.MonkeyPatch) -> None:
+    def as_rgba(*args, **kwargs) -> None:
+        raise AssertionError("streamers convert frames to RGB only")
+
+    monkeypatch.setattr(Video, "as_rgba", as_rgba)
+    servers = [FakeVNCServer() for _ in range(5)]
+    pool = VNCStreamerPool(workers=2)
+    pool.start()
+    try:
+        streamers = [pool.add("127.0.0.1", server.port, "") for server in servers]
+        assert len({streamer.loop for streamer in streamers}) == 1
+        for index, (server, streamer) in enumerate(zip(servers, streamers)):
+            data = np.full((36, 40, 4), index, "B")
+            data[..., 3] = 255
+            seq = streamer.frame_seq
+            server.update(data)
+            assert streamer.wait_for_change(timeout=5, seq=seq)
+        for index, streamer in enumerate(streamers):
+            frame = streamer.get_current_frame()
+            assert frame is not None and (frame == index).all()
+        pool.remove(streamers[0])
+        assert not streamers[0].is_running() and streamers[1].is_running()
+        streamers[0].stop()  # stopping twice only warns
+    finally:
+        pool.stop()
+        for server in servers:
+            server.close()
+    assert not pool.thread.is_alive()
+    # Stopping after the shared loop was closed neither raises nor blocks
+    streamers[1].stop()
+    assert not streamers[1].is_running()
+
+
+def test_region_capture() -> None:
+    server = FakeVNCServer()
+    data = np.random.default_rng(6).integers(0, 256, (36, 40, 4), dtype="B")
+    data[..., 3] = 255
+    server.update(data)
+
+    async def capture() -> tuple[np.ndarray, np.ndarray]:
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        vnc = await VNCClient.create(reader, writer)
+        region = await vnc.capture_region(5, 6, 10, 8)
+        # Clipped to the screen
+        corner = await vnc.capture_region(30, 30, 20, 20)
+        with pytest.raises(ValueError):
+            await vnc.capture_region(40, 0, 10, 10)
+        await vnc.disconnect()
+        return region, corner
+
+    try:
+        region, corner = asyncio.run(capture())
+    finally:
+        server.close()
+    assert np.array_equal(region, data[6:14, 5:15])
+    assert np.array_equal(corner, data[30:, 30:])
+    assert server.requests == [(0, 5, 6, 10, 8), (0, 30, 30, 10, 6)]
+
+    streamer = Streamer()
+    # The cursor is part of the frames of local streamers
+    assert LocalStreamer(1).get_cursor() == (None, None)
+    frame = FrameStore().view(data[..., :3].copy())
+    streamer._publish(frame, [(0, 0, 40, 36)])
+    view = streamer.get_region(5, 6, 10, 8)
+    assert view is not None and np.shares_memory(view, frame)
+    assert np.array_equal(view, data[6:14, 5:15, :3])
+    # Clipped on all sides, and rejected outside of the screen
+    view = streamer.get_region(-10, 30, 50, 50)
+    assert view is not None and np.array_equal(view, data[30:, :40, :3])
+    with pytest.raises(ValueError):
+        streamer.get_region(-20, 0, 20, 10)
+
+    # The cursor is placed relative to the clipped area
+    streamer = VNCStreamer("127.0.0.1", 0, "")
+    streamer._publish(FrameStore().view(np.zeros((36, 40, 3), "B")), [])
+    image = np.full((2, 2, 4), 255, "B")
+    streamer.get_cursor = lambda: (Cursor(image, 0, 0), (3, 4))  # type: ignore
+    region = streamer.get_region(-5, 2, 10, 10, with_cursor=True)
+    assert region is not None and region.shape == (10, 5, 3)
+    assert region[2:4, 3:5].all() and region.sum() == 2 * 2 * 3 * 255
+
+
+def test_frame_pacer() -> None:
+    pacer = FramePacer(fps=10, idle_fps=1, idle_frames=2)
+    intervals = []
+    for changed in [True, False, False, False, False, False, False, False, True]:
+        delay = pacer.update(changed)
+        assert 0 <= delay <= pacer.current_interval
+        intervals.append(pacer.current_interval)
+        pacer.last_time -= 10  # skip the wait
+    assert intervals == [0.1, 0.1, 0.1, 0.2, 0.4, 0.8, 1.0, 1.0, 0.1]
+
+    # 0 turns the idle backoff and the target rate off
+    pacer = FramePacer(fps=10, idle_fps=0, idle_frames=0)
+    for _ in range(5):
+        pacer.update(False)
+    assert pacer.current_interval == 0.1
+    pacer = FramePacer(fps=0, idle_fps=0)
+    assert pacer.update(False) == 0